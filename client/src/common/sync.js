@@ -0,0 +1,66 @@
+import { apiCall } from "./api"
+
+// Local copies of the signed-in user's listings and detection history, kept
+// current through /users/sync/ so repeat visits only download what changed.
+const STORE_KEY = "sync_store"
+
+const NEWEST_FIRST = {
+  listings: (a, b) => new Date(b.date_posted) - new Date(a.date_posted) || b.id - a.id,
+  detections: (a, b) => new Date(b.detected_at) - new Date(a.detected_at) || b.id - a.id,
+}
+
+const currentUserId = () => {
+  try {
+    return JSON.parse(atob(localStorage.getItem("access_token").split(".")[1])).user_id
+  } catch {
+    return null
+  }
+}
+
+const emptyStore = (userId) => ({ userId, token: null, listings: [], detections: [] })
+
+const loadStore = () => {
+  const userId = currentUserId()
+  try {
+    const store = JSON.parse(localStorage.getItem(STORE_KEY))
+    // Another user's copy (after switching accounts) is never reused.
+    if (store && store.userId === userId) return store
+  } catch {
+    // Unreadable copy; start over with a full sync.
+  }
+  return emptyStore(userId)
+}
+
+const merge = (rows, { changed, deleted }, full) => {
+  const byId = new Map(full ? [] : rows.map((row) => [row.id, row]))
+  deleted.forEach((id) => byId.delete(id))
+  changed.forEach((row) => byId.set(row.id, row))
+  return [...byId.values()]
+}
+
+let inFlight = null
+
+// Returns { listings, detections }, newest first.
+export const syncCollections = () => {
+  // Screens opened together share one request.
+  inFlight ??= (async () => {
+    const store = loadStore()
+    const query = store.token ? `?since=${encodeURIComponent(store.token)}` : ""
+    const { data } = await apiCall(`/users/sync/${query}`)
+
+    const next = { ...store, token: data.token }
+    Object.keys(NEWEST_FIRST).forEach((name) => {
+      next[name] = merge(store[name], data[name], data.full).sort(NEWEST_FIRST[name])
+    })
+    try {
+      localStorage.setItem(STORE_KEY, JSON.stringify(next))
+    } catch {
+      // Storage full: still return the data, the next visit does a full sync.
+      localStorage.removeItem(STORE_KEY)
+    }
+    return next
+  })().finally(() => {
+    inFlight = null
+  })
+  return inFlight
+}
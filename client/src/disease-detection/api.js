@@ -1,4 +1,5 @@
 import { apiCall } from "../common/api"
+import { syncCollections } from "../common/sync"
 
 // Disease Detection API functions
 export const diseaseDetectionAPI = {
@@ -15,7 +16,7 @@ export const diseaseDetectionAPI = {
   },
 
   // Get user's detection history
-  getDetectionHistory: () => apiCall("/disease_detection/detection-history/"),
+  getDetectionHistory: async () => ({ data: (await syncCollections()).detections, status: 200 }),
 
   // Admin endpoint (if needed)
   getAllDetections: () => apiCall("/disease_detection/admin/detections/"),
@@ -1,4 +1,5 @@
 import { apiCall } from "../common/api"
+import { syncCollections } from "../common/sync"
 
 
 // In your marketplace api.js - Add this helper function at the top:
@@ -29,9 +30,30 @@ const processImageUrls = (listing) => {
 // Marketplace API functions
 export const marketplaceAPI = {
   // Get all crop listings (public)
-  getAllListings: (searchquery = "") => {
-    const params = searchquery ? `?searchquery=${encodeURIComponent(searchquery)}` : ""
-    return apiCall(`/marketplace/list/${params}`)
+  // Results come a page at a time; pass the returned `next` cursor to load more.
+  getAllListings: async (searchquery = "", cursor = "") => {
+    const params = new URLSearchParams()
+    if (searchquery) params.set("searchquery", searchquery)
+    if (cursor) params.set("cursor", cursor)
+    const queryString = params.toString()
+    const response = await apiCall(`/marketplace/list/${queryString ? `?${queryString}` : ""}`)
+    const page = response.data || {}
+    const next = page.next ? new URL(page.next).searchParams.get("cursor") : null
+    return { ...response, data: page.results || [], next }
+  },
+
+  // Counts per category, district and rate_band for the filter sidebar.
+  // filters: { category, district, rate_band, searchquery } (comma lists for several values)
+  getListingFacets: (filters = {}) => {
+    const queryString = new URLSearchParams(filters).toString()
+    return apiCall(`/marketplace/facets/${queryString ? `?${queryString}` : ""}`)
+  },
+
+  // Weekly price ranges (count, p25, median, p75) of a crop, newest week first.
+  // filters: { district, category, weeks } (comma lists for several districts or categories)
+  getPriceStats: (crop, filters = {}) => {
+    const queryString = new URLSearchParams({ crop, ...filters }).toString()
+    return apiCall(`/marketplace/prices/?${queryString}`)
   },
 
   // Get single listing
@@ -54,7 +76,7 @@ export const marketplaceAPI = {
   },
 
   // Farmer-only endpoints (require authentication)
-  getMyListings: () => apiCall("/marketplace/listings/my/"),
+  getMyListings: async () => ({ data: (await syncCollections()).listings, status: 200 }),
   getMyProducts: () => apiCall("/marketplace/my-products/"),
 
   createListing: (listingData) => {
@@ -114,11 +136,18 @@ export const marketplaceAPI = {
       }
     })
 
-    // Add images separately if provided
+    // Add images separately if provided. Existing photos ({id, image} from the
+    // listing) are sent as ids in image_order, so only new files are uploaded.
     if (listingData.images && Array.isArray(listingData.images)) {
+      const keepsExisting = listingData.images.some((image) => !(image instanceof File) && image?.id)
+      let newCount = 0
       listingData.images.forEach((image) => {
         if (image instanceof File) {
           formData.append("images", image)
+          if (keepsExisting) formData.append("image_order", `new:${newCount}`)
+          newCount += 1
+        } else if (keepsExisting && image?.id) {
+          formData.append("image_order", String(image.id))
         }
       })
     }
@@ -153,6 +182,44 @@ export const marketplaceAPI = {
     })
   },
 
+  // Upload a listing video in chunks; a failed chunk is retried from the offset the server has
+  uploadListingVideo: async (id, file, onProgress, maxRetries = 3) => {
+    const sha256 = async (data) =>
+      Array.from(new Uint8Array(await crypto.subtle.digest("SHA-256", data)))
+        .map((byte) => byte.toString(16).padStart(2, "0"))
+        .join("")
+
+    const { data: upload } = await apiCall(`/marketplace/listings/${id}/video-uploads/`, {
+      method: "POST",
+      body: JSON.stringify({ filename: file.name, size: file.size }),
+    })
+
+    let offset = upload.offset
+    let failures = 0
+    while (offset < file.size) {
+      const chunk = await file.slice(offset, offset + upload.chunk_size).arrayBuffer()
+      try {
+        const { data } = await apiCall(`/marketplace/video-uploads/${upload.id}/`, {
+          method: "PUT",
+          body: chunk,
+          headers: {
+            "Content-Type": "application/offset+octet-stream",
+            "Upload-Offset": String(offset),
+            "Upload-Checksum": `sha256 ${await sha256(chunk)}`,
+          },
+        })
+        offset = data.offset
+        failures = 0
+      } catch (error) {
+        if (++failures > maxRetries) throw error
+        const { data } = await apiCall(`/marketplace/video-uploads/${upload.id}/`)
+        offset = data.offset
+      }
+      onProgress?.(offset / file.size)
+    }
+    return upload.id
+  },
+
   deleteListing: (id) =>
     apiCall(`/marketplace/listings/${id}/`, {
       method: "DELETE",
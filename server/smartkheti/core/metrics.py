@@ -0,0 +1,96 @@
+"""
+Lightweight in-process metrics registry.
+
+Counters and timings live in the worker process that recorded them, so each
+gunicorn worker reports its own numbers through /api/metrics/.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_SAMPLE_SIZE = 1024
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_ratios = {}
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """Record one timing/size observation (e.g. latency in milliseconds)."""
+    with _lock:
+        stats = _timings.get(name)
+        if stats is None:
+            stats = _timings[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'samples': []}
+        stats['count'] += 1
+        stats['sum'] += value
+        stats['max'] = max(stats['max'], value)
+        # Reservoir sampling keeps percentiles meaningful with bounded memory.
+        if len(stats['samples']) < _SAMPLE_SIZE:
+            stats['samples'].append(value)
+        else:
+            slot = random.randrange(stats['count'])
+            if slot < _SAMPLE_SIZE:
+                stats['samples'][slot] = value
+
+
+@contextmanager
+def timer(name):
+    """Observe the wall-clock duration of the block in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def register_ratio(name, hits, misses):
+    """
+    Report `name` as sum(hits) / (sum(hits) + sum(misses)) in snapshots,
+    where hits and misses are lists of counter names.
+    """
+    _ratios[name] = (list(hits), list(misses))
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        timings = {}
+        for name, stats in _timings.items():
+            samples = sorted(stats['samples'])
+            timings[name] = {
+                'count': stats['count'],
+                'mean': stats['sum'] / stats['count'] if stats['count'] else None,
+                'p50': _percentile(samples, 50),
+                'p95': _percentile(samples, 95),
+                'p99': _percentile(samples, 99),
+                'max': stats['max'],
+            }
+
+    ratios = {}
+    for name, (hits, misses) in _ratios.items():
+        hit_count = sum(counters.get(h, 0) for h in hits)
+        total = hit_count + sum(counters.get(m, 0) for m in misses)
+        ratios[name] = round(hit_count / total, 4) if total else None
+
+    return {'counters': counters, 'timings': timings, 'ratios': ratios}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,156 @@
+"""
+Token-bucket rate limiter shared across worker processes.
+
+Two backends are available:
+
+- ``file``: bucket state in a small file guarded by fcntl.flock, shared by
+  every process on the host (the default when no shared cache is configured).
+- ``cache``: time is split into slots of 1/rate seconds and callers claim
+  slots with atomic increments in the shared Django cache (Redis), so the
+  limit holds across hosts too.
+
+Callers reserve a token and wait for it only if it becomes available within
+their deadline; otherwise acquire() returns False immediately so the caller
+can fall back to cached or approximate data instead of blocking.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache as shared_cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+
+    def __init__(self, name, rate, capacity=1, backend='file', lock_path=None, max_wait=1.0):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = max(int(capacity), 1)
+        self.backend = backend
+        self.lock_path = lock_path
+        self.max_wait = max_wait
+        self._local = threading.local()
+        if backend == 'file' and not lock_path:
+            raise ValueError("The file backend needs a lock_path")
+
+    @contextmanager
+    def patience(self, seconds):
+        """
+        Let calls in this thread queue for up to `seconds` (e.g. background
+        jobs that can afford to wait for a token).
+        """
+        previous = getattr(self._local, 'max_wait', None)
+        self._local.max_wait = seconds
+        try:
+            yield
+        finally:
+            self._local.max_wait = previous
+
+    def default_wait(self):
+        """The max_wait used when none is passed: this thread's patience, else the bucket's."""
+        max_wait = getattr(self._local, 'max_wait', None)
+        return self.max_wait if max_wait is None else max_wait
+
+    def acquire(self, max_wait=None):
+        """
+        Take a token, sleeping until it is due if that is within `max_wait`
+        seconds. Returns False without sleeping if it would take longer.
+        """
+        wait = self._take(max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, max_wait=None):
+        """
+        acquire() for async callers: the reservation (a file lock or cache
+        round trip) runs in a worker thread and the wait on the event loop.
+        """
+        if max_wait is None:
+            max_wait = self.default_wait()
+        wait = await sync_to_async(self._take, thread_sensitive=False)(max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def _take(self, max_wait):
+        """Reserve a token; returns seconds until it is due, or None if rejected."""
+        if max_wait is None:
+            max_wait = self.default_wait()
+
+        try:
+            if self.backend == 'cache':
+                wait = self._reserve_cache(time.time(), max_wait)
+            else:
+                wait = self._reserve_file(time.time(), max_wait)
+        except Exception as e:
+            # Never fail requests because the limiter's storage is unavailable.
+            logger.warning(f"Rate limiter {self.name} unavailable, allowing call: {e}")
+            metrics.incr(f'ratelimit.{self.name}.errors')
+            return 0.0
+
+        if wait is None:
+            metrics.incr(f'ratelimit.{self.name}.rejected')
+            return None
+
+        metrics.incr(f'ratelimit.{self.name}.acquired')
+        if wait > 0:
+            metrics.incr(f'ratelimit.{self.name}.queued')
+            metrics.observe(f'ratelimit.{self.name}.wait_ms', wait * 1000)
+        return wait
+
+    def _reserve_file(self, now, max_wait):
+        """
+        Classic token bucket; tokens may go negative, which queues the caller
+        behind earlier reservations. Returns seconds to wait, or None.
+        """
+        with open(self.lock_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                tokens, updated = json.loads(raw) if raw else (self.capacity, now)
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+                if wait > max_wait:
+                    return None
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps([tokens - 1, now]))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    def _reserve_cache(self, now, max_wait):
+        """
+        Claim the earliest slot (of 1/rate seconds) that still has capacity
+        and starts within max_wait. Returns seconds to wait, or None.
+        """
+        interval = 1 / self.rate
+        first = math.floor(now / interval)
+        last = math.floor((now + max_wait) / interval)
+        ttl = int(max_wait + interval) + 2
+
+        for slot in range(first, last + 1):
+            key = f'ratelimit:{self.name}:{slot}'
+            shared_cache.add(key, 0, ttl)
+            if shared_cache.incr(key) <= self.capacity:
+                return max(slot * interval - now, 0.0)
+        return None
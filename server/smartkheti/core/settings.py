@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -62,9 +63,15 @@ MIDDLEWARE = [
 # CORS CONFIGURATION
 CORS_ALLOW_ALL_ORIGINS = True
 
-# URLS & WSGI
+# URLS & WSGI / ASGI
 ROOT_URLCONF = 'core.urls'
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+# Route the upstream-bound views (weather forecast, saved-location weather,
+# location test, news) to their native async versions. core/asgi.py turns this
+# on; keep it off under WSGI, where each async request would get its own event
+# loop and lose upstream connection pooling.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
 
 # AUTH MODEL
 AUTH_USER_MODEL = 'users.User'
@@ -117,6 +124,145 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# CACHE
+# Set REDIS_URL so workers share geocode/forecast caches; otherwise each
+# process keeps its own local-memory cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# WEATHER SERVICE SETTINGS
+# Geocoded addresses rarely move; misses are retried sooner in case Nominatim improves.
+WEATHER_GEOCODE_CACHE_TTL = timedelta(days=int(os.environ.get('WEATHER_GEOCODE_CACHE_TTL_DAYS', 180)))
+WEATHER_GEOCODE_NEGATIVE_TTL = timedelta(hours=int(os.environ.get('WEATHER_GEOCODE_NEGATIVE_TTL_HOURS', 24)))
+# Bundled provinces/districts/municipalities with centroids, used before Nominatim.
+WEATHER_GAZETTEER_PATH = os.environ.get(
+    'WEATHER_GAZETTEER_PATH', os.path.join(BASE_DIR, 'weather', 'data', 'nepal_gazetteer.json')
+)
+# Points within this distance of a gazetteer centroid are taken to be that place
+# and named offline. Keep it far below municipality size: a point merely near a
+# listed municipality may be in a neighbouring local body.
+WEATHER_GAZETTEER_REVERSE_RADIUS_KM = float(os.environ.get('WEATHER_GAZETTEER_REVERSE_RADIUS_KM', 0.1))
+# Points within this distance of a municipality centroid are named offline as
+# "Near <municipality>"; further out they go to the cache and Nominatim.
+WEATHER_GAZETTEER_APPROXIMATE_RADIUS_KM = float(os.environ.get('WEATHER_GAZETTEER_APPROXIMATE_RADIUS_KM', 3))
+# Reverse lookups are snapped to this grid (degrees; 0.01 is ~1 km) and cached.
+WEATHER_REVERSE_GEOCODE_GRID = float(os.environ.get('WEATHER_REVERSE_GEOCODE_GRID', 0.01))
+WEATHER_REVERSE_GEOCODE_CACHE_SIZE = int(os.environ.get('WEATHER_REVERSE_GEOCODE_CACHE_SIZE', 10000))
+WEATHER_REVERSE_GEOCODE_CACHE_TTL = int(os.environ.get('WEATHER_REVERSE_GEOCODE_CACHE_TTL', 30 * 24 * 3600))  # seconds
+# Forecasts are shared per grid cell (0.1 degrees is roughly Open-Meteo's model resolution).
+WEATHER_FORECAST_GRID = float(os.environ.get('WEATHER_FORECAST_GRID', 0.1))
+WEATHER_FORECAST_CACHE_SIZE = int(os.environ.get('WEATHER_FORECAST_CACHE_SIZE', 5000))
+# Open-Meteo publishes new model runs every few hours; entries stay fresh until the
+# next run boundary plus the delay before it is served, then are served stale
+# (while refreshing in the background) for up to WEATHER_FORECAST_STALE_TTL seconds.
+WEATHER_FORECAST_REFRESH_INTERVAL = int(os.environ.get('WEATHER_FORECAST_REFRESH_INTERVAL', 3 * 3600))
+WEATHER_FORECAST_REFRESH_DELAY = int(os.environ.get('WEATHER_FORECAST_REFRESH_DELAY', 30 * 60))
+WEATHER_FORECAST_STALE_TTL = int(os.environ.get('WEATHER_FORECAST_STALE_TTL', 6 * 3600))
+# Past the stale window, entries are kept this much longer as a last known good
+# forecast, served (marked stale) only when Open-Meteo is failing.
+WEATHER_FORECAST_LAST_GOOD_TTL = int(os.environ.get('WEATHER_FORECAST_LAST_GOOD_TTL', 48 * 3600))
+# Per-call HTTP timeouts (seconds) and the overall budget for a forecast request,
+# whose geocoding and forecast calls run concurrently on a bounded pool.
+WEATHER_GEOCODE_TIMEOUT = float(os.environ.get('WEATHER_GEOCODE_TIMEOUT', 5))
+WEATHER_FORECAST_TIMEOUT = float(os.environ.get('WEATHER_FORECAST_TIMEOUT', 8))
+WEATHER_REQUEST_DEADLINE = float(os.environ.get('WEATHER_REQUEST_DEADLINE', 10))
+WEATHER_UPSTREAM_MAX_WORKERS = int(os.environ.get('WEATHER_UPSTREAM_MAX_WORKERS', 16))
+# How long a request waits for another worker already fetching the same cell.
+WEATHER_FORECAST_COALESCE_WAIT = float(os.environ.get('WEATHER_FORECAST_COALESCE_WAIT', 5))
+
+# OUTBOUND HTTP
+# Per-upstream settings for the shared pooled client in core/upstream.py.
+# Timeouts are (connect, read) seconds. The circuit breaker opens after
+# failure_threshold consecutive failures or responses slower than
+# latency_budget seconds, and probes again after reset_timeout seconds.
+# UPSTREAM_STUB_URL points Nominatim and Open-Meteo at the local replay stub
+# (manage.py upstream_stub) for load tests.
+UPSTREAM_STUB_URL = os.environ.get('UPSTREAM_STUB_URL')
+UPSTREAM_HTTP = {
+    'nominatim': {
+        'base_url': os.environ.get('NOMINATIM_BASE_URL', UPSTREAM_STUB_URL or 'https://nominatim.openstreetmap.org'),
+        'timeout': (3.05, WEATHER_GEOCODE_TIMEOUT),
+        'retries': 1,
+        'pool_size': 10,
+        'headers': {'User-Agent': 'SmartKhetiApp/1.0 (weather-service)'},
+        'failure_threshold': 5,
+        'latency_budget': 3.0,
+        'reset_timeout': 60,
+    },
+    'open_meteo': {
+        'base_url': os.environ.get('OPEN_METEO_BASE_URL', UPSTREAM_STUB_URL or 'https://api.open-meteo.com'),
+        'timeout': (3.05, WEATHER_FORECAST_TIMEOUT),
+        'retries': 2,
+        'pool_size': 20,
+        'failure_threshold': 5,
+        'latency_budget': 4.0,
+        'reset_timeout': 30,
+    },
+    'newsapi': {
+        'base_url': os.environ.get('NEWSAPI_BASE_URL', 'https://newsapi.org'),
+        'timeout': (3.05, 10),
+        'retries': 1,
+        'pool_size': 10,
+        'failure_threshold': 5,
+        'latency_budget': 8.0,
+        'reset_timeout': 60,
+    },
+}
+
+# Shared token bucket for Nominatim (1 request/second policy). Interactive calls
+# wait at most max_wait seconds for a token, then fall back to cached or
+# gazetteer data; background jobs opt into longer waits.
+NOMINATIM_RATE_LIMIT = {
+    'rate': float(os.environ.get('NOMINATIM_RATE_LIMIT', 1)),
+    'capacity': 1,
+    'backend': 'cache' if os.environ.get('REDIS_URL') else 'file',
+    'lock_path': os.environ.get(
+        'NOMINATIM_RATE_LIMIT_FILE', os.path.join(tempfile.gettempdir(), 'smartkheti-nominatim.bucket')
+    ),
+    'max_wait': float(os.environ.get('NOMINATIM_MAX_WAIT', 1.5)),
+}
+
+# MARKETPLACE SETTINGS
+# Listing photos and videos upload to Cloudinary concurrently on a pool of this many threads per process.
+MARKETPLACE_UPLOAD_WORKERS = int(os.environ.get('MARKETPLACE_UPLOAD_WORKERS', 8))
+# Resumable video uploads: chunks of at most MARKETPLACE_VIDEO_CHUNK_SIZE bytes are
+# written to part files in MARKETPLACE_VIDEO_UPLOAD_DIR; unfinished uploads are
+# removed by manage.py cleanup_video_uploads after MARKETPLACE_VIDEO_UPLOAD_EXPIRY.
+MARKETPLACE_VIDEO_MAX_SIZE = int(os.environ.get('MARKETPLACE_VIDEO_MAX_SIZE', 500 * 1024 * 1024))
+MARKETPLACE_VIDEO_CHUNK_SIZE = int(os.environ.get('MARKETPLACE_VIDEO_CHUNK_SIZE', 5 * 1024 * 1024))
+MARKETPLACE_VIDEO_UPLOAD_DIR = os.environ.get(
+    'MARKETPLACE_VIDEO_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'smartkheti-video-uploads')
+)
+MARKETPLACE_VIDEO_UPLOAD_EXPIRY = timedelta(hours=int(os.environ.get('MARKETPLACE_VIDEO_UPLOAD_EXPIRY_HOURS', 24)))
+# Lower edges (NPR) of the rate bands offered as a listing filter; the last band is open-ended.
+MARKETPLACE_RATE_BANDS = [0, 50, 100, 250, 500, 1000]
+# Search radius (km) of ?near= listing queries when none is given, and the largest allowed.
+MARKETPLACE_NEAR_DEFAULT_RADIUS_KM = 25
+MARKETPLACE_NEAR_MAX_RADIUS_KM = 500
+# Facet counts are cached until a listing or category changes, or this many seconds pass.
+MARKETPLACE_FACETS_CACHE_TTL = int(os.environ.get('MARKETPLACE_FACETS_CACHE_TTL', 600))
+# Cached listing list pages and details are invalidated by writes; the TTL only
+# bounds staleness after bulk updates that bypass model signals.
+MARKETPLACE_RESPONSE_CACHE_TTL = int(os.environ.get('MARKETPLACE_RESPONSE_CACHE_TTL', 300))
+
+# SYNC SETTINGS
+# Delta sync (/api/users/sync/) re-sends changes from this long before the client's
+# token, so rows written by transactions that committed late are not missed.
+SYNC_OVERLAP = timedelta(seconds=int(os.environ.get('SYNC_OVERLAP_SECONDS', 120)))
+# Deletions are remembered this long; older tokens get a full resync.
+SYNC_TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30)))
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -0,0 +1,382 @@
+import asyncio
+import importlib
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+import marketplace.async_views
+import marketplace.urls
+import marketplace.views
+import weather.async_views
+import weather.urls
+import weather.views
+from . import upstream
+from .ratelimit import TokenBucket
+from .upstream import CircuitBreaker, CircuitOpenError
+from .views import AsyncAPIView
+
+TEST_UPSTREAMS = {
+    'test': {
+        'base_url': 'https://upstream.test/api/',
+        'timeout': (1, 2),
+        'retries': 2,
+        'pool_size': 4,
+        'headers': {'User-Agent': 'SmartKhetiTest/1.0'},
+        'failure_threshold': 3,
+        'reset_timeout': 30,
+    },
+}
+
+
+def http_response(status=200):
+    response = requests.Response()
+    response.status_code = status
+    return response
+
+
+def async_http_response(status=200, data=None):
+    return httpx.Response(status, json=data or {}, request=httpx.Request('GET', 'https://upstream.test/api/'))
+
+
+@override_settings(UPSTREAM_HTTP=TEST_UPSTREAMS)
+class UpstreamTestCase(SimpleTestCase):
+    """Fresh sessions and breakers per test; backoff sleeps are skipped."""
+
+    def setUp(self):
+        for registry in (upstream._sessions, upstream._breakers):
+            patcher = mock.patch.dict(registry, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('core.upstream.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch_session(self, **kwargs):
+        patcher = mock.patch.object(upstream._session('test'), 'get', **kwargs)
+        session_get = patcher.start()
+        self.addCleanup(patcher.stop)
+        return session_get
+
+
+class PooledClientTests(UpstreamTestCase):
+    def test_one_configured_session_per_upstream(self):
+        session = upstream._session('test')
+        self.assertIs(upstream._session('test'), session)
+        self.assertEqual(session.headers['User-Agent'], 'SmartKhetiTest/1.0')
+        self.assertEqual(session.get_adapter('https://upstream.test/')._pool_maxsize, 4)
+        with self.assertRaises(ValueError):
+            upstream._session('unknown')
+
+    def test_requests_use_the_base_url_and_timeout(self):
+        session_get = self.patch_session(return_value=http_response())
+        upstream.get('test', '/search', params={'q': 'Pokhara'})
+        session_get.assert_called_once_with(
+            'https://upstream.test/api/search', params={'q': 'Pokhara'}, headers=None, timeout=(1, 2),
+        )
+
+    def test_transient_failures_are_retried_with_backoff(self):
+        session_get = self.patch_session(side_effect=[
+            requests.exceptions.ConnectionError, http_response(503), http_response(200),
+        ])
+        self.assertEqual(upstream.get('test', '/search').status_code, 200)
+        self.assertEqual(session_get.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        first, second = (call.args[0] for call in self.sleep.call_args_list)
+        self.assertTrue(0.1 <= first <= 0.2 and 0.2 <= second <= 0.4)
+
+    def test_retries_are_bounded(self):
+        session_get = self.patch_session(return_value=http_response(503))
+        self.assertEqual(upstream.get('test', '/search').status_code, 503)
+        self.assertEqual(session_get.call_count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        session_get = self.patch_session(return_value=http_response(404))
+        self.assertEqual(upstream.get('test', '/search').status_code, 404)
+        self.assertEqual(session_get.call_count, 1)
+
+    def test_deadline_cuts_timeouts_and_stops_retries(self):
+        clock = [100.0]
+
+        def fail(*args, **kwargs):
+            clock[0] += 0.4
+            raise requests.exceptions.ConnectionError
+
+        session_get = self.patch_session(side_effect=fail)
+        with mock.patch('core.upstream.time.monotonic', side_effect=lambda: clock[0]):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                upstream.get('test', '/search', deadline=100.5)
+        self.assertEqual(session_get.call_count, 2)  # no third attempt past the deadline
+        first, second = (call.kwargs['timeout'] for call in session_get.call_args_list)
+        self.assertEqual(first, (0.5, 0.5))
+        self.assertAlmostEqual(second[1], 0.1)
+
+
+class AsyncClientTests(UpstreamTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('core.upstream._backoff', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch_client(self, **kwargs):
+        client = mock.Mock(get=mock.AsyncMock(**kwargs))
+        patcher = mock.patch('core.upstream._async_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client.get
+
+    def test_requests_use_the_base_url_and_timeout(self):
+        client_get = self.patch_client(return_value=async_http_response(data={'name': 'Pokhara'}))
+        response = asyncio.run(upstream.aget('test', '/search', params={'q': 'Pokhara'}))
+        self.assertEqual(response.json(), {'name': 'Pokhara'})
+        client_get.assert_awaited_once_with(
+            'https://upstream.test/api/search', params={'q': 'Pokhara'}, headers=None,
+            timeout=httpx.Timeout(2, connect=1),
+        )
+
+    def test_transport_errors_are_retried_then_raised_as_requests_errors(self):
+        client_get = self.patch_client(side_effect=httpx.ConnectError("refused"))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            asyncio.run(upstream.aget('test', '/search'))
+        self.assertEqual(client_get.await_count, 3)
+
+    def test_server_errors_are_retried(self):
+        client_get = self.patch_client(side_effect=[async_http_response(503), async_http_response(200)])
+        self.assertEqual(asyncio.run(upstream.aget('test', '/search')).status_code, 200)
+        self.assertEqual(client_get.await_count, 2)
+
+    def test_deadline_stops_retries(self):
+        async def slow_failure(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return async_http_response(503)
+
+        client_get = self.patch_client(side_effect=slow_failure)
+        response = asyncio.run(upstream.aget('test', '/search', deadline=time.monotonic() + 0.03))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(client_get.await_count, 1)
+        self.assertLessEqual(client_get.call_args.kwargs['timeout'].read, 0.03)
+
+    def test_open_circuit_fails_fast(self):
+        client_get = self.patch_client()
+        breaker = upstream._breaker('test')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(upstream.aget('test', '/search'))
+        client_get.assert_not_awaited()
+
+
+class RecordThread(BasePermission):
+    def has_permission(self, request, view):
+        view.checked_in = threading.get_ident()
+        return request.user.is_authenticated
+
+
+class EchoView(AsyncAPIView):
+    permission_classes = [RecordThread]
+
+    async def get(self, request):
+        if 'missing' in request.query_params:
+            raise NotFound("No such thing")
+        return Response({
+            'user': request.user.username, 'thread': threading.get_ident(), 'checked_in': self.checked_in,
+        })
+
+
+class AsyncAPIViewTests(SimpleTestCase):
+    def get(self, user=None, **params):
+        request = APIRequestFactory().get('/echo/', params)
+        if user:
+            force_authenticate(request, user)
+        return async_to_sync(EchoView.as_view())(request)
+
+    def test_permissions_in_a_thread_then_the_handler_on_the_loop(self):
+        response = self.get(SimpleNamespace(is_authenticated=True, username='gita'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], 'gita')
+        self.assertEqual(response.data['checked_in'], threading.get_ident())  # sync_to_async's thread
+        self.assertNotEqual(response.data['thread'], threading.get_ident())
+
+    def test_permission_failures_are_handled(self):
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_handler_exceptions_are_handled(self):
+        response = self.get(SimpleNamespace(is_authenticated=True, username='gita'), missing=1)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data, {'detail': 'No such thing'})
+
+
+class AsyncRoutingTests(SimpleTestCase):
+    def views(self, urls, async_views):
+        with override_settings(ASYNC_VIEWS=async_views):
+            importlib.reload(urls)
+        self.addCleanup(importlib.reload, urls)
+        return {pattern.name: getattr(pattern.callback, 'view_class', None) for pattern in urls.urlpatterns}
+
+    def test_async_views_replace_the_upstream_bound_ones(self):
+        routed = self.views(weather.urls, async_views=True)
+        self.assertIs(routed['weather-forecast'], weather.async_views.ForecastView)
+        self.assertIs(routed['test-location'], weather.async_views.LocationTestView)
+        self.assertIs(routed['weather-from-saved'], weather.async_views.WeatherFromSavedLocationView)
+        self.assertIs(routed['weather-from-saved-all'], weather.views.SavedLocationsForecastView)
+        self.assertIs(self.views(marketplace.urls, async_views=True)['nepal_news'],
+                      marketplace.async_views.NepalNewsAPIView)
+
+    def test_sync_views_by_default(self):
+        self.assertIs(self.views(weather.urls, async_views=False)['weather-forecast'], weather.views.ForecastView)
+        self.assertIs(self.views(marketplace.urls, async_views=False)['nepal_news'], marketplace.views.NepalNewsAPIView)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.lock_path = os.path.join(lock_dir.name, 'bucket')
+        cache.clear()
+        # Frozen clock; sleeping is recorded instead of done.
+        patcher = mock.patch('core.ratelimit.time')
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.time.return_value = 1000.0
+
+    def bucket(self, backend='file', **kwargs):
+        options = {'rate': 10, 'capacity': 2, 'max_wait': 0.15, **kwargs}
+        return TokenBucket('test', backend=backend, lock_path=self.lock_path, **options)
+
+    def waits(self):
+        return [round(call.args[0], 3) for call in self.time.sleep.call_args_list]
+
+    def test_burst_then_queue_then_reject(self):
+        bucket = self.bucket()
+        self.assertEqual([bucket.acquire() for _ in range(4)], [True, True, True, False])
+        self.assertEqual(self.waits(), [0.1])  # the fourth would have waited 0.2 s
+
+        self.time.time.return_value = 1000.2  # refilled
+        self.assertTrue(bucket.acquire())
+
+    def test_buckets_share_state_through_the_lock_file(self):
+        first, second = self.bucket(capacity=1), self.bucket(capacity=1)
+        self.assertTrue(first.acquire())
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.acquire(max_wait=0.15))
+        self.assertEqual(self.waits(), [0.1])
+
+    def test_patience_extends_the_wait_for_this_thread(self):
+        bucket = self.bucket(capacity=1)
+        bucket.acquire()
+        bucket.acquire()
+        with bucket.patience(5):
+            self.assertEqual(bucket.default_wait(), 5)
+            self.assertTrue(bucket.acquire())
+        self.assertEqual(bucket.default_wait(), 0.15)
+        self.assertEqual(self.waits(), [0.1, 0.2])
+
+    def test_cache_backend_claims_slots(self):
+        bucket = self.bucket(backend='cache', capacity=1)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [True, True, False])
+        self.assertEqual(self.waits(), [0.1])
+
+    def test_async_acquire_waits_without_blocking(self):
+        bucket = self.bucket(capacity=1)
+        bucket.acquire()
+        with mock.patch('core.ratelimit.asyncio.sleep') as sleep:
+            self.assertTrue(asyncio.run(bucket.aacquire()))
+        sleep.assert_awaited_once()
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.1)
+
+    def test_unavailable_storage_allows_calls(self):
+        bucket = TokenBucket('test', rate=1, lock_path=os.path.join(self.lock_path, 'missing', 'bucket'))
+        self.assertTrue(all(bucket.acquire() for _ in range(3)))
+
+
+class CircuitBreakerTests(UpstreamTestCase):
+    def open_breaker(self):
+        breaker = upstream._breaker('test')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        return breaker
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = upstream._breaker('test')
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()  # resets the count
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.open_breaker()
+        self.assertEqual(upstream.breaker_states()['test'], {'state': CircuitBreaker.OPEN, 'consecutive_failures': 4})
+
+    def test_open_circuit_fails_fast(self):
+        session_get = self.patch_session(side_effect=requests.exceptions.ConnectionError)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            upstream.get('test', '/search')
+        self.assertEqual(session_get.call_count, 3)  # the third failure opens the circuit
+
+        with self.assertRaises(CircuitOpenError):
+            upstream.get('test', '/search')
+        self.assertEqual(session_get.call_count, 3)
+
+    def test_tripping_mid_call_stops_retrying(self):
+        breaker = upstream._breaker('test')
+        breaker.record_failure()
+        breaker.record_failure()
+        session_get = self.patch_session(return_value=http_response(503))
+        self.assertEqual(upstream.get('test', '/search').status_code, 503)
+        self.assertEqual(session_get.call_count, 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.open_breaker()
+        self.assertFalse(breaker.allow())
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # while the probe is running
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.open_breaker()
+        breaker.opened_at -= breaker.reset_timeout
+        session_get = self.patch_session(return_value=http_response(502))
+        self.assertEqual(upstream.get('test', '/search').status_code, 502)
+        self.assertEqual(session_get.call_count, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_probe_frees_the_slot(self):
+        breaker = self.open_breaker()
+        breaker.opened_at -= breaker.reset_timeout
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        client = mock.Mock(get=hang)
+
+        async def probe():
+            with mock.patch('core.upstream._async_client', return_value=client):
+                await asyncio.wait_for(upstream.aget('test', '/search'), timeout=0.01)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(probe())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_unexpected_probe_error_frees_the_slot(self):
+        breaker = self.open_breaker()
+        breaker.opened_at -= breaker.reset_timeout
+        self.patch_session(side_effect=ValueError("bad header"))
+        with self.assertRaises(ValueError):
+            upstream.get('test', '/search')
+        self.assertTrue(breaker.allow())
@@ -0,0 +1,346 @@
+"""
+Shared outbound HTTP client.
+
+Each upstream configured in settings.UPSTREAM_HTTP (Nominatim, Open-Meteo,
+NewsAPI) gets one pooled keep-alive requests.Session, so repeat calls skip
+DNS/TCP/TLS setup. Calls get per-upstream timeouts, bounded retries with
+jittered backoff, a circuit breaker, and latency / connection-reuse metrics.
+
+aget() is the same client for async views: one pooled httpx.AsyncClient per
+upstream and event loop, sharing the circuit breakers and metrics with get().
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+BACKOFF_BASE = 0.2  # seconds
+BACKOFF_CAP = 2.0
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_breakers = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {name: AsyncClient}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures (errors, 5xx
+    responses or responses slower than the latency budget) and fails fast
+    for `reset_timeout` seconds. Then a single probe call is let through
+    (half-open): success closes the circuit, failure re-opens it, and a probe
+    that ends without either (cancelled, or an unexpected error) frees the
+    slot for the next call.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                    metrics.incr(f'upstream.{self.name}.circuit_opened')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _config(name):
+    try:
+        return settings.UPSTREAM_HTTP[name]
+    except KeyError:
+        raise ValueError(f"Unknown upstream '{name}'")
+
+
+def _session(name):
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            config = _config(name)
+            session = requests.Session()
+            # Retries are handled in get() so they can back off with jitter.
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=config.get('pool_size', 10),
+                max_retries=0,
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(config.get('headers', {}))
+            _sessions[name] = session
+    return session
+
+
+def _breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        config = _config(name)
+        with _sessions_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(
+                name,
+                failure_threshold=config.get('failure_threshold', 5),
+                reset_timeout=config.get('reset_timeout', 30),
+            ))
+    return breaker
+
+
+def url_for(name, path):
+    return _config(name)['base_url'].rstrip('/') + path
+
+
+def _backoff(attempt):
+    """Exponential backoff with jitter: half to all of the capped delay."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _retry_delay(attempt, deadline):
+    """Backoff before the next attempt, never past `deadline`."""
+    delay = _backoff(attempt)
+    if deadline is not None:
+        delay = min(delay, max(deadline - time.monotonic(), 0))
+    return delay
+
+
+def _expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _within(timeout, deadline):
+    """`timeout` (seconds or a (connect, read) tuple) cut down to the time left before `deadline`."""
+    if deadline is None:
+        return timeout
+    remaining = max(deadline - time.monotonic(), 0.01)
+    if isinstance(timeout, tuple):
+        return tuple(min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+
+def get(name, path, params=None, headers=None, timeout=None, deadline=None):
+    """
+    GET `path` on upstream `name`. Connection errors, timeouts and 502/503/504
+    responses are retried up to the upstream's `retries` setting; the final
+    failure is raised (or returned, for HTTP errors) just like requests.get.
+    Raises CircuitOpenError without calling out while the circuit is open.
+    With a `deadline` (time.monotonic() based), each attempt's timeout is cut
+    to the time left and no retry is started once it has passed.
+    """
+    config = _config(name)
+    session = _session(name)
+    breaker = _breaker(name)
+    url = url_for(name, path)
+    timeout = timeout if timeout is not None else config.get('timeout', 10)
+    latency_budget = config.get('latency_budget')
+    attempts = 1 + config.get('retries', 0)
+
+    if _expired(deadline):
+        raise requests.exceptions.Timeout(f"Deadline passed before calling {name}")
+    if not breaker.allow():
+        metrics.incr(f'upstream.{name}.short_circuited')
+        raise CircuitOpenError(f"Circuit for {name} is open")
+    probing = breaker.state == CircuitBreaker.HALF_OPEN
+
+    for attempt in range(attempts):
+        # Stop retrying once failures have tripped the breaker.
+        last_attempt = attempt + 1 >= attempts or breaker.state != CircuitBreaker.CLOSED
+        metrics.incr(f'upstream.{name}.requests')
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=_within(timeout, deadline))
+        except requests.exceptions.RequestException as e:
+            metrics.incr(f'upstream.{name}.errors')
+            breaker.record_failure()
+            retryable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            if not retryable or last_attempt or breaker.state != CircuitBreaker.CLOSED or _expired(deadline):
+                raise
+            logger.warning(f"{name} request failed ({e}); retrying")
+        except BaseException:
+            # No verdict on the upstream, but the probe slot must not stay taken.
+            if probing:
+                breaker.release_probe()
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            metrics.observe(f'upstream.{name}.latency_ms', elapsed * 1000)
+            if response.status_code >= 500 or (latency_budget and elapsed > latency_budget):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if (response.status_code not in RETRY_STATUSES or last_attempt
+                    or breaker.state != CircuitBreaker.CLOSED or _expired(deadline)):
+                return response
+            logger.warning(f"{name} returned {response.status_code}; retrying")
+
+        metrics.incr(f'upstream.{name}.retries')
+        time.sleep(_retry_delay(attempt, deadline))
+
+
+def _async_client(name):
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        config = _config(name)
+        pool_size = config.get('pool_size', 10)
+        client = clients[name] = httpx.AsyncClient(
+            headers=config.get('headers', {}),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+    return client
+
+
+def _httpx_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+async def aget(name, path, params=None, headers=None, timeout=None, deadline=None):
+    """
+    Async get(), with the same retries and `deadline`. Transport errors are
+    raised as the matching requests exceptions so callers can handle both
+    clients the same way; the response is an httpx.Response.
+    """
+    config = _config(name)
+    client = _async_client(name)
+    breaker = _breaker(name)
+    url = url_for(name, path)
+    timeout = timeout if timeout is not None else config.get('timeout', 10)
+    latency_budget = config.get('latency_budget')
+    attempts = 1 + config.get('retries', 0)
+
+    if _expired(deadline):
+        raise requests.exceptions.Timeout(f"Deadline passed before calling {name}")
+    if not breaker.allow():
+        metrics.incr(f'upstream.{name}.short_circuited')
+        raise CircuitOpenError(f"Circuit for {name} is open")
+    probing = breaker.state == CircuitBreaker.HALF_OPEN
+
+    for attempt in range(attempts):
+        last_attempt = attempt + 1 >= attempts or breaker.state != CircuitBreaker.CLOSED
+        metrics.incr(f'upstream.{name}.requests')
+        start = time.perf_counter()
+        try:
+            response = await client.get(
+                url, params=params, headers=headers, timeout=_httpx_timeout(_within(timeout, deadline)),
+            )
+        except httpx.HTTPError as e:
+            metrics.incr(f'upstream.{name}.errors')
+            breaker.record_failure()
+            retryable = isinstance(e, httpx.TransportError)
+            if not retryable or last_attempt or breaker.state != CircuitBreaker.CLOSED or _expired(deadline):
+                if isinstance(e, httpx.TimeoutException):
+                    raise requests.exceptions.Timeout(str(e)) from e
+                raise requests.exceptions.ConnectionError(str(e)) from e
+            logger.warning(f"{name} request failed ({e}); retrying")
+        except BaseException:
+            # Cancelled (e.g. at a request deadline): no verdict on the
+            # upstream, but the probe slot must not stay taken.
+            if probing:
+                breaker.release_probe()
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            metrics.observe(f'upstream.{name}.latency_ms', elapsed * 1000)
+            if response.status_code >= 500 or (latency_budget and elapsed > latency_budget):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if (response.status_code not in RETRY_STATUSES or last_attempt
+                    or breaker.state != CircuitBreaker.CLOSED or _expired(deadline)):
+                return response
+            logger.warning(f"{name} returned {response.status_code}; retrying")
+
+        metrics.incr(f'upstream.{name}.retries')
+        await asyncio.sleep(_retry_delay(attempt, deadline))
+
+
+def pool_stats():
+    """
+    Connections opened vs requests sent per upstream; the difference is the
+    number of requests that reused a kept-alive connection.
+    """
+    stats = {}
+    for name, session in list(_sessions.items()):
+        opened = sent = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                sent += pool.num_requests
+        stats[name] = {
+            'connections_opened': opened,
+            'requests': sent,
+            'reused': max(sent - opened, 0),
+        }
+    return stats
+
+
+def breaker_states():
+    return {
+        name: {'state': breaker.state, 'consecutive_failures': breaker.failures}
+        for name, breaker in list(_breakers.items())
+    }
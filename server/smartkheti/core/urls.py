@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from users.views import home
+from .views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +13,7 @@ urlpatterns = [
     path('api/weather/', include('weather.urls')),
     path('api/marketplace/', include('marketplace.urls')),
     path('api/reports/', include('reports.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
 if settings.DEBUG:
 
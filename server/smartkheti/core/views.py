@@ -0,0 +1,52 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+
+from . import metrics, upstream
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, for views that mostly wait on
+    remote HTTP. Authentication, permissions and throttling run as usual
+    (in a worker thread, since they may hit the database); the handler then
+    runs on the event loop. Only useful under ASGI; see settings.ASYNC_VIEWS.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if iscoroutinefunction(handler):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class MetricsView(APIView):
+    """
+    Cache hit ratios, upstream call counts and latencies for this worker process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        data = metrics.snapshot()
+        data['upstream_pools'] = upstream.pool_stats()
+        data['upstream_circuits'] = upstream.breaker_states()
+        return Response(data)
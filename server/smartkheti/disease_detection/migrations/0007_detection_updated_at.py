@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('disease_detection', '0006_alter_diseaseinfo_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='detectionrecord',
+            index=models.Index(fields=['user', 'updated_at'], name='detection_user_updated_idx'),
+        ),
+    ]
@@ -31,6 +31,13 @@ class DetectionRecord(models.Model):
     image = models.ImageField(upload_to='detections/')
     detected_disease = models.CharField(max_length=100)
     detected_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # A user's records changed since a sync token.
+            models.Index(fields=['user', 'updated_at'], name='detection_user_updated_idx'),
+        ]
 
 
 
@@ -0,0 +1,56 @@
+"""
+Async version of the news view, routed instead of views.NepalNewsAPIView
+when settings.ASYNC_VIEWS is on (ASGI deployments). The NewsAPI queries run
+concurrently on the event loop instead of one after another in a thread.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from core import upstream
+from . import views
+
+logger = logging.getLogger(__name__)
+
+
+class NepalNewsAPIView(views.NepalNewsAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            return self.news_response(await self.afetch_all_articles())
+        except Exception as e:
+            return self.failure_response(e)
+
+    async def afetch_all_articles(self):
+        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+        batches = await asyncio.gather(
+            self.afetch_country_headlines(),
+            *[self.afetch_query_articles(query, week_ago) for query in self.search_queries[:5]],
+        )
+        return [article for batch in batches for article in batch]
+
+    async def afetch_country_headlines(self):
+        try:
+            response = await upstream.aget('newsapi', '/v2/top-headlines', params=self.headlines_params())
+            return self.headlines_from(response.json())
+        except Exception as e:
+            logger.warning(f"Failed to fetch Nepal country headlines: {e}")
+        return []
+
+    async def afetch_query_articles(self, query, from_date):
+        try:
+            response = await upstream.aget('newsapi', '/v2/everything', params=self.query_params(query, from_date))
+            return self.query_articles_from(query, response.json())
+        except Exception as e:
+            logger.warning(f"Failed to fetch for query: {query} - {e}")
+        return []
+
+    # Every handler must be async for Django to run the view as async.
+    async def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return super().delete(request, *args, **kwargs)
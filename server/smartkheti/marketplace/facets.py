@@ -0,0 +1,159 @@
+"""
+Structured listing filters (category, district, rate band) and the facet
+counts shown beside them.
+
+Counts come from one grouped query over (category, district, rate band),
+cached until a listing or category changes. Each facet's counts apply the
+other facets' selections but not its own, so a buyer sees how many listings
+each additional option would add.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from core import metrics
+from weather.gazetteer import get_gazetteer
+from .models import CropListing
+
+FACETS_CACHE_KEY = 'marketplace.facets'
+FACETS = ('category', 'district', 'rate_band')
+
+metrics.register_ratio(
+    'marketplace.facets.hit_ratio',
+    hits=['marketplace.facets.hit'],
+    misses=['marketplace.facets.miss'],
+)
+
+
+def rate_bands():
+    """(key, low, high) per band in MARKETPLACE_RATE_BANDS; high is None for the last band."""
+    edges = list(settings.MARKETPLACE_RATE_BANDS)
+    return [
+        (f"{low}-{high}" if high is not None else f"{low}+", low, high)
+        for low, high in zip(edges, edges[1:] + [None])
+    ]
+
+
+def rate_band_expression():
+    bands = rate_bands()
+    return Case(
+        *[When(rate__lt=high, then=Value(key)) for key, _low, high in bands if high is not None],
+        default=Value(bands[-1][0]),
+        output_field=CharField(),
+    )
+
+
+def _values(raw):
+    return [value.strip() for value in raw.split(',') if value.strip()]
+
+
+def parse_filters(params):
+    """
+    Selected values per facet from e.g. ?category=Vegetables&district=Chitwan,Kaski
+    &rate_band=100-250 (OR within a facet, AND across facets). Districts are
+    matched against the gazetteer, so "chitwan" selects "Chitwan". Raises
+    ValueError for unknown districts or rate bands.
+    """
+    selection = {}
+    if params.get('category'):
+        selection['category'] = set(_values(params['category']))
+
+    if params.get('district'):
+        districts = set()
+        for name in _values(params['district']):
+            place = get_gazetteer().match_district(name)
+            if place is None:
+                raise ValueError(f"Unknown district: {name}")
+            districts.add(place.name)
+        selection['district'] = districts
+
+    if params.get('rate_band'):
+        keys = {key for key, _low, _high in rate_bands()}
+        bands = set(_values(params['rate_band']))
+        unknown = bands - keys
+        if unknown:
+            raise ValueError(f"Unknown rate_band: {', '.join(sorted(unknown))}. Choose from: {', '.join(keys)}")
+        selection['rate_band'] = bands
+
+    return {facet: values for facet, values in selection.items() if values}
+
+
+def filter_listings(queryset, selection):
+    if 'category' in selection:
+        queryset = queryset.filter(category__name__in=selection['category'])
+    if 'district' in selection:
+        queryset = queryset.filter(district__in=selection['district'])
+    if 'rate_band' in selection:
+        in_bands = Q()
+        for key, low, high in rate_bands():
+            if key in selection['rate_band']:
+                in_bands |= Q(rate__gte=low, rate__lt=high) if high is not None else Q(rate__gte=low)
+        queryset = queryset.filter(in_bands)
+    return queryset
+
+
+def grouped_counts(queryset):
+    """[(category name, district, rate band, count)] in one GROUP BY query."""
+    rows = (
+        queryset.annotate(rate_band=rate_band_expression())
+        .values('category__name', 'district', 'rate_band')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return [(row['category__name'], row['district'], row['rate_band'], row['count']) for row in rows]
+
+
+def facet_rows():
+    """grouped_counts() over every listing, cached until the next listing write."""
+    rows = cache.get(FACETS_CACHE_KEY)
+    if rows is not None:
+        metrics.incr('marketplace.facets.hit')
+        return rows
+    metrics.incr('marketplace.facets.miss')
+    rows = grouped_counts(CropListing.objects.all())
+    cache.set(FACETS_CACHE_KEY, rows, settings.MARKETPLACE_FACETS_CACHE_TTL)
+    return rows
+
+
+def invalidate_facets(**kwargs):
+    cache.delete(FACETS_CACHE_KEY)
+
+
+def facet_counts(selection, rows=None):
+    """
+    Counts per facet value for the current selection, plus the number of
+    listings matching all of it. Pass `rows` (from grouped_counts) to count
+    within e.g. search results instead of the cached full table.
+    """
+    if rows is None:
+        rows = facet_rows()
+
+    counts = {facet: defaultdict(int) for facet in FACETS}
+    total = 0
+    for category, district, band, count in rows:
+        values = {'category': category, 'district': district, 'rate_band': band}
+        unmatched = [facet for facet, selected in selection.items() if values[facet] not in selected]
+        if not unmatched:
+            total += count
+        for facet in FACETS:
+            if not unmatched or unmatched == [facet]:
+                counts[facet][values[facet]] += count
+
+    def by_count(facet):
+        return [
+            {'name': name, 'count': count}
+            for name, count in sorted(counts[facet].items(), key=lambda item: (-item[1], item[0]))
+            if name  # uncategorised listings and unrecognised locations get no facet entry
+        ]
+
+    return {
+        'total': total,
+        'category': by_count('category'),
+        'district': by_count('district'),
+        'rate_band': [
+            {'key': key, 'min': low, 'max': high, 'count': counts['rate_band'].get(key, 0)}
+            for key, low, high in rate_bands()
+        ],
+    }
@@ -0,0 +1,101 @@
+"""
+"Near me" listing queries: ?near=<lat>,<lon>&radius=<km>.
+
+Listings store the coordinates of the municipality or district their location
+names. A query first narrows to the bounding box of the circle, a range scan
+on listing_lat_lon_idx that reads only (id, latitude, longitude), then
+computes exact haversine distances for the candidates in one numpy pass,
+drops the box corners and sorts nearest first. Only the page that is
+returned loads full listing rows.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+
+from core import metrics
+from weather.gazetteer import EARTH_RADIUS_KM
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+# Nearest-first pages start with a box this wide and widen it only while it
+# holds too few listings, so dense areas never scan the whole radius.
+INITIAL_SEARCH_KM = 10
+
+
+def parse_near(params):
+    """
+    (lat, lon, radius_km) from ?near=27.7,85.3&radius=25, or None without
+    `near`. Raises ValueError for malformed or out-of-range values.
+    """
+    raw = params.get('near')
+    if not raw:
+        return None
+    try:
+        lat, lon = (float(value) for value in raw.split(','))
+    except ValueError:
+        raise ValueError("near must be <latitude>,<longitude>")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("near is not a valid coordinate")
+
+    max_km = settings.MARKETPLACE_NEAR_MAX_RADIUS_KM
+    try:
+        radius = float(params.get('radius') or settings.MARKETPLACE_NEAR_DEFAULT_RADIUS_KM)
+    except ValueError:
+        raise ValueError("radius must be a number of kilometres")
+    if not 0 < radius <= max_km:
+        raise ValueError(f"radius must be between 0 and {max_km} km")
+    return lat, lon, radius
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    # Degrees of longitude shrink towards the poles; clamp to avoid dividing by ~0.
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return max(lat - dlat, -90), min(lat + dlat, 90), lon - dlon, lon + dlon
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distances from (lat, lon) to each of the arrays' points."""
+    phi1, phi2 = np.radians(lat), np.radians(lats)
+    dlmb = np.radians(lons - lon)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def within(queryset, lat, lon, radius_km):
+    """
+    [(pk, distance_km)] of listings in `queryset` within radius_km, nearest
+    first; equally distant listings (same municipality) newest first.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    rows = list(
+        queryset.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+        .order_by()
+        .values_list('id', 'latitude', 'longitude')
+    )
+    metrics.observe('marketplace.near.candidates', len(rows))
+    if not rows:
+        return []
+
+    points = np.array(rows, dtype=np.float64)
+    ids = points[:, 0].astype(np.int64)
+    distances = haversine_km(lat, lon, points[:, 1], points[:, 2])
+    inside = distances <= radius_km
+    ids, distances = ids[inside], distances[inside]
+    order = np.lexsort((-ids, distances))
+    return list(zip(ids[order].tolist(), distances[order].tolist()))
+
+
+def nearest(queryset, lat, lon, radius_km, limit):
+    """
+    The `limit` nearest listings within radius_km as [(pk, distance_km)].
+    Everything inside a searched circle is found, so once it holds `limit`
+    listings no listing outside it can be nearer.
+    """
+    search_km = min(radius_km, INITIAL_SEARCH_KM)
+    while True:
+        found = within(queryset, lat, lon, search_km)
+        if len(found) >= limit or search_km >= radius_km:
+            return found[:limit]
+        search_km = min(radius_km, search_km * 4)
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from marketplace.models import VideoUpload
+from marketplace.video_uploads import discard_upload, finish_upload
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove resumable video uploads (and their part files) that stopped receiving data more "
+        "than MARKETPLACE_VIDEO_UPLOAD_EXPIRY ago, and store uploads left in processing by a "
+        "worker that stopped. Run periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stuck-after', type=int, default=30,
+            help=(
+                "Minutes without a heartbeat from the worker storing an upload after which another "
+                "worker takes it over (default: 30)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = VideoUpload.objects.filter(
+            status__in=[VideoUpload.UPLOADING, VideoUpload.FAILED],
+            updated_at__lt=now - settings.MARKETPLACE_VIDEO_UPLOAD_EXPIRY,
+        )
+        removed = 0
+        for upload in expired:
+            discard_upload(upload)
+            removed += 1
+
+        finished = failed = 0
+        stale_before = now - timedelta(minutes=options['stuck_after'])
+        stuck = VideoUpload.objects.filter(status=VideoUpload.PROCESSING, updated_at__lt=stale_before)
+        for upload in stuck:
+            try:
+                if finish_upload(upload.pk, stale_before=stale_before):
+                    finished += 1
+            except Exception as e:
+                self.stderr.write(f"Could not store upload {upload.pk}: {e}")
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} expired uploads; stored {finished} stuck uploads, {failed} failed"
+        ))
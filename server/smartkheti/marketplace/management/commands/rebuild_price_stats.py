@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.prices import rebuild_price_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the weekly crop price statistics from all listings. Listing saves and deletes "
+        "keep them current; run this after bulk imports or updates that bypass model signals."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        groups = rebuild_price_stats()
+        self.stdout.write(f"Rebuilt {groups} price groups in {time.perf_counter() - start:.1f}s.")
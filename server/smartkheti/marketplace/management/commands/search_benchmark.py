@@ -0,0 +1,121 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from marketplace.models import CropListing
+from marketplace.search import search_listings
+from weather.management.commands.loadtest import percentile
+
+SYNTHETIC_PHONE = '+9779841999999'
+CROPS = [
+    'Tomato', 'Potato', 'Onion', 'Cauliflower', 'Cabbage', 'Rice', 'Maize', 'Wheat', 'Millet',
+    'Ginger', 'Garlic', 'Cardamom', 'Orange', 'Apple', 'Banana', 'Mustard', 'Lentil', 'Soybean',
+    'Chilli', 'Pumpkin', 'Cucumber', 'Radish', 'Spinach', 'Coffee', 'Tea',
+]
+PLACES = [
+    'Kathmandu', 'Lalitpur', 'Bhaktapur', 'Chitwan', 'Pokhara', 'Dhading', 'Ilam', 'Jhapa',
+    'Kavre', 'Nuwakot', 'Morang', 'Sunsari', 'Rupandehi', 'Banke', 'Kailali', 'Surkhet',
+]
+WORDS = [
+    'fresh', 'organic', 'local', 'harvested', 'this', 'week', 'bulk', 'available', 'quality',
+    'grade', 'dried', 'sorted', 'packed', 'delivery', 'possible', 'farm', 'price', 'negotiable',
+]
+DEFAULT_QUERIES = 'tomato,organic potato,chitwan,cardam,ginger ilam,tomatto'
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the listing table with synthetic rows and compare the old icontains search with the "
+        "indexed ranked search (first page of 20). Use a development or staging database: the "
+        "synthetic listings belong to a dedicated user and are deleted afterwards unless --keep."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=100_000,
+            help="Synthetic listings to create (default: 100000).",
+        )
+        parser.add_argument(
+            '--queries', default=DEFAULT_QUERIES,
+            help=f"Comma-separated search queries (default: {DEFAULT_QUERIES}).",
+        )
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query (default: 20).")
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic listings.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        farmer, _created = get_user_model().objects.get_or_create(
+            phone=SYNTHETIC_PHONE, defaults={'first_name': 'Benchmark', 'last_name': 'Farmer'},
+        )
+        existing = CropListing.objects.filter(farmer=farmer).count()
+        if existing < options['rows']:
+            self.stdout.write(f"Creating {options['rows'] - existing} synthetic listings...")
+            self.create_listings(farmer, options['rows'] - existing)
+
+        self.stdout.write(
+            f"{CropListing.objects.count()} listings on {connection.vendor}; "
+            f"{options['repeat']} runs per query, times in ms"
+        )
+        self.stdout.write(
+            f"{'query':<16} {'matches':>8} {'old p50':>8} {'old p95':>8} "
+            f"{'new p50':>8} {'new p95':>8} {'speedup':>8}"
+        )
+        try:
+            for query in options['queries'].split(','):
+                self.compare(query.strip(), options['repeat'])
+        finally:
+            if not options['keep']:
+                CropListing.objects.filter(farmer=farmer).delete()
+                farmer.delete()
+
+    def create_listings(self, farmer, count, batch_size=5000):
+        rng = random.Random(41)
+        with transaction.atomic():
+            for start in range(0, count, batch_size):
+                CropListing.objects.bulk_create([
+                    CropListing(
+                        farmer=farmer,
+                        crop_name=f"{rng.choice(WORDS[:4]).title()} {rng.choice(CROPS)}",
+                        quantity=f"{rng.randint(1, 500)} kg",
+                        rate=rng.randint(20, 2000),
+                        location=rng.choice(PLACES),
+                        contact_number=SYNTHETIC_PHONE,
+                        description=' '.join(rng.choices(WORDS + CROPS, k=rng.randint(5, 25))),
+                    )
+                    for _ in range(min(batch_size, count - start))
+                ])
+
+    def compare(self, query, repeat):
+        def old():
+            return CropListing.objects.filter(
+                Q(crop_name__icontains=query) |
+                Q(location__icontains=query) |
+                Q(description__icontains=query)
+            ).order_by('-date_posted', '-id')
+
+        def new():
+            return search_listings(CropListing.objects.all(), query)
+
+        old_times = self.time_first_page(old, repeat)
+        new_times = self.time_first_page(new, repeat)
+        matches = new().count()
+        old_p50, new_p50 = percentile(old_times, 50), percentile(new_times, 50)
+        self.stdout.write(
+            f"{query:<16} {matches:>8} {old_p50:>8.1f} {percentile(old_times, 95):>8.1f} "
+            f"{new_p50:>8.1f} {percentile(new_times, 95):>8.1f} "
+            f"{old_p50 / new_p50 if new_p50 else 0:>7.1f}x"
+        )
+        if self.verbosity > 1:
+            self.stdout.write(new().explain())
+
+    def time_first_page(self, queryset_factory, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset_factory()[:20])
+            times.append((time.perf_counter() - start) * 1000)
+        return sorted(times)
@@ -0,0 +1,104 @@
+import random
+import time
+from unittest import mock
+
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from marketplace.models import Category, CropImage, CropListing
+from marketplace.renderers import FastJSONRenderer
+from marketplace.serializers import CropListingReadSerializer, listing_rows
+from marketplace.views import listings_for_read
+from weather.management.commands.loadtest import percentile
+
+from .search_benchmark import CROPS, PLACES, WORDS
+
+SYNTHETIC_PHONE = '+9779841999998'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing and rendering listing list pages with CropListingReadSerializer and "
+        "JSONRenderer (before) against listing_rows and FastJSONRenderer (after), per 1,000 "
+        "listings. Use a development or staging database: the synthetic listings belong to a "
+        "dedicated user and are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000, help="Listings to serialize (default: 1000).")
+        parser.add_argument('--images', type=int, default=3, help="Photos per listing (default: 3).")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per variant (default: 20).")
+        parser.add_argument(
+            '--cloudinary', action='store_true',
+            help="Build photo URLs with Cloudinary storage, as in production (URLs are built offline).",
+        )
+
+    def handle(self, *args, **options):
+        farmer, _created = get_user_model().objects.get_or_create(
+            phone=SYNTHETIC_PHONE, defaults={'first_name': 'Benchmark', 'last_name': 'Farmer'},
+        )
+        try:
+            self.create_listings(farmer, options['listings'], options['images'])
+            listings = list(listings_for_read().filter(farmer=farmer).order_by('-date_posted', '-id'))
+            request = APIRequestFactory().get('/api/marketplace/list/')
+
+            def before():
+                data = CropListingReadSerializer(listings, many=True, context={'request': request}).data
+                return data, JSONRenderer().render(data)
+
+            def after():
+                data = listing_rows(listings, request)
+                return data, FastJSONRenderer().render(data)
+
+            image_field = CropImage._meta.get_field('image')
+            storage = MediaCloudinaryStorage() if options['cloudinary'] else image_field.storage
+            with mock.patch.object(image_field, 'storage', storage):
+                if before()[1] != after()[1]:
+                    self.stderr.write(self.style.WARNING("Rendered output differs between the two paths."))
+                self.report(len(listings), options['repeat'], before, after)
+        finally:
+            CropListing.objects.filter(farmer=farmer).delete()
+            farmer.delete()
+
+    def create_listings(self, farmer, count, images):
+        rng = random.Random(48)
+        category, _created = Category.objects.get_or_create(name='Vegetables')
+        with transaction.atomic():
+            listings = CropListing.objects.bulk_create([
+                CropListing(
+                    farmer=farmer,
+                    crop_name=f"{rng.choice(WORDS[:4]).title()} {rng.choice(CROPS)}",
+                    category=category,
+                    quantity=f"{rng.randint(1, 500)} kg",
+                    rate=rng.randint(20, 2000),
+                    location=rng.choice(PLACES),
+                    contact_number=SYNTHETIC_PHONE,
+                    description=' '.join(rng.choices(WORDS + CROPS, k=rng.randint(5, 25))),
+                    video=f'marketplace/crop_videos/clip_{i}' if i % 2 else None,
+                )
+                for i in range(count)
+            ])
+            CropImage.objects.bulk_create([
+                CropImage(listing=listing, image=f'marketplace/crop_images/photo_{listing.pk}_{n}', position=n)
+                for listing in listings
+                for n in range(images)
+            ])
+
+    def report(self, count, repeat, before, after):
+        self.stdout.write(f"{count} listings, {repeat} runs each; ms per 1,000 listings (serialize + render)")
+        self.stdout.write(f"{'variant':<8} {'p50':>8} {'p95':>8}")
+        results = {}
+        for label, run in (('before', before), ('after', after)):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                times.append((time.perf_counter() - start) * 1000 * 1000 / count)
+            times.sort()
+            results[label] = percentile(times, 50)
+            self.stdout.write(f"{label:<8} {results[label]:>8.1f} {percentile(times, 95):>8.1f}")
+        self.stdout.write(f"speedup  {results['before'] / results['after']:>7.1f}x")
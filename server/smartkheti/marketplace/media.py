@@ -0,0 +1,79 @@
+"""
+Concurrent uploads of listing photos and videos to their storage (Cloudinary).
+
+A listing's files are uploaded side by side on a bounded, process-wide pool,
+so creating a listing waits on the slowest file rather than the sum of all
+of them. Callers write the database rows afterwards and hand the stored
+names back to delete_uploaded() if that fails, so no upload is orphaned.
+Files of photos removed from a listing are deleted in the background.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import transaction
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.MARKETPLACE_UPLOAD_WORKERS,
+    thread_name_prefix='marketplace-upload',
+)
+
+
+def content_hash(file):
+    """SHA-256 hex digest of an uploaded file, leaving it rewound for upload."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _upload(field, instance, file):
+    with metrics.timer(f'marketplace.upload.{field.name}_ms'):
+        name = field.generate_filename(instance, file.name)
+        return field.storage.save(name, file, max_length=field.max_length)
+
+
+def upload_all(jobs):
+    """
+    Upload each (model_field, instance, file) in `jobs` concurrently and
+    return the stored names in the same order. If any upload fails, the ones
+    that succeeded are deleted and the first error is raised.
+    """
+    futures = [_executor.submit(_upload, field, instance, file) for field, instance, file in jobs]
+    wait(futures)
+
+    stored, error = [], None
+    for (field, _instance, file), future in zip(jobs, futures):
+        try:
+            stored.append((field, future.result()))
+        except Exception as e:
+            logger.error(f"Upload of {file.name} failed: {e}")
+            metrics.incr('marketplace.upload.errors')
+            error = error or e
+    if error is not None:
+        delete_uploaded(stored)
+        raise error
+    return [name for _field, name in stored]
+
+
+def delete_uploaded(stored):
+    """Best-effort removal of stored (model_field, name) files."""
+    for field, name in stored:
+        try:
+            field.storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Could not delete stored file {name}: {e}")
+        else:
+            metrics.incr('marketplace.upload.deleted')
+
+
+def delete_stored_later(stored):
+    """Delete (model_field, name) files in the background once the current transaction commits."""
+    if stored:
+        transaction.on_commit(lambda: _executor.submit(delete_uploaded, stored))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0005_alter_croplisting_video'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['-date_posted', '-id'], name='listing_posted_id_idx'),
+        ),
+    ]
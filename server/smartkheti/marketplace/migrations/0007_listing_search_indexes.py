@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Same expression as marketplace.search.PG_VECTOR_SQL (unqualified); the
+# search query only uses this index while the two match.
+VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(crop_name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS listing_search_vector_idx ON marketplace_croplisting USING gin (({VECTOR_SQL}))",
+    "CREATE INDEX IF NOT EXISTS listing_crop_name_trgm_idx ON marketplace_croplisting USING gin (crop_name gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS listing_search_vector_idx",
+    "DROP INDEX IF EXISTS listing_crop_name_trgm_idx",
+]
+
+
+def run_on_postgres(statements):
+    # SQLite gets its FTS5 table from a post_migrate hook instead (see marketplace.search).
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_listing_posted_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(CREATE_SQL), run_on_postgres(DROP_SQL)),
+    ]
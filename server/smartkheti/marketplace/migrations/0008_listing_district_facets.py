@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_district(apps, schema_editor):
+    from marketplace.models import district_for_location
+
+    CropListing = apps.get_model('marketplace', 'CropListing')
+    listings = list(CropListing.objects.only('id', 'location'))
+    for listing in listings:
+        listing.district = district_for_location(listing.location)
+    CropListing.objects.bulk_update(listings, ['district'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_listing_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='croplisting',
+            name='district',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_district, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['category', '-date_posted', '-id'], name='listing_category_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['district', '-date_posted', '-id'], name='listing_district_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['category', 'district', 'rate'], name='listing_facet_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0008_listing_district_facets'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cropimage',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cropimage',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
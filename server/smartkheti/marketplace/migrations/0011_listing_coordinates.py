@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_place(apps, schema_editor):
+    from marketplace.models import place_for_location
+    from weather.gazetteer import LEVEL_MUNICIPALITY
+
+    CropListing = apps.get_model('marketplace', 'CropListing')
+    listings = list(CropListing.objects.only('id', 'location'))
+    for listing in listings:
+        place = place_for_location(listing.location)
+        listing.district = place.district if place else ''
+        listing.municipality = place.name if place and place.level == LEVEL_MUNICIPALITY else ''
+        listing.latitude = place.lat if place else None
+        listing.longitude = place.lon if place else None
+    CropListing.objects.bulk_update(
+        listings, ['district', 'municipality', 'latitude', 'longitude'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0010_video_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='croplisting',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croplisting',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croplisting',
+            name='municipality',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_place, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['latitude', 'longitude'], name='listing_lat_lon_idx'),
+        ),
+    ]
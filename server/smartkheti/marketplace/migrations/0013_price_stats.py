@@ -0,0 +1,102 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:49
+
+import math
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of marketplace.models.crop_key and the marketplace.prices
+# helpers as of this migration, so later changes to the app cannot alter it.
+
+def crop_key(crop_name):
+    return ' '.join(str(crop_name or '').lower().split())
+
+
+def week_of(moment):
+    day = timezone.localtime(moment).date()
+    return day - timedelta(days=day.weekday())
+
+
+def percentile(rates, pct):
+    position = Decimal(len(rates) - 1) * pct / 100
+    low = math.floor(position)
+    high = min(low + 1, len(rates) - 1)
+    return (rates[low] + (rates[high] - rates[low]) * (position - low)).quantize(Decimal('0.01'))
+
+
+def summarize(rates):
+    rates = sorted(rates)
+    return {
+        'count': len(rates),
+        'p25': percentile(rates, 25),
+        'median': percentile(rates, 50),
+        'p75': percentile(rates, 75),
+    }
+
+
+def backfill_price_stats(apps, schema_editor):
+    CropListing = apps.get_model('marketplace', 'CropListing')
+    PriceStat = apps.get_model('marketplace', 'PriceStat')
+    listings = list(CropListing.objects.only('id', 'crop_name', 'category_id', 'district', 'date_posted', 'rate'))
+    rates = defaultdict(list)
+    for listing in listings:
+        listing.crop_key = crop_key(listing.crop_name)
+        rates[listing.crop_key, listing.category_id, listing.district, week_of(listing.date_posted)].append(listing.rate)
+    CropListing.objects.bulk_update(listings, ['crop_key'], batch_size=1000)
+    PriceStat.objects.bulk_create([
+        PriceStat(crop=crop, category_id=category_id, district=district, week=week, **summarize(group_rates))
+        for (crop, category_id, district, week), group_rates in rates.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0012_listing_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crop', models.CharField(max_length=100)),
+                ('district', models.CharField(blank=True, default='', max_length=50)),
+                ('week', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('p25', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('median', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('p75', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='croplisting',
+            name='crop_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='croplisting',
+            index=models.Index(fields=['crop_key', 'district', 'category', 'date_posted'], name='listing_price_group_idx'),
+        ),
+        migrations.AddField(
+            model_name='pricestat',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_stats', to='marketplace.category'),
+        ),
+        migrations.AddIndex(
+            model_name='pricestat',
+            index=models.Index(fields=['crop', 'district', '-week'], name='price_stat_crop_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pricestat',
+            constraint=models.UniqueConstraint(fields=('crop', 'category', 'district', 'week'), name='price_stat_group_unique'),
+        ),
+        migrations.RunPython(backfill_price_stats, migrations.RunPython.noop),
+    ]
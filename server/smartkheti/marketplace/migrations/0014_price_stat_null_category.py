@@ -0,0 +1,42 @@
+# Generated by Django 5.1.5 on 2026-10-19 19:28
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_uncategorized_stats(apps, schema_editor):
+    """Keep one row per uncategorized group; the old constraint let duplicates in."""
+    PriceStat = apps.get_model('marketplace', 'PriceStat')
+    uncategorized = PriceStat.objects.filter(category__isnull=True)
+    duplicated = (
+        uncategorized.values('crop', 'district', 'week')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicated:
+        uncategorized.filter(crop=group['crop'], district=group['district'], week=group['week']).exclude(
+            id=group['keep']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0013_price_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_uncategorized_stats, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='pricestat',
+            name='price_stat_group_unique',
+        ),
+        migrations.AddConstraint(
+            model_name='pricestat',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('crop', 'category', 'district', 'week'), name='price_stat_group_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='pricestat',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('crop', 'district', 'week'), name='price_stat_uncategorized_group_unique'),
+        ),
+    ]
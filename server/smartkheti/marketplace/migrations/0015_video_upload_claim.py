@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0014_price_stat_null_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoupload',
+            name='claim',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,9 +1,54 @@
 # marketplace/models.py
+import uuid
+
 from django.db import models
 from django.conf import settings
 from phonenumber_field.modelfields import PhoneNumberField
 from cloudinary_storage.storage import VideoMediaCloudinaryStorage # <-- NEW: Import the video storage class
 from cloudinary.models import CloudinaryField # <-- NEW: You might need this for image fields if you want to use it instead of ImageField
+from weather.gazetteer import LEVEL_MUNICIPALITY, get_gazetteer, normalize_name
+
+
+def place_for_location(location):
+    """
+    Most specific gazetteer place named by a free-text listing location: the
+    municipality for "Bharatpur, Chitwan" or "pokhara", the district for
+    "Dhading Besi", or None when nothing is recognised.
+    """
+    gazetteer = get_gazetteer()
+    parts = [part for part in str(location or '').split(',') if part.strip()]
+    for i, part in enumerate(parts):
+        district = gazetteer.match_district(part)
+        if district:
+            # A municipality named alongside it, e.g. "Bharatpur" in "Bharatpur, Chitwan".
+            for other in parts[:i] + parts[i + 1:]:
+                municipality = gazetteer.match_municipality(other, district.name)
+                if municipality:
+                    return municipality
+            return district
+    for part in parts:
+        place = gazetteer.match_municipality(part)
+        if place:
+            return place
+    # e.g. "Dhading Besi": a district name among other words. Exact matches
+    # only; single words fuzzy-match too eagerly ("bazar" -> Bara).
+    for word in ' '.join(parts).split():
+        place = gazetteer.districts.get(normalize_name(word))
+        if place:
+            return place
+    return None
+
+
+def crop_key(crop_name):
+    """Case- and spacing-insensitive crop name, e.g. "  Red  Tomato" -> "red tomato"."""
+    return ' '.join(str(crop_name or '').lower().split())
+
+
+def district_for_location(location):
+    """Canonical district name for a free-text listing location, or ''."""
+    place = place_for_location(location)
+    return place.district if place else ''
+
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -27,13 +72,139 @@ class CropListing(models.Model):
     video = models.FileField(upload_to='marketplace/crop_videos/', blank=True, null=True, storage=VideoMediaCloudinaryStorage())
     
     date_posted = models.DateTimeField(auto_now_add=True)
+    # Normalized crop_name, grouping listings for price statistics.
+    crop_key = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # Bumped on every save and when the listing's images change, for delta sync.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Derived from `location` on save, for filtering, facet counts and "near me"
+    # queries; the coordinates are those of the municipality or district named.
+    district = models.CharField(max_length=50, blank=True, default='', editable=False)
+    municipality = models.CharField(max_length=100, blank=True, default='', editable=False)
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs the newest-first cursor pagination of the listing list.
+            models.Index(fields=['-date_posted', '-id'], name='listing_posted_id_idx'),
+            # Filtered pages in the same order.
+            models.Index(fields=['category', '-date_posted', '-id'], name='listing_category_posted_idx'),
+            models.Index(fields=['district', '-date_posted', '-id'], name='listing_district_posted_idx'),
+            # Covers the grouped facet count query and rate ranges within a category.
+            models.Index(fields=['category', 'district', 'rate'], name='listing_facet_idx'),
+            # Bounding-box prefilter of near= queries: a latitude range scan
+            # that checks longitude from the index entries.
+            models.Index(fields=['latitude', 'longitude'], name='listing_lat_lon_idx'),
+            # A farmer's listings changed since a sync token.
+            models.Index(fields=['farmer', 'updated_at'], name='listing_farmer_updated_idx'),
+            # Listings of one price statistics group (crop, district, category, week).
+            models.Index(fields=['crop_key', 'district', 'category', 'date_posted'], name='listing_price_group_idx'),
+        ]
+
+    PLACE_FIELDS = ('district', 'municipality', 'latitude', 'longitude')
 
     def __str__(self):
         return f"{self.crop_name} by {self.farmer.first_name}"
 
+    def set_place(self, place):
+        self.district = place.district if place else ''
+        self.municipality = place.name if place and place.level == LEVEL_MUNICIPALITY else ''
+        self.latitude = place.lat if place else None
+        self.longitude = place.lon if place else None
+
+    def save(self, *args, update_fields=None, **kwargs):
+        self.crop_key = crop_key(self.crop_name)
+        if update_fields is not None and 'crop_name' in update_fields:
+            update_fields = {*update_fields, 'crop_key'}
+        if update_fields is None or 'location' in update_fields:
+            self.set_place(place_for_location(self.location))
+            if update_fields is not None:
+                update_fields = {*update_fields, *self.PLACE_FIELDS}
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+class PriceStat(models.Model):
+    """
+    Rate statistics of the listings of one crop, category and district posted
+    in one week, kept current by marketplace.prices.
+    """
+    crop = models.CharField(max_length=100)  # CropListing.crop_key
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='price_stats')
+    district = models.CharField(max_length=50, blank=True, default='')
+    week = models.DateField()  # Monday, in TIME_ZONE
+    count = models.PositiveIntegerField()
+    p25 = models.DecimalField(max_digits=10, decimal_places=2)
+    median = models.DecimalField(max_digits=10, decimal_places=2)
+    p75 = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Split on category so listings without one also get a single row
+            # per group: a plain unique constraint treats NULLs as distinct.
+            models.UniqueConstraint(
+                fields=['crop', 'category', 'district', 'week'], condition=models.Q(category__isnull=False),
+                name='price_stat_group_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['crop', 'district', 'week'], condition=models.Q(category__isnull=True),
+                name='price_stat_uncategorized_group_unique',
+            ),
+        ]
+        indexes = [
+            # Recent weeks of a crop, optionally in one district.
+            models.Index(fields=['crop', 'district', '-week'], name='price_stat_crop_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.crop} in {self.district or 'unknown district'}, week of {self.week}: {self.median}"
+
 class CropImage(models.Model):
     listing = models.ForeignKey(CropListing, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='marketplace/crop_images/')
+    # SHA-256 of the file, so listing edits only upload photos that changed.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    position = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return f"image for {self.listing.crop_name}"
+
+class VideoUpload(models.Model):
+    """
+    A resumable, chunked upload of a listing's video. Chunks are written to a
+    temporary file at their offsets; once `offset` reaches `size` the file is
+    handed to the video storage in the background and set on the listing.
+    """
+    UPLOADING = 'uploading'
+    PROCESSING = 'processing'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (PROCESSING, 'Processing'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    listing = models.ForeignKey(CropListing, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # Optional SHA-256 of the whole file, checked before it is stored.
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UPLOADING)
+    error = models.TextField(blank=True, default='')
+    # Token of the worker storing the finished video; it refreshes
+    # updated_at while it works (see video_uploads.finish_upload).
+    claim = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"image for {self.listing.crop_name}"
\ No newline at end of file
+        return f"video upload for {self.listing_id} ({self.offset}/{self.size})"
@@ -0,0 +1,146 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import geo
+
+
+class ListingCursorPagination(BasePagination):
+    """
+    Keyset pagination over (date_posted, id), newest first. The cursor is the
+    position of the last listing on the previous page, so every page is one
+    index range scan no matter how deep the client has scrolled, and new
+    listings never shift items between pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-date_posted', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            date_posted, pk = position
+            queryset = queryset.filter(
+                Q(date_posted__lt=date_posted) | Q(date_posted=date_posted, id__lt=pk)
+            )
+
+        # One extra row tells us whether there is a next page.
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            date_posted, pk = decoded.rsplit('|', 1)
+            date_posted = parse_datetime(date_posted)
+            if date_posted is None:
+                raise ValueError(decoded)
+            return date_posted, int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, listing):
+        raw = f"{listing.date_posted.isoformat()}|{listing.pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class RankedListingPagination(ListingCursorPagination):
+    """
+    Pagination for search results, which keep the queryset's relevance order.
+    Rank is a computed float, so the cursor holds a row offset rather than a
+    keyset position; search result lists are short and rarely paged deeply.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.offset = self.decode_cursor(request) or 0
+
+        results = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            offset = int(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if offset < 0:
+            raise NotFound('Invalid cursor')
+        return offset
+
+    def encode_cursor(self, listing):
+        raw = str(self.offset + self.page_size)
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+class NearbyListingPagination(RankedListingPagination):
+    """
+    Nearest-first pages of a near= query. Distances are computed outside the
+    database (see geo.nearest), so the offset cursor indexes that ordering and
+    only the page's listings are loaded, each with its `distance_km`.
+    """
+
+    def __init__(self, lat, lon, radius_km):
+        self.origin = (lat, lon, radius_km)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.offset = self.decode_cursor(request) or 0
+
+        lat, lon, radius_km = self.origin
+        ranked = geo.nearest(queryset, lat, lon, radius_km, self.offset + self.page_size + 1)[self.offset:]
+        self.has_next = len(ranked) > self.page_size
+        ranked = ranked[:self.page_size]
+
+        listings = queryset.in_bulk([pk for pk, _km in ranked])
+        results = []
+        for pk, km in ranked:
+            listing = listings[pk]
+            listing.distance_km = round(km, 2)
+            results.append(listing)
+        self.last = results[-1] if results else None
+        return results
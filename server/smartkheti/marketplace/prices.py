@@ -0,0 +1,97 @@
+"""
+Weekly crop price index: count, median and quartiles of listing rates per
+crop, category, district and week, kept in PriceStat so a price lookup reads
+a few precomputed rows instead of scanning every listing.
+
+A listing write recomputes only the groups the listing left and joined, from
+that group's listings (see signals.py). rebuild_price_stats() recomputes
+every group, e.g. after bulk imports that send no signals.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+from . import response_cache
+from .models import CropListing, PriceStat
+
+CENTS = Decimal('0.01')
+
+
+def week_of(moment):
+    """Monday of the week `moment` falls in, in the current time zone."""
+    day = timezone.localtime(moment).date()
+    return day - timedelta(days=day.weekday())
+
+
+def week_bounds(week):
+    start = timezone.make_aware(datetime.combine(week, time.min))
+    end = timezone.make_aware(datetime.combine(week + timedelta(days=7), time.min))
+    return start, end
+
+
+def percentile(rates, pct):
+    """Linearly interpolated percentile of sorted Decimal rates (like PERCENTILE_CONT)."""
+    position = Decimal(len(rates) - 1) * pct / 100
+    low = math.floor(position)
+    high = min(low + 1, len(rates) - 1)
+    return (rates[low] + (rates[high] - rates[low]) * (position - low)).quantize(CENTS)
+
+
+def summarize(rates):
+    """PriceStat values for an unsorted, non-empty list of rates."""
+    rates = sorted(rates)
+    return {
+        'count': len(rates),
+        'p25': percentile(rates, 25),
+        'median': percentile(rates, 50),
+        'p75': percentile(rates, 75),
+    }
+
+
+def price_group(crop, category_id, district, date_posted):
+    return crop, category_id, district, week_of(date_posted)
+
+
+def listing_group(listing):
+    return price_group(listing.crop_key, listing.category_id, listing.district, listing.date_posted)
+
+
+def refresh_groups(groups):
+    """Recompute the PriceStat rows of the given (crop, category id, district, week) groups."""
+    for crop, category_id, district, week in groups:
+        start, end = week_bounds(week)
+        rates = list(
+            CropListing.objects.filter(
+                crop_key=crop, category_id=category_id, district=district,
+                date_posted__gte=start, date_posted__lt=end,
+            ).values_list('rate', flat=True)
+        )
+        lookup = {'crop': crop, 'category_id': category_id, 'district': district, 'week': week}
+        if rates:
+            PriceStat.objects.update_or_create(**lookup, defaults=summarize(rates))
+        else:
+            PriceStat.objects.filter(**lookup).delete()
+    metrics.incr('marketplace.prices.groups_refreshed', len(groups))
+    response_cache.invalidate_prices()
+
+
+def rebuild_price_stats():
+    """Recompute every PriceStat row from the listings in one pass; returns the number of groups."""
+    rates = defaultdict(list)
+    rows = CropListing.objects.values_list('crop_key', 'category_id', 'district', 'date_posted', 'rate')
+    for crop, category_id, district, date_posted, rate in rows.iterator(chunk_size=5000):
+        rates[price_group(crop, category_id, district, date_posted)].append(rate)
+
+    with transaction.atomic():
+        PriceStat.objects.all().delete()
+        PriceStat.objects.bulk_create([
+            PriceStat(crop=crop, category_id=category_id, district=district, week=week, **summarize(group_rates))
+            for (crop, category_id, district, week), group_rates in rates.items()
+        ], batch_size=1000)
+    response_cache.invalidate_prices()
+    return len(rates)
@@ -0,0 +1,122 @@
+"""
+Cached responses for the public listing reads (list pages, listing detail
+and the price index), with ETags so clients can revalidate with
+If-None-Match and get a 304 instead of the body.
+
+Cache keys embed version counters that writes bump once they commit (see
+signals.py): one shared by every list page, one per listing, one for price
+statistics, and an epoch for data every response embeds (category and
+farmer names). Bumping a counter
+makes the entries built from the old data unreachable; they age out with
+MARKETPLACE_RESPONSE_CACHE_TTL, which also bounds staleness after bulk
+updates that send no signals.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from core import metrics
+from .renderers import FastJSONRenderer
+
+EPOCH_KEY = 'marketplace.responses.epoch'
+LIST_VERSION_KEY = 'marketplace.responses.list'
+PRICES_VERSION_KEY = 'marketplace.responses.prices'
+
+metrics.register_ratio(
+    'marketplace.responses.hit_ratio',
+    hits=['marketplace.responses.hit'],
+    misses=['marketplace.responses.miss'],
+)
+
+
+def _listing_version_key(pk):
+    return f'marketplace.responses.listing:{pk}'
+
+
+def _versions(*keys):
+    """Current value of each version counter, starting missing ones at the clock."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh start value, so an evicted counter never revives old keys.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_listing(pk):
+    """Drop cached list pages and the detail of listing `pk`."""
+    _bump(LIST_VERSION_KEY)
+    _bump(_listing_version_key(pk))
+
+
+def invalidate_prices():
+    """Drop cached price index responses."""
+    _bump(PRICES_VERSION_KEY)
+
+
+def invalidate_all(**kwargs):
+    """Drop every cached listing response (e.g. after a category rename)."""
+    _bump(EPOCH_KEY)
+
+
+def _request_digest(request):
+    params = sorted(request.query_params.lists())
+    # Cached bodies hold absolute media and cursor URLs, so the scheme matters too.
+    raw = f"{request.scheme}|{request.get_host()}|{request.path}|{params}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def list_cache_key(request):
+    epoch, version = _versions(EPOCH_KEY, LIST_VERSION_KEY)
+    return f'marketplace.responses:list:{epoch}:{version}:{_request_digest(request)}'
+
+
+def detail_cache_key(request, pk):
+    epoch, version = _versions(EPOCH_KEY, _listing_version_key(pk))
+    return f'marketplace.responses:listing:{pk}:{epoch}:{version}:{_request_digest(request)}'
+
+
+def prices_cache_key(request):
+    epoch, version = _versions(EPOCH_KEY, PRICES_VERSION_KEY)
+    return f'marketplace.responses:prices:{epoch}:{version}:{_request_digest(request)}'
+
+
+def cached_response(request, key, build):
+    """
+    The cached response for `key`, or build() (which returns a Response) when
+    there is none; only 200 responses are stored. Answers 304 when the
+    request's If-None-Match names the current ETag.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        metrics.incr('marketplace.responses.miss')
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        etag = quote_etag(hashlib.md5(FastJSONRenderer().render(response.data)).hexdigest())
+        entry = (etag, response.data)
+        cache.set(key, entry, settings.MARKETPLACE_RESPONSE_CACHE_TTL)
+    else:
+        metrics.incr('marketplace.responses.hit')
+
+    etag, data = entry
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        metrics.incr('marketplace.responses.not_modified')
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,168 @@
+"""
+Ranked listing search over crop_name, location and description.
+
+PostgreSQL matches a weighted tsvector (GIN-indexed, see migration 0007)
+and, for typo tolerance, trigram similarity on crop_name (pg_trgm GIN index).
+SQLite, used for local development, matches an FTS5 table kept in step by
+triggers. Any other database falls back to the old unranked icontains scan.
+"""
+import logging
+import unicodedata
+
+from django.db import OperationalError, connection, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'marketplace_croplisting'
+FTS_TABLE = 'marketplace_croplisting_fts'
+
+# Must stay identical to the expression indexed in migration 0007, or
+# PostgreSQL will not use the index. {table} qualifies the columns in queries.
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce({table}crop_name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({table}location, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce({table}description, '')), 'C')"
+)
+
+# bm25 column weights for crop_name, location, description.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+FTS_SETUP_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        crop_name, location, description,
+        content='{TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, crop_name, location, description)
+        VALUES (new.id, new.crop_name, new.location, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, crop_name, location, description)
+        VALUES ('delete', old.id, old.crop_name, old.location, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, crop_name, location, description)
+        VALUES ('delete', old.id, old.crop_name, old.location, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, crop_name, location, description)
+        VALUES (new.id, new.crop_name, new.location, new.description);
+    END""",
+]
+
+
+def search_terms(query):
+    """
+    Words of the query with everything but letters, digits and combining marks
+    (Devanagari vowel signs) removed, so they are safe to splice into tsquery
+    and FTS5 syntax.
+    """
+    terms = []
+    for word in query.split():
+        term = ''.join(ch for ch in word if ch.isalnum() or unicodedata.category(ch).startswith('M'))
+        if term:
+            terms.append(term.lower())
+    return terms
+
+
+def search_listings(queryset, query):
+    """
+    Listings matching every word of `query` (as a word prefix), annotated with
+    `rank` and ordered best match first. `rank` is None on databases without a
+    search index.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, query, terms)
+    if connection.vendor == 'sqlite' and sqlite_fts_installed():
+        return _sqlite_search(queryset, terms)
+    return _icontains_search(queryset, query)
+
+
+def _postgres_search(queryset, query, terms):
+    vector = PG_VECTOR_SQL.format(table=f'"{TABLE}".')
+    tsquery = ' & '.join(f"{term}:*" for term in terms)
+    matches = RawSQL(
+        f"({vector}) @@ to_tsquery('simple', %s) OR \"{TABLE}\".\"crop_name\" %% %s",
+        (tsquery, query), output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f"ts_rank({vector}, to_tsquery('simple', %s)) + similarity(\"{TABLE}\".\"crop_name\", %s)",
+        (tsquery, query), output_field=FloatField(),
+    )
+    return queryset.filter(matches).annotate(rank=rank).order_by('-rank', '-date_posted', '-id')
+
+
+def _sqlite_search(queryset, terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+    # bm25() only works inside the MATCH query, and a plain correlated
+    # subquery re-runs the MATCH for every row; MATERIALIZED makes SQLite run
+    # it once and look the rank up by id. bm25() is lower-is-better, so negate
+    # it to sort like PostgreSQL's rank.
+    rank = RawSQL(
+        f"""(WITH ranks AS MATERIALIZED (
+            SELECT rowid AS id, -bm25({FTS_TABLE}, {weights}) AS rank
+            FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+        ) SELECT rank FROM ranks WHERE ranks.id = "{TABLE}"."id")""",
+        (match,), output_field=FloatField(),
+    )
+    return queryset.filter(id__in=matches).annotate(rank=rank).order_by('-rank', '-date_posted', '-id')
+
+
+def _icontains_search(queryset, query):
+    return queryset.filter(
+        Q(crop_name__icontains=query) |
+        Q(location__icontains=query) |
+        Q(description__icontains=query)
+    ).annotate(rank=Value(None, output_field=FloatField()))
+
+
+_fts_installed = None
+
+
+def sqlite_fts_installed():
+    """
+    Whether the FTS5 table exists and SQLite supports MATERIALIZED (3.35+).
+    Checked once per process; install_sqlite_fts() updates the answer.
+    """
+    global _fts_installed
+    if _fts_installed is None:
+        _fts_installed = (
+            connection.Database.sqlite_version_info >= (3, 35)
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_installed
+
+
+def install_sqlite_fts(using='default', **kwargs):
+    """
+    post_migrate hook: create the FTS5 table and its triggers on SQLite, and
+    rebuild the index whenever the triggers had to be (re)created, since
+    table rebuilds during migrations drop them.
+    """
+    global _fts_installed
+    conn = connections[using]
+    if conn.vendor != 'sqlite' or TABLE not in conn.introspection.table_names():
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+            [TABLE, f'{FTS_TABLE}_%'],
+        )
+        triggers_present = cursor.fetchone()[0] == 3
+        try:
+            for statement in FTS_SETUP_SQL:
+                cursor.execute(statement)
+        except OperationalError as e:  # SQLite built without FTS5
+            logger.warning(f"Listing search index unavailable, falling back to icontains: {e}")
+            _fts_installed = False
+            return
+        if not triggers_present:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_installed = conn.Database.sqlite_version_info >= (3, 35)
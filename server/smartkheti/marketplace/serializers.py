@@ -1,6 +1,14 @@
+import re
+
+from django.db import transaction
 from rest_framework import serializers
+
+from core import metrics
+from .media import content_hash, delete_stored_later, delete_uploaded, upload_all
 from .models import CropListing, CropImage, Category
 
+NEW_IMAGE_PREFIX = 'new:'
+
 
 # ➕ Used for POST/PUT (Write only)
 class CropListingSerializer(serializers.Serializer):
@@ -19,34 +27,150 @@ class CropListingSerializer(serializers.Serializer):
     images = serializers.ListField(
         child=serializers.ImageField(), write_only=True
     )
+    # On update, the listing's photos in their new order: ids of existing
+    # images to keep and "new:<n>" for the n-th file in `images`. Without it,
+    # `images` is the complete new set.
+    image_order = serializers.ListField(
+        child=serializers.CharField(), write_only=True, required=False
+    )
+
+    def validate(self, attrs):
+        order = attrs.get('image_order')
+        if order is None:
+            return attrs
+        images = attrs.get('images') or []
+        existing = set(self.instance.images.values_list('id', flat=True)) if self.instance else set()
+
+        entries = []
+        for token in order:
+            if token.startswith(NEW_IMAGE_PREFIX):
+                index = token[len(NEW_IMAGE_PREFIX):]
+                if not index.isdigit() or int(index) >= len(images):
+                    raise serializers.ValidationError({'image_order': f"{token} does not refer to an uploaded image"})
+                entries.append(images[int(index)])
+            else:
+                if not token.isdigit() or int(token) not in existing:
+                    raise serializers.ValidationError({'image_order': f"Image {token} is not part of this listing"})
+                entries.append(int(token))
+        attrs['image_order'] = entries
+        return attrs
 
     def create(self, validated_data):
         images = validated_data.pop('images')
+        validated_data.pop('image_order', None)
+        video = validated_data.pop('video', None)
         farmer = self.context['request'].user
-        listing = CropListing.objects.create(farmer=farmer, **validated_data)
-        for image in images:
-            CropImage.objects.create(listing=listing, image=image)
+        listing = CropListing(farmer=farmer, **validated_data)
+        _kept, new, _removed = self.plan_images(listing, images)
+
+        # Upload all media concurrently first, then write every row in one transaction.
+        video_name, image_names, stored = self.upload_media(listing, [file for _p, _h, file in new], video)
+        try:
+            with transaction.atomic():
+                if video_name:
+                    listing.video = video_name
+                listing.save()
+                self.create_images(listing, new, image_names)
+        except Exception:
+            delete_uploaded(stored)
+            raise
         return listing
 
     def update(self, instance, validated_data):
         images = validated_data.pop('images', None)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        if images:
-            instance.images.all().delete()
-            for image in images:
-                CropImage.objects.create(listing=instance, image=image)
+        order = validated_data.pop('image_order', None)
+        video = validated_data.pop('video') if validated_data.get('video') else None
+
+        # Only photos whose content is new get uploaded; the rest are kept or reordered.
+        changing_images = bool(images) or order is not None
+        kept, new, removed = self.plan_images(instance, images or [], order) if changing_images else ([], [], [])
+
+        video_name, image_names, stored = self.upload_media(instance, [file for _p, _h, file in new], video)
+        try:
+            with transaction.atomic():
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                if video_name:
+                    instance.video = video_name
+                instance.save()
+
+                if changing_images:
+                    CropImage.objects.filter(id__in=[image.id for image in removed]).delete()
+                    CropImage.objects.bulk_update(kept, ['position'])
+                    self.create_images(instance, new, image_names)
+        except Exception:
+            delete_uploaded(stored)
+            raise
+
+        image_field = CropImage._meta.get_field('image')
+        delete_stored_later([(image_field, image.image.name) for image in removed if image.image])
         return instance
 
+    def plan_images(self, listing, images, order=None):
+        """
+        Match the requested photos against the listing's current ones by
+        content hash. Returns (kept images with updated positions,
+        [(position, hash, file)] to upload, images to remove). `order` is the
+        validated image_order (existing ids and files); without it, `images`
+        is the complete new set. Repeated photos are kept once.
+        """
+        existing = list(listing.images.all()) if listing.pk else []
+        by_id = {image.id: image for image in existing}
+        by_hash = {image.content_hash: image for image in existing if image.content_hash}
+
+        kept, new, seen = [], [], set()
+        for entry in (order if order is not None else images):
+            if isinstance(entry, int):
+                image = by_id[entry]
+                key = image.content_hash or f'id:{image.id}'
+            else:
+                key = content_hash(entry)
+                image = by_hash.get(key)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            position = len(seen) - 1
+            if image is not None:
+                image.position = position
+                kept.append(image)
+            else:
+                new.append((position, key, entry))
+
+        kept_ids = {image.id for image in kept}
+        removed = [image for image in existing if image.id not in kept_ids]
+        metrics.incr('marketplace.images.reused', len(kept))
+        return kept, new, removed
+
+    def create_images(self, listing, new, image_names):
+        CropImage.objects.bulk_create([
+            CropImage(listing=listing, image=name, content_hash=key, position=position)
+            for (position, key, _file), name in zip(new, image_names)
+        ])
+
+    def upload_media(self, listing, images, video=None):
+        """
+        Upload the images and video side by side. Returns the stored video
+        name (or None), the stored image names, and (field, name) pairs for
+        delete_uploaded() should the rows not get written.
+        """
+        image_field = CropImage._meta.get_field('image')
+        jobs = [(image_field, CropImage(listing=listing), image) for image in images]
+        if video:
+            jobs.append((CropListing._meta.get_field('video'), listing, video))
+
+        names = upload_all(jobs)
+        stored = [(field, name) for (field, _instance, _file), name in zip(jobs, names)]
+        video_name = names.pop() if video else None
+        return video_name, names, stored
+
 # 🔧 FIXED: This serializer now returns full URLs
 class CropImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
 
     class Meta:
         model = CropImage
-        fields = ['image']
+        fields = ['id', 'image']
     
     def get_image(self, obj):
         request = self.context.get('request')
@@ -56,19 +180,34 @@ class CropImageSerializer(serializers.ModelSerializer):
 
 # 🔧 FIXED: This serializer now handles video URLs and passes context
 class CropListingReadSerializer(serializers.ModelSerializer):
+    """
+    Pass `fields` to return only some of the fields, e.g. compact cards with
+    fields=['id', 'crop_name', 'rate', 'location', 'thumbnail']. `thumbnail`
+    (the first image's URL) is only included when asked for. `distance_km` is
+    set on results of near= queries and null otherwise.
+    """
     images = serializers.SerializerMethodField()
     category = serializers.SlugRelatedField(slug_field='name', read_only=True)
     farmer = serializers.SerializerMethodField()
     video = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
 
     class Meta:
         model = CropListing
         fields = [
             'id', 'farmer', 'crop_name', 'category', 'quantity', 'rate',
-            'location', 'contact_number', 'optional_contact',
-            'description', 'video', 'date_posted', 'images'
+            'location', 'district', 'municipality', 'latitude', 'longitude',
+            'contact_number', 'optional_contact', 'description', 'video',
+            'date_posted', 'images', 'thumbnail', 'distance_km'
         ]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = set(fields) if fields is not None else set(self.fields) - {'thumbnail'}
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
     def get_farmer(self, obj):
         return f"{obj.farmer.first_name} {obj.farmer.last_name}".strip()
     
@@ -77,8 +216,112 @@ class CropListingReadSerializer(serializers.ModelSerializer):
         images = obj.images.all()
         return CropImageSerializer(images, many=True, context={'request': request}).data
     
+    def get_thumbnail(self, obj):
+        request = self.context.get('request')
+        # Iterate rather than .first() so prefetched images are used.
+        for image in obj.images.all():
+            if image.image and request:
+                return request.build_absolute_uri(image.image.url)
+            break
+        return None
+
+    def get_distance_km(self, obj):
+        return getattr(obj, 'distance_km', None)
+
     def get_video(self, obj):
         request = self.context.get('request')
         if obj.video and request:
             return request.build_absolute_uri(obj.video.url)
-        return None
\ No newline at end of file
+        return None
+
+class MediaURLs:
+    """
+    Absolute URLs of stored files for one request. Storages build URLs one
+    file at a time, slowly in Cloudinary's case (~85 µs each), but most build
+    them as a fixed prefix plus the name. That prefix is worked out once per
+    storage and directory from two probe names and reused for names made of
+    URL-safe characters; any other name, or a storage whose URLs don't
+    follow that shape (e.g. signed URLs), goes through storage.url().
+    """
+    SAFE_NAME = re.compile(r'[A-Za-z0-9_.-]+\Z')
+    PROBES = ('urlprobe-a', 'urlprobe-b')
+
+    def __init__(self, request):
+        self.request = request
+        self.prefixes = {}
+
+    def __call__(self, file):
+        if not file or self.request is None:
+            return None
+        directory, _, base = file.name.rpartition('/')
+        if self.SAFE_NAME.match(base):
+            key = (file.storage, directory)
+            if key not in self.prefixes:
+                self.prefixes[key] = self._prefix(file.storage, directory)
+            if self.prefixes[key] is not None:
+                return self.prefixes[key] + base
+        return self.request.build_absolute_uri(file.storage.url(file.name))
+
+    def _prefix(self, storage, directory):
+        prefixes = set()
+        for probe in self.PROBES:
+            url = self.request.build_absolute_uri(storage.url(f'{directory}/{probe}' if directory else probe))
+            if not url.endswith(probe):
+                return None
+            prefixes.add(url[:-len(probe)])
+        return prefixes.pop() if len(prefixes) == 1 else None
+
+
+_rate_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+_date_field = serializers.DateTimeField()
+
+
+def _first_image(listing, urls):
+    # Like get_thumbnail: only the first image counts.
+    for image in listing.images.all():
+        return urls(image.image)
+    return None
+
+
+def _phone(value):
+    return str(value) if value is not None else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+# Value of each read field, matching CropListingReadSerializer's representation.
+ROW_VALUES = {
+    'id': lambda listing, urls: listing.id,
+    'farmer': lambda listing, urls: f"{listing.farmer.first_name} {listing.farmer.last_name}".strip(),
+    'crop_name': lambda listing, urls: listing.crop_name,
+    'category': lambda listing, urls: listing.category.name if listing.category is not None else None,
+    'quantity': lambda listing, urls: listing.quantity,
+    'rate': lambda listing, urls: _rate_field.to_representation(listing.rate),
+    'location': lambda listing, urls: listing.location,
+    'district': lambda listing, urls: listing.district,
+    'municipality': lambda listing, urls: listing.municipality,
+    'latitude': lambda listing, urls: _float(listing.latitude),
+    'longitude': lambda listing, urls: _float(listing.longitude),
+    'contact_number': lambda listing, urls: _phone(listing.contact_number),
+    'optional_contact': lambda listing, urls: _phone(listing.optional_contact),
+    'description': lambda listing, urls: listing.description,
+    'video': lambda listing, urls: urls(listing.video),
+    'date_posted': lambda listing, urls: _date_field.to_representation(listing.date_posted),
+    'images': lambda listing, urls: [{'id': image.id, 'image': urls(image.image)} for image in listing.images.all()],
+    'thumbnail': _first_image,
+    'distance_km': lambda listing, urls: getattr(listing, 'distance_km', None),
+}
+
+
+def listing_rows(listings, request, fields=None):
+    """
+    CropListingReadSerializer(listings, many=True, fields=fields).data as
+    plain dicts, without DRF's per-field machinery, for list pages. Expects
+    listings loaded by views.listings_for_read().
+    """
+    keep = set(fields) if fields is not None else set(ROW_VALUES) - {'thumbnail'}
+    columns = [(name, ROW_VALUES[name]) for name in CropListingReadSerializer.Meta.fields if name in keep]
+    urls = MediaURLs(request)
+    return [{name: value(listing, urls) for name, value in columns} for listing in listings]
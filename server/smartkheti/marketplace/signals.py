@@ -0,0 +1,80 @@
+"""
+Invalidate cached facet counts and listing responses once a write to a
+listing, its images, a category or a farmer's name commits. Waiting for the
+commit keeps a concurrent reader from re-caching the old rows under the new
+cache version. Image changes also bump their listing's `updated_at`, so
+delta sync picks them up. Listing writes also refresh the price statistics
+of the groups the listing left and joined.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from . import prices, response_cache
+from .facets import invalidate_facets
+from .models import Category, CropImage, CropListing
+
+User = get_user_model()
+
+
+def listing_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(invalidate_facets)
+    transaction.on_commit(lambda: response_cache.invalidate_listing(pk))
+
+
+# A listing's price group and rate come from these; other saves leave prices alone.
+PRICE_FIELDS = {'crop_name', 'crop_key', 'category', 'location', 'district', 'rate'}
+
+
+def affects_prices(update_fields):
+    return update_fields is None or bool(PRICE_FIELDS & set(update_fields))
+
+
+def remember_price_group(sender, instance, update_fields=None, **kwargs):
+    # The row still holds the group the listing is leaving.
+    old = None
+    if instance.pk is not None and affects_prices(update_fields):
+        old = CropListing.objects.filter(pk=instance.pk).values_list(
+            'crop_key', 'category_id', 'district', 'date_posted',
+        ).first()
+    instance._old_price_group = prices.price_group(*old) if old else None
+
+
+def listing_prices_changed(sender, instance, update_fields=None, **kwargs):
+    if not affects_prices(update_fields):
+        return
+    groups = {prices.listing_group(instance)}
+    old = getattr(instance, '_old_price_group', None)
+    if old is not None:
+        groups.add(old)
+    transaction.on_commit(lambda: prices.refresh_groups(groups))
+
+
+def image_changed(sender, instance, **kwargs):
+    listing_id = instance.listing_id
+    # Synced clients refetch the listing, images included.
+    CropListing.objects.filter(pk=listing_id).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: response_cache.invalidate_listing(listing_id))
+
+
+def category_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_facets)
+    transaction.on_commit(response_cache.invalidate_all)
+
+
+def farmer_renamed(sender, instance, update_fields=None, created=False, **kwargs):
+    # Listings show the farmer's name; logins and other profile saves don't matter.
+    if created or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    transaction.on_commit(response_cache.invalidate_all)
+
+
+for signal in (post_save, post_delete):
+    signal.connect(listing_changed, sender=CropListing, dispatch_uid=f'listing_changed_{signal is post_save}')
+    signal.connect(image_changed, sender=CropImage, dispatch_uid=f'image_changed_{signal is post_save}')
+    signal.connect(category_changed, sender=Category, dispatch_uid=f'category_changed_{signal is post_save}')
+    signal.connect(listing_prices_changed, sender=CropListing, dispatch_uid=f'listing_prices_{signal is post_save}')
+pre_save.connect(remember_price_group, sender=CropListing, dispatch_uid='remember_price_group')
+post_save.connect(farmer_renamed, sender=User, dispatch_uid='farmer_renamed')
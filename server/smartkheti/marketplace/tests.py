@@ -1,3 +1,838 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import Category, CropImage, CropListing, PriceStat, VideoUpload
+from .prices import rebuild_price_stats, week_of
+from .renderers import FastJSONRenderer
+from .serializers import CropListingReadSerializer, CropListingSerializer, MediaURLs, listing_rows
+from . import async_views, video_uploads
+from .video_uploads import claim_upload, finish_upload
+from .views import listings_for_read
+
+
+class ListingQueryCountTests(TestCase):
+    """
+    Listing reads must cost a constant number of queries however many
+    listings (and images per listing) are returned.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000001', password='x', first_name='Ram', last_name='Thapa',
+        )
+        cls.category = Category.objects.create(name='Vegetables')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+
+    def add_listings(self, count, images_per_listing=2):
+        for n in range(count):
+            listing = CropListing.objects.create(
+                farmer=self.farmer, crop_name=f'Tomato {n}', category=self.category,
+                quantity='10 kg', rate='80.00', location='Bharatpur', contact_number='+9779841000001',
+            )
+            for i in range(images_per_listing):
+                CropImage.objects.create(listing=listing, image=f'marketplace/crop_images/{n}-{i}.jpg')
+
+    def count_queries(self, url):
+        cache.clear()  # measure building the response, not the response cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, url):
+        self.add_listings(1)
+        few = self.count_queries(url)
+        self.add_listings(20, images_per_listing=3)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_listing_list_query_count_is_constant(self):
+        self.assert_constant_queries('/api/marketplace/list/')
+
+    def test_listing_search_query_count_is_constant(self):
+        self.assert_constant_queries('/api/marketplace/list/?searchquery=tomato')
+
+    def test_my_listings_query_count_is_constant(self):
+        self.assert_constant_queries('/api/marketplace/listings/my/')
+
+    def test_listing_detail_query_count(self):
+        self.add_listings(1, images_per_listing=5)
+        listing = CropListing.objects.get()
+        # listing with farmer and category, then its images
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/marketplace/listings/{listing.pk}/')
+        self.assertEqual(len(response.json()['images']), 5)
+
+
+class ListingPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000002', password='x', first_name='Sita', last_name='Rai',
+        )
+        for n in range(25):
+            listing = CropListing.objects.create(
+                farmer=cls.farmer, crop_name=f'Potato {n}', quantity='5 kg', rate='40.00',
+                location='Dhading', contact_number='+9779841000002',
+            )
+            CropImage.objects.create(listing=listing, image=f'marketplace/crop_images/p{n}.jpg')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_cursor_walks_every_listing_once_newest_first(self):
+        seen = []
+        url = '/api/marketplace/list/?page_size=10'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(listing['id'] for listing in page['results'])
+            url = page['next']
+        expected = list(CropListing.objects.order_by('-date_posted', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_fields_returns_compact_cards(self):
+        response = self.client.get('/api/marketplace/list/?fields=id,crop_name,rate,location,thumbnail')
+        self.assertEqual(response.status_code, 200)
+        card = response.json()['results'][0]
+        self.assertEqual(set(card), {'id', 'crop_name', 'rate', 'location', 'thumbnail'})
+        self.assertIn('marketplace/crop_images/p', card['thumbnail'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/marketplace/list/?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/api/marketplace/list/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000003', password='x', first_name='Hari', last_name='KC',
+        )
+
+        def listing(crop_name, location='Kathmandu', description=''):
+            return CropListing.objects.create(
+                farmer=cls.farmer, crop_name=crop_name, quantity='1 kg', rate='100.00',
+                location=location, contact_number='+9779841000003', description=description,
+            )
+
+        cls.in_description = listing('Mixed vegetables', description='Fresh tomato and onion')
+        cls.in_name = listing('Tomato')
+        cls.in_location = listing('Rice', location='Tomatar Tole')
+        cls.unrelated = listing('Maize', description='Dry corn')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = APIClient().get('/api/marketplace/list/', {'searchquery': query})
+        self.assertEqual(response.status_code, 200)
+        return [listing['id'] for listing in response.json()['results']]
+
+    def test_crop_name_matches_rank_first(self):
+        ids = self.search('tomato')
+        self.assertEqual(ids[0], self.in_name.id)
+        self.assertIn(self.in_description.id, ids)
+        self.assertNotIn(self.unrelated.id, ids)
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(set(self.search('toma')), {self.in_name.id, self.in_description.id, self.in_location.id})
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('tomato onion'), [self.in_description.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.assertIn(self.in_name.id, self.search('tomato'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_name.crop_name = 'Cabbage'
+            self.in_name.save()
+        self.assertNotIn(self.in_name.id, self.search('tomato'))
+        self.assertEqual(self.search('cabbage'), [self.in_name.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_description.delete()
+        self.assertEqual(self.search('onion'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"tomato* OR'), [])
+
+
+class ListingFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000004', password='x', first_name='Gita', last_name='Magar',
+        )
+        vegetables = Category.objects.create(name='Vegetables')
+        grains = Category.objects.create(name='Grains')
+        for category, location, rate in [
+            (vegetables, 'Bharatpur, Chitwan', '40.00'),
+            (vegetables, 'Chitwan', '120.00'),
+            (vegetables, 'Pokhara', '300.00'),
+            (grains, 'Chitwan', '60.00'),
+            (grains, 'Somewhere unknown', '1500.00'),
+        ]:
+            CropListing.objects.create(
+                farmer=cls.farmer, crop_name='Crop', category=category, quantity='1 kg', rate=rate,
+                location=location, contact_number='+9779841000004',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/api/marketplace/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, facets, facet):
+        key = 'key' if facet == 'rate_band' else 'name'
+        return {entry[key]: entry['count'] for entry in facets[facet] if entry['count']}
+
+    def test_location_is_normalized_to_district(self):
+        districts = set(CropListing.objects.values_list('district', flat=True))
+        self.assertEqual(districts, {'Chitwan', 'Kaski', ''})
+
+    def test_counts_ignore_own_facet_selection(self):
+        facets = self.facets(category='Vegetables', district='chitwan')
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets, 'category'), {'Vegetables': 2, 'Grains': 1})
+        self.assertEqual(self.counts(facets, 'district'), {'Chitwan': 2, 'Kaski': 1})
+        self.assertEqual(self.counts(facets, 'rate_band'), {'0-50': 1, '100-250': 1})
+
+    def test_list_applies_filters(self):
+        response = self.client.get('/api/marketplace/list/', {'district': 'Chitwan', 'rate_band': '0-50,50-100'})
+        rates = sorted(listing['rate'] for listing in response.json()['results'])
+        self.assertEqual(rates, ['40.00', '60.00'])
+
+    def test_unknown_filter_values_are_rejected(self):
+        self.assertEqual(self.client.get('/api/marketplace/list/', {'district': 'Atlantis'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/marketplace/facets/', {'rate_band': '1-2'}).status_code, 400)
+
+    def test_counts_are_cached_until_a_listing_changes(self):
+        with self.assertNumQueries(1):
+            self.facets()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets()['total'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CropListing.objects.filter(location='Pokhara').get().delete()
+        self.assertEqual(self.facets()['total'], 4)
+
+
+class ListingNearbyTests(TestCase):
+    BHARATPUR = '27.6768,84.4359'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000010', password='x', first_name='Ram', last_name='Chaudhary',
+        )
+        cls.listings = {}
+        for location in ['Bharatpur, Chitwan', 'Ratnanagar, Chitwan', 'Pokhara', 'Kathmandu', 'Somewhere unknown']:
+            cls.listings[location] = CropListing.objects.create(
+                farmer=cls.farmer, crop_name='Maize', quantity='1 quintal', rate='45.00',
+                location=location, contact_number='+9779841000010',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def near(self, **params):
+        response = self.client.get('/api/marketplace/list/', {'near': self.BHARATPUR, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_location_is_resolved_to_a_place(self):
+        listing = self.listings['Ratnanagar, Chitwan']
+        self.assertEqual((listing.district, listing.municipality), ('Chitwan', 'Ratnanagar'))
+        self.assertAlmostEqual(listing.latitude, 27.61, places=2)
+
+        kathmandu = self.listings['Kathmandu']
+        self.assertEqual((kathmandu.district, kathmandu.municipality), ('Kathmandu', ''))
+        self.assertIsNone(self.listings['Somewhere unknown'].latitude)
+
+        listing.location = 'Pokhara'
+        listing.save(update_fields=['location'])
+        listing.refresh_from_db()
+        self.assertEqual((listing.district, listing.municipality), ('Kaski', 'Pokhara'))
+
+    def test_nearest_first_within_radius(self):
+        page = self.near(radius='80')
+        self.assertEqual(
+            [row['location'] for row in page['results']],
+            ['Bharatpur, Chitwan', 'Ratnanagar, Chitwan', 'Pokhara'],
+        )
+        distances = [row['distance_km'] for row in page['results']]
+        self.assertEqual(distances[0], 0)
+        self.assertTrue(5 < distances[1] < 15 and 60 < distances[2] < 80, distances)
+
+    def test_pages_follow_distance_order(self):
+        first = self.near(radius='500', page_size='2')
+        second = self.client.get(first['next']).json()
+        locations = [row['location'] for row in first['results'] + second['results']]
+        self.assertEqual(locations, ['Bharatpur, Chitwan', 'Ratnanagar, Chitwan', 'Pokhara', 'Kathmandu'])
+        self.assertIsNone(second['next'])
+
+    def test_combines_with_filters(self):
+        page = self.near(radius='500', district='Kaski,Kathmandu', fields='id,location,distance_km')
+        self.assertEqual([row['location'] for row in page['results']], ['Pokhara', 'Kathmandu'])
+        self.assertEqual(set(page['results'][0]), {'id', 'location', 'distance_km'})
+
+    def test_rejects_bad_coordinates(self):
+        for params in [{'near': 'here'}, {'near': '95,84'}, {'near': self.BHARATPUR, 'radius': '0'},
+                       {'near': self.BHARATPUR, 'radius': '10000'}]:
+            self.assertEqual(self.client.get('/api/marketplace/list/', params).status_code, 400, params)
+
+
+class SignedURLStorage(InMemoryStorage):
+    """URLs carry a per-file signature, so no shared prefix applies."""
+
+    def url(self, name):
+        return f"{super().url(name)}?sig={hashlib.md5(name.encode()).hexdigest()[:8]}"
+
+
+class ListingRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        farmer = get_user_model().objects.create_user(
+            phone='+9779841000011', password='x', first_name='Maya', last_name='',
+        )
+        fruit = Category.objects.create(name='Fruit')
+        cls.with_media = CropListing.objects.create(
+            farmer=farmer, crop_name='Orange', category=fruit, quantity='2 crates', rate='85.5',
+            location='Dhankuta', contact_number='+9779841000011', optional_contact='+9779812345678',
+            description='Sweet “junar” oranges', video='marketplace/crop_videos/orchard.mp4',
+        )
+        CropImage.objects.bulk_create([
+            CropImage(listing=cls.with_media, image='marketplace/crop_images/orange_1.jpg', position=0),
+            CropImage(listing=cls.with_media, image='marketplace/crop_images/orange (2).jpg', position=1),
+        ])
+        CropListing.objects.create(
+            farmer=farmer, crop_name='Rice', quantity='1 quintal', rate='60.00',
+            location='Nowhere', contact_number='+9779841000011',
+        )
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(CropListing._meta.get_field('video'), 'storage', SignedURLStorage())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = APIRequestFactory().get('/api/marketplace/list/')
+
+    def assertMatchesSerializer(self, fields=None):
+        listings = list(listings_for_read(fields).order_by('id'))
+        expected = CropListingReadSerializer(listings, many=True, fields=fields, context={'request': self.request}).data
+        rows = listing_rows(listings, self.request, fields)
+        self.assertEqual(rows, expected)
+        self.assertEqual([list(row) for row in rows], [list(row) for row in expected])  # key order too
+        self.assertEqual(FastJSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_rows_match_the_read_serializer(self):
+        self.assertMatchesSerializer()
+        self.assertMatchesSerializer(['id', 'crop_name', 'rate', 'thumbnail'])
+        self.assertMatchesSerializer(['farmer', 'images', 'video', 'date_posted'])
+
+    def test_media_urls_use_prefix_only_when_storage_urls_are_uniform(self):
+        urls = MediaURLs(self.request)
+        image, unsafe = self.with_media.images.all()
+        self.assertEqual(urls(image.image), 'http://testserver/media/marketplace/crop_images/orange_1.jpg')
+        self.assertEqual(urls(unsafe.image), self.request.build_absolute_uri(unsafe.image.url))
+        self.assertEqual(urls(self.with_media.video), self.request.build_absolute_uri(self.with_media.video.url))
+        self.assertIsNone(MediaURLs(None)(image.image))
+
+    def test_list_endpoint_uses_the_same_schema(self):
+        response = self.client.get('/api/marketplace/list/', {'near': '26.98,87.34', 'radius': '50'})
+        [row] = response.json()['results']
+        self.assertEqual(list(row), list(CropListingReadSerializer.Meta.fields[:-2]) + ['distance_km'])
+        self.assertEqual(row['rate'], '85.50')
+        self.assertEqual([image['image'].rsplit('/', 1)[1] for image in row['images']], ['orange_1.jpg', 'orange%20(2).jpg'])
+
+
+class PriceStatTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000012', password='x', first_name='Bishnu', last_name='Tamang',
+        )
+        cls.vegetables = Category.objects.create(name='Vegetables')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def listing(self, rate, location='Bharatpur, Chitwan', crop='Tomato'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CropListing.objects.create(
+                farmer=self.farmer, crop_name=crop, category=self.vegetables, quantity='10 kg',
+                rate=rate, location=location, contact_number='+9779841000012',
+            )
+
+    def stat(self, district='Chitwan'):
+        return PriceStat.objects.filter(crop='tomato', district=district).first()
+
+    def test_listing_writes_update_their_groups(self):
+        listings = [self.listing(rate) for rate in ('40.00', '50.00', '60.00', '100.00')]
+        self.listing('45.00', crop='  TOMATO ')  # same crop
+        stat = self.stat()
+        self.assertEqual((stat.count, stat.p25, stat.median, stat.p75),
+                         (5, Decimal('45.00'), Decimal('50.00'), Decimal('60.00')))
+        self.assertEqual(stat.week, week_of(listings[0].date_posted))
+
+        moved = listings[3]
+        moved.location = 'Pokhara'
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.save()
+        self.assertEqual((self.stat().count, self.stat().median), (4, Decimal('47.50')))
+        self.assertEqual(self.stat('Kaski').count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.delete()
+        self.assertIsNone(self.stat('Kaski'))
+
+    def test_rebuild_matches_incremental_updates(self):
+        for rate, location in [('30.00', 'Chitwan'), ('35.50', 'Chitwan'), ('80.00', 'Pokhara')]:
+            self.listing(rate, location)
+        incremental = set(PriceStat.objects.values_list('crop', 'district', 'week', 'count', 'p25', 'median', 'p75'))
+        self.assertEqual(rebuild_price_stats(), 2)
+        rebuilt = set(PriceStat.objects.values_list('crop', 'district', 'week', 'count', 'p25', 'median', 'p75'))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_endpoint_reads_stats_without_touching_listings(self):
+        self.listing('40.00')
+        self.listing('60.00')
+        self.listing('90.00', 'Pokhara')
+        old = self.listing('20.00')
+        CropListing.objects.filter(pk=old.pk).update(date_posted=old.date_posted - timedelta(weeks=20))
+        rebuild_price_stats()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/marketplace/prices/', {'crop': 'tomato', 'district': 'chitwan'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('marketplace_croplisting', ' '.join(q['sql'] for q in queries.captured_queries))
+        [row] = response.json()['results']
+        self.assertEqual((row['count'], row['median'], row['category']), (2, '50.00', 'Vegetables'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/marketplace/prices/', {'crop': 'tomato', 'district': 'chitwan'}).json()['results'], [row])
+        self.assertEqual(len(self.client.get('/api/marketplace/prices/', {'crop': 'Tomato', 'weeks': 52}).json()['results']), 3)
+
+        self.listing('70.00')  # invalidates the cached response
+        self.assertEqual(self.client.get('/api/marketplace/prices/', {'crop': 'tomato', 'district': 'chitwan'}).json()['results'][0]['count'], 3)
+
+    def test_endpoint_rejects_bad_parameters(self):
+        for params, error in [
+            ({}, "crop is required"),
+            ({'crop': 'tomato', 'district': 'Atlantis'}, "Unknown district: Atlantis"),
+            ({'crop': 'tomato', 'weeks': 'many'}, "weeks must be a whole number"),
+        ]:
+            response = self.client.get('/api/marketplace/prices/', params)
+            self.assertEqual((response.status_code, response.json()), (400, {"error": error}), params)
+
+    def test_listings_without_a_category_have_one_row_per_group(self):
+        self.listing('40.00')
+        CropListing.objects.update(category=None)
+        rebuild_price_stats()
+        stat = self.stat()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PriceStat.objects.create(crop=stat.crop, district=stat.district, week=stat.week,
+                                     count=1, p25=1, median=1, p75=1)
+
+
+class ListingResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000005', password='x', first_name='Bishnu', last_name='Gurung',
+        )
+        cls.listing = CropListing.objects.create(
+            farmer=cls.farmer, crop_name='Ginger', quantity='20 kg', rate='150.00',
+            location='Ilam', contact_number='+9779841000005',
+        )
+        cls.other = CropListing.objects.create(
+            farmer=cls.farmer, crop_name='Cardamom', quantity='5 kg', rate='1800.00',
+            location='Ilam', contact_number='+9779841000005',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.detail_url = f'/api/marketplace/listings/{self.listing.pk}/'
+
+    def test_repeat_reads_skip_the_database(self):
+        for url in ['/api/marketplace/list/', self.detail_url]:
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_if_none_match_gets_304(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_writes_invalidate_only_affected_entries(self):
+        list_etag = self.client.get('/api/marketplace/list/')['ETag']
+        detail_etag = self.client.get(self.detail_url)['ETag']
+        other_url = f'/api/marketplace/listings/{self.other.pk}/'
+        self.client.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CropImage.objects.create(listing=self.listing, image='marketplace/crop_images/ginger.jpg')
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['images']), 1)
+        self.assertNotEqual(self.client.get('/api/marketplace/list/')['ETag'], list_etag)
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+    def test_schemes_are_cached_separately(self):
+        CropImage.objects.create(listing=self.listing, image='marketplace/crop_images/ginger.jpg')
+        for secure, scheme in [(False, 'http://'), (True, 'https://')]:
+            image = self.client.get(self.detail_url, secure=secure).json()['images'][0]['image']
+            self.assertTrue(image.startswith(scheme), image)
+
+    def test_farmer_rename_invalidates(self):
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.first_name = 'Bishnu Kumari'
+            self.farmer.save()
+        self.assertEqual(self.client.get(self.detail_url).json()['farmer'], 'Bishnu Kumari Gurung')
+
+
+class SlowStorage(InMemoryStorage):
+    """Stands in for Cloudinary: each upload takes `delay` seconds; names in `fail` raise."""
+
+    def __init__(self, delay=0.2, fail=()):
+        super().__init__()
+        self.delay, self.fail, self.saved, self.deleted = delay, set(fail), [], []
+
+    def _save(self, name, content):
+        time.sleep(self.delay)
+        if os.path.basename(content.name) in self.fail:
+            raise IOError(f"upload of {content.name} failed")
+        self.saved.append(name)
+        return super()._save(name, content)
+
+    def delete(self, name):
+        self.deleted.append(name)
+        super().delete(name)
+
+
+class ListingMediaUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000006', password='x', first_name='Maya', last_name='Tamang',
+        )
+
+    def create_listing(self, storage, image_count):
+        images = [SimpleUploadedFile(f'photo{n}.jpg', f'jpeg bytes {n}'.encode()) for n in range(image_count)]
+        serializer = CropListingSerializer(context={'request': SimpleNamespace(user=self.farmer)})
+        with mock.patch.object(CropImage._meta.get_field('image'), 'storage', storage):
+            return serializer.create({
+                'crop_name': 'Orange', 'category': None, 'quantity': '100 kg', 'rate': '90.00',
+                'location': 'Syangja', 'contact_number': '+9779841000006', 'description': '',
+                'images': images,
+            })
+
+    def test_uploads_run_concurrently_and_rows_insert_in_bulk(self):
+        storage = SlowStorage(delay=0.2)
+        start = time.monotonic()
+        # savepoint, listing INSERT, one bulk image INSERT, release
+        with self.assertNumQueries(4):
+            listing = self.create_listing(storage, image_count=6)
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(listing.images.count(), 6)
+
+    def test_failed_upload_leaves_no_rows_or_orphans(self):
+        storage = SlowStorage(delay=0.05, fail={'photo3.jpg'})
+        with self.assertRaises(IOError):
+            self.create_listing(storage, image_count=5)
+        self.assertFalse(CropListing.objects.filter(farmer=self.farmer).exists())
+        self.assertEqual(len(storage.deleted), 4)
+        self.assertEqual(storage.listdir('marketplace/crop_images')[1], [])
+
+
+def png(name, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ListingImageDiffTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000007', password='x', first_name='Nabin', last_name='Shrestha',
+        )
+        cls.category = Category.objects.create(name='Fruits')
+
+    def setUp(self):
+        self.storage = SlowStorage(delay=0)
+        patcher = mock.patch.object(CropImage._meta.get_field('image'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = SimpleNamespace(user=self.farmer)
+        self.listing = self.save({
+            'crop_name': 'Apple', 'category': 'Fruits', 'quantity': '50 kg', 'rate': '200.00',
+            'location': 'Jumla', 'contact_number': '+9779841000007', 'description': '',
+            'images': [png('red.png', 'red'), png('green.png', 'green'), png('blue.png', 'blue')],
+        })
+        self.storage.saved.clear()
+
+    def save(self, data, instance=None):
+        serializer = CropListingSerializer(instance, data=data, partial=instance is not None,
+                                           context={'request': self.request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def photos(self):
+        return [(image.content_hash, image.position) for image in self.listing.images.all()]
+
+    def wait_for_deletes(self, count):
+        deadline = time.monotonic() + 2
+        while len(self.storage.deleted) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.storage.deleted
+
+    def test_unchanged_photos_are_not_uploaded_again(self):
+        red, green = list(self.listing.images.all())[:2]
+        self.save({'images': [png('again.png', 'green'), png('yellow.png', 'yellow'), png('red2.png', 'red')]},
+                  self.listing)
+
+        self.assertEqual(len(self.storage.saved), 1)
+        images = list(self.listing.images.all())
+        self.assertEqual([image.id for image in images][0::2], [green.id, red.id])
+        self.assertEqual([image.position for image in images], [0, 1, 2])
+        self.assertEqual(len(self.wait_for_deletes(1)), 1)  # blue
+
+    def test_image_order_reorders_and_drops_without_files(self):
+        red, green, blue = self.listing.images.all()
+        self.save({'image_order': [str(blue.id), str(red.id)]}, self.listing)
+
+        self.assertEqual(self.storage.saved, [])
+        self.assertEqual([image.id for image in self.listing.images.all()], [blue.id, red.id])
+        self.assertEqual(self.wait_for_deletes(1), [green.image.name])
+
+    def test_image_order_mixes_kept_and_new_photos(self):
+        red = self.listing.images.first()
+        self.save({'images': [png('white.png', 'white')], 'image_order': ['new:0', str(red.id)]}, self.listing)
+        images = list(self.listing.images.all())
+        self.assertEqual(len(self.storage.saved), 1)
+        self.assertEqual(images[1].id, red.id)
+        self.assertEqual(len(images), 2)
+
+    def test_image_order_rejects_foreign_ids(self):
+        serializer = CropListingSerializer(self.listing, data={'image_order': ['999999']}, partial=True,
+                                           context={'request': self.request})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('image_order', serializer.errors)
+
+
+class VideoUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = get_user_model().objects.create_user(
+            phone='+9779841000008', password='x', first_name='Sunita', last_name='Bhandari',
+        )
+        cls.listing = CropListing.objects.create(
+            farmer=cls.farmer, crop_name='Tea', quantity='10 kg', rate='700.00',
+            location='Ilam', contact_number='+9779841000008',
+        )
+
+    def setUp(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        overrides = self.settings(MARKETPLACE_VIDEO_UPLOAD_DIR=upload_dir, MARKETPLACE_VIDEO_CHUNK_SIZE=1024)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.storage = InMemoryStorage()
+        patcher = mock.patch.object(CropListing._meta.get_field('video'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+        self.video = os.urandom(2500)
+
+    def start(self, **extra):
+        response = self.client.post(
+            f'/api/marketplace/listings/{self.listing.pk}/video-uploads/',
+            {'filename': 'harvest.mp4', 'size': len(self.video), **extra}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return f"/api/marketplace/video-uploads/{response.json()['id']}/"
+
+    def put_chunk(self, url, offset, data, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum is not False:
+            headers['HTTP_UPLOAD_CHECKSUM'] = f"sha256 {checksum or hashlib.sha256(data).hexdigest()}"
+        return self.client.put(url, data, content_type='application/offset+octet-stream', **headers)
+
+    def test_chunks_assemble_into_the_listing_video(self):
+        url = self.start(sha256=hashlib.sha256(self.video).hexdigest())
+        with mock.patch('marketplace.video_uploads.schedule_finish') as schedule:
+            for offset in range(0, len(self.video), 1024):
+                response = self.put_chunk(url, offset, self.video[offset:offset + 1024])
+                self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], VideoUpload.PROCESSING)
+
+        finish_upload(*schedule.call_args.args)
+        self.listing.refresh_from_db()
+        with self.storage.open(self.listing.video.name) as f:
+            self.assertEqual(f.read(), self.video)
+        self.assertEqual(self.client.get(url).json()['status'], VideoUpload.COMPLETE)
+
+    def finished_upload(self):
+        url = self.start()
+        with mock.patch('marketplace.video_uploads.schedule_finish'):
+            for offset in range(0, len(self.video), 1024):
+                self.put_chunk(url, offset, self.video[offset:offset + 1024])
+        return VideoUpload.objects.get(status=VideoUpload.PROCESSING)
+
+    def test_cleanup_takes_over_only_stalled_uploads(self):
+        upload = self.finished_upload()
+        claim_upload(upload.pk)  # a worker is storing it
+        out = io.StringIO()
+        call_command('cleanup_video_uploads', stdout=out)
+        self.assertIn("stored 0 stuck uploads", out.getvalue())
+        self.assertEqual(VideoUpload.objects.get().status, VideoUpload.PROCESSING)
+
+        # The worker died: its heartbeat stopped refreshing updated_at.
+        VideoUpload.objects.update(updated_at=timezone.now() - timedelta(minutes=31))
+        call_command('cleanup_video_uploads', stdout=out)
+        self.assertIn("stored 1 stuck uploads", out.getvalue())
+        self.assertEqual(VideoUpload.objects.get().status, VideoUpload.COMPLETE)
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.video)
+
+    def test_taken_over_upload_is_not_attached_twice(self):
+        upload = self.finished_upload()
+        store_video = video_uploads._store_video
+
+        def store_while_taken_over(upload):
+            name = store_video(upload)
+            claim_upload(upload.pk)  # cleanup took over meanwhile
+            return name
+
+        with mock.patch('marketplace.video_uploads._store_video', side_effect=store_while_taken_over):
+            self.assertFalse(finish_upload(upload.pk))
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.video)
+        self.assertEqual(VideoUpload.objects.get().status, VideoUpload.PROCESSING)
+
+    def test_resume_after_rejected_chunks(self):
+        url = self.start()
+        self.assertEqual(self.put_chunk(url, 0, self.video[:1024]).status_code, 200)
+
+        wrong_offset = self.put_chunk(url, 2048, self.video[2048:])
+        self.assertEqual(wrong_offset.status_code, 409)
+        self.assertEqual(wrong_offset['Upload-Offset'], '1024')
+
+        corrupted = self.put_chunk(url, 1024, self.video[1024:2048], checksum='0' * 64)
+        self.assertEqual(corrupted.status_code, 400)
+        self.assertEqual(self.client.get(url).json()['offset'], 1024)
+
+        self.assertEqual(self.put_chunk(url, 1024, self.video[1024:2048]).json()['offset'], 2048)
+
+    def test_oversized_chunk_is_refused(self):
+        url = self.start()
+        self.assertEqual(self.put_chunk(url, 0, self.video[:2000]).status_code, 413)
+
+    def test_only_the_listing_owner_can_upload(self):
+        other = get_user_model().objects.create_user(phone='+9779841000009', password='x')
+        self.client.force_authenticate(other)
+        response = self.client.post(
+            f'/api/marketplace/listings/{self.listing.pk}/video-uploads/',
+            {'filename': 'x.mp4', 'size': 10}, format='json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+def news_article(title):
+    return {'title': title, 'description': f"{title} in Nepal", 'publishedAt': '2026-10-01T00:00:00Z'}
+
+
+class AsyncNewsViewTests(SimpleTestCase):
+    def fetch(self, aget):
+        request = RequestFactory().get('/api/marketplace/news/')
+        with mock.patch('marketplace.async_views.upstream.aget', side_effect=aget) as aget_mock:
+            response = async_to_sync(async_views.NepalNewsAPIView.as_view())(request)
+        return json.loads(response.content), aget_mock
+
+    def test_queries_run_concurrently_and_are_merged(self):
+        async def aget(name, path, params=None, **kwargs):
+            await asyncio.sleep(0.1)
+            title = 'Headline' if path == '/v2/top-headlines' else params['q']
+            data = {'status': 'ok', 'articles': [news_article(title)]}
+            return httpx.Response(200, json=data, request=httpx.Request('GET', 'https://newsapi.test/'))
+
+        start = time.monotonic()
+        data, aget_mock = self.fetch(aget)
+        self.assertLess(time.monotonic() - start, 0.3)  # six requests of 0.1 s each
+        self.assertEqual(aget_mock.await_count, 6)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(
+            sorted(article['title'] for article in data['articles']),
+            ['Headline', 'Nepal', 'Nepal development', 'Nepal economy', 'Nepal news', 'Nepal politics'],
+        )
+
+    def test_failed_queries_are_skipped(self):
+        async def aget(name, path, params=None, **kwargs):
+            if params.get('q') != 'Nepal':
+                raise requests.exceptions.ConnectionError("refused")
+            data = {'status': 'ok', 'articles': [news_article('Nepal')]}
+            return httpx.Response(200, json=data, request=httpx.Request('GET', 'https://newsapi.test/'))
+
+        data, _aget = self.fetch(aget)
+        self.assertEqual([article['title'] for article in data['articles']], ['Nepal'])
+
+    def test_no_articles(self):
+        async def aget(name, path, params=None, **kwargs):
+            raise requests.exceptions.ConnectionError("refused")
+
+        data, _aget = self.fetch(aget)
+        self.assertEqual(data, {
+            'status': 'error', 'message': 'No Nepal news found. Please try again later.', 'articles': [],
+        })
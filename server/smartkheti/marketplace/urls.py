@@ -1,9 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from .views import CropListingView, MyListingsView,NepalNewsAPIView
+from . import async_views
+from .views import (
+    CropListingView, ListingFacetsView, MyListingsView, NepalNewsAPIView, PriceStatsView, VideoUploadStartView,
+    VideoUploadView,
+)
+
+# The news view waits on NewsAPI; run it as a native async view in ASGI mode.
+news_view = async_views.NepalNewsAPIView if settings.ASYNC_VIEWS else NepalNewsAPIView
 
 urlpatterns = [
     path('list/', CropListingView.as_view(), name='listings-create-list'),
+    path('facets/', ListingFacetsView.as_view(), name='listing-facets'),
+    path('prices/', PriceStatsView.as_view(), name='price-stats'),
     path('listings/my/', MyListingsView.as_view(), name='my-listings'),       
     path('listings/<int:pk>/', CropListingView.as_view(), name='listings-detail-update-delete'),  
-      path('news/', NepalNewsAPIView.as_view(), name='nepal_news'),
+    path('listings/<int:pk>/video-uploads/', VideoUploadStartView.as_view(), name='listing-video-upload-start'),
+    path('video-uploads/<uuid:upload_id>/', VideoUploadView.as_view(), name='listing-video-upload'),
+      path('news/', news_view.as_view(), name='nepal_news'),
 ]
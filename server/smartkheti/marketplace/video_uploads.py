@@ -0,0 +1,255 @@
+"""
+Resumable chunked uploads of listing videos.
+
+Each chunk is streamed from the request into a temporary part file at its
+offset, one small block at a time, so a worker's memory stays bounded
+whatever the size of the video and no request body is buffered whole. A
+client that loses its connection asks for the current offset and carries on
+from there. When the last byte arrives, a background job checks the
+whole-file checksum, stores the file through the listing's video storage
+(Cloudinary) and sets it on the listing. That job claims the upload with a
+token and refreshes `updated_at` while it works, so cleanup_video_uploads
+only takes over uploads whose worker has stopped.
+
+Part files live on the local disk of the host that received them, so with
+several hosts the upload endpoints need sticky routing or a shared
+MARKETPLACE_VIDEO_UPLOAD_DIR.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from core import metrics
+from .media import delete_stored_later
+from .models import CropListing, VideoUpload
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 64 * 1024
+HEARTBEAT_INTERVAL = 60  # seconds between claim refreshes while storing
+
+# Storing finished videos is slow network I/O; keep it off the request path.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='video-upload')
+
+
+class ChunkRejected(Exception):
+    """A chunk that cannot be applied; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload):
+    return os.path.join(settings.MARKETPLACE_VIDEO_UPLOAD_DIR, f'{upload.id}.part')
+
+
+def start_upload(listing, filename, size, sha256=''):
+    upload = VideoUpload.objects.create(listing=listing, filename=filename, size=size, sha256=sha256)
+    os.makedirs(settings.MARKETPLACE_VIDEO_UPLOAD_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    metrics.incr('marketplace.video_upload.started')
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Append `length` bytes read from `stream` at `offset`, which must equal the
+    bytes received so far. With a `checksum` (SHA-256 hex of the chunk) a
+    corrupted or incomplete chunk is discarded; without one, whatever
+    arrived before a dropped connection is kept. Returns the new offset.
+    """
+    if upload.status != VideoUpload.UPLOADING:
+        raise ChunkRejected(f"Upload is {upload.status}, not accepting data", 409)
+    if length > settings.MARKETPLACE_VIDEO_CHUNK_SIZE:
+        raise ChunkRejected(f"Chunks may be at most {settings.MARKETPLACE_VIDEO_CHUNK_SIZE} bytes", 413)
+    if offset + length > upload.size:
+        raise ChunkRejected(f"Chunk runs past the declared size of {upload.size} bytes", 400)
+
+    try:
+        part = open(part_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise ChunkRejected("Upload data is no longer available; start a new upload", 410)
+
+    with part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ChunkRejected("Another chunk of this upload is being written", 409)
+        try:
+            # Another worker may have applied a chunk while we waited for the lock.
+            upload.refresh_from_db(fields=['offset', 'status'])
+            if offset != upload.offset:
+                raise ChunkRejected(f"Expected offset {upload.offset}", 409)
+
+            written, digest = _copy(stream, part, offset, length)
+            if checksum and (written != length or digest.hexdigest() != checksum.lower()):
+                part.truncate(offset)
+                metrics.incr('marketplace.video_upload.rejected_chunks')
+                raise ChunkRejected("Chunk checksum mismatch or incomplete chunk; resend it", 400)
+            part.flush()
+            os.fsync(part.fileno())  # on disk before the offset says so
+
+            new_offset = offset + written
+            VideoUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=new_offset, updated_at=timezone.now(),
+            )
+            upload.offset = new_offset
+        finally:
+            fcntl.flock(part, fcntl.LOCK_UN)
+
+    metrics.incr('marketplace.video_upload.bytes', written)
+    if upload.offset == upload.size:
+        VideoUpload.objects.filter(pk=upload.pk).update(status=VideoUpload.PROCESSING, updated_at=timezone.now())
+        upload.status = VideoUpload.PROCESSING
+        schedule_finish(upload.pk)
+    return upload.offset
+
+
+def _copy(stream, part, offset, length):
+    """Copy up to `length` bytes in blocks; stops early if the client disconnects."""
+    part.seek(offset)
+    digest = hashlib.sha256()
+    written = 0
+    while written < length:
+        try:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+        except OSError:
+            block = b''
+        if not block:
+            break
+        part.write(block)
+        digest.update(block)
+        written += len(block)
+    return written, digest
+
+
+def schedule_finish(upload_id):
+    transaction.on_commit(lambda: _executor.submit(_run_finish, upload_id))
+
+
+def _run_finish(upload_id):
+    close_old_connections()
+    try:
+        finish_upload(upload_id)
+    except Exception as e:
+        logger.error(f"Could not store video upload {upload_id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def claim_upload(upload_id, stale_before=None):
+    """
+    Take over storing a processing upload; returns a claim token, or None if
+    the upload is not processing. With `stale_before`, an upload whose claim
+    was refreshed since then is left to the worker holding it.
+    """
+    token = uuid.uuid4()
+    uploads = VideoUpload.objects.filter(pk=upload_id, status=VideoUpload.PROCESSING)
+    if stale_before is not None:
+        uploads = uploads.filter(updated_at__lt=stale_before)
+    if not uploads.update(claim=token, updated_at=timezone.now()):
+        return None
+    return token
+
+
+@contextmanager
+def _heartbeat(upload_id, token):
+    """Keep refreshing the claim's `updated_at` in a side thread while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                VideoUpload.objects.filter(pk=upload_id, claim=token).update(updated_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'video-upload-heartbeat-{upload_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish_upload(upload_id, stale_before=None):
+    """
+    Verify the assembled file, store it as the listing's video and remove the
+    part file. Only the worker holding the upload's claim stores it; see
+    claim_upload for `stale_before`. Returns False if the upload could not be
+    claimed or the claim was taken over before the video was set. A failure
+    marks the upload failed and is re-raised.
+    """
+    token = claim_upload(upload_id, stale_before)
+    if token is None:
+        return False
+    claimed = VideoUpload.objects.filter(pk=upload_id, claim=token)
+
+    try:
+        upload = VideoUpload.objects.select_related('listing').get(pk=upload_id)
+        with _heartbeat(upload_id, token):
+            name = _store_video(upload)
+    except Exception as e:
+        metrics.incr('marketplace.video_upload.failed')
+        claimed.update(status=VideoUpload.FAILED, error=str(e)[:1000], updated_at=timezone.now())
+        raise
+
+    listing = upload.listing
+    field = CropListing._meta.get_field('video')
+    with transaction.atomic():
+        if not claimed.select_for_update().filter(status=VideoUpload.PROCESSING).exists():
+            # Another worker took over after our heartbeat lapsed; it sets the video.
+            delete_stored_later([(field, name)])
+            return False
+        previous = listing.video.name if listing.video else None
+        listing.video = name
+        listing.save(update_fields=['video'])
+        claimed.update(status=VideoUpload.COMPLETE, updated_at=timezone.now())
+
+    os.remove(part_path(upload))
+    metrics.incr('marketplace.video_upload.completed')
+    if previous and previous != name:
+        delete_stored_later([(field, previous)])
+    return True
+
+
+def _store_video(upload):
+    """Check the assembled file and save it to the video storage; returns the stored name."""
+    path = part_path(upload)
+
+    if upload.sha256:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+        if digest.hexdigest() != upload.sha256.lower():
+            raise ValueError("Checksum of the assembled file does not match")
+
+    listing = upload.listing
+    field = CropListing._meta.get_field('video')
+    with metrics.timer('marketplace.video_upload.store_ms'), open(path, 'rb') as f:
+        name = field.storage.save(
+            field.generate_filename(listing, upload.filename), File(f, name=upload.filename),
+            max_length=field.max_length,
+        )
+    return name
+
+
+def discard_upload(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
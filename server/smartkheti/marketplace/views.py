@@ -2,35 +2,116 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.renderers import BrowsableAPIRenderer
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+
+from .facets import facet_counts, filter_listings, grouped_counts, parse_filters
+from .geo import parse_near
+from .models import CropListing, PriceStat, VideoUpload, crop_key
+from .pagination import ListingCursorPagination, NearbyListingPagination, RankedListingPagination
+from .prices import week_of
+from .response_cache import cached_response, detail_cache_key, list_cache_key, prices_cache_key
+from .search import search_listings
+from .renderers import FastJSONRenderer
+from .serializers import CropListingSerializer, CropListingReadSerializer, listing_rows
+from .video_uploads import ChunkRejected, discard_upload, start_upload, write_chunk
+
+LISTING_FIELDS = CropListingReadSerializer.Meta.fields
+
+# Columns each read field needs beyond its own, so `fields=` loads only those.
+FIELD_COLUMNS = {
+    'farmer': ['farmer__first_name', 'farmer__last_name'],
+    'category': ['category__name'],
+    'images': [],
+    'thumbnail': [],
+    'distance_km': [],
+}
+
+
+def requested_fields(request):
+    """
+    Field names from ?fields=id,crop_name,..., or None for the full listing.
+    Raises ValueError naming any unknown field.
+    """
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in LISTING_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(LISTING_FIELDS)}")
+    return fields
+
+
+def listings_for_read(fields=None):
+    """
+    Listings with everything CropListingReadSerializer touches (farmer,
+    category, images) loaded up front, so serializing N listings costs a
+    constant number of queries. With `fields`, only what those fields need
+    is loaded.
+    """
+    queryset = CropListing.objects.all()
+    if fields is None:
+        return queryset.select_related('farmer', 'category').prefetch_related('images')
+
+    related = [name for name in ('farmer', 'category') if name in fields]
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'images' in fields or 'thumbnail' in fields:
+        queryset = queryset.prefetch_related('images')
+
+    columns = {'id', 'date_posted'}  # always needed for pagination
+    for name in fields:
+        columns.update(FIELD_COLUMNS.get(name, [name]))
+    return queryset.only(*columns)
 
-from .models import CropListing
-from .serializers import CropListingSerializer, CropListingReadSerializer
 
 class CropListingView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, pk=None):
+        try:
+            fields = requested_fields(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Served from the response cache until the listings involved change.
         if pk:
-            listing = get_object_or_404(CropListing, pk=pk)
-            # 🔧 FIXED: Pass request context
-            serializer = CropListingReadSerializer(listing, context={'request': request})
-            return Response(serializer.data)
+            return cached_response(request, detail_cache_key(request, pk), lambda: self.detail(request, pk, fields))
+        return cached_response(request, list_cache_key(request), lambda: self.list_page(request, fields))
+
+    def detail(self, request, pk, fields):
+        listing = get_object_or_404(listings_for_read(fields), pk=pk)
+        # 🔧 FIXED: Pass request context
+        serializer = CropListingReadSerializer(listing, fields=fields, context={'request': request})
+        return Response(serializer.data)
+
+    def list_page(self, request, fields):
+        try:
+            selection = parse_filters(request.query_params)
+            near = parse_near(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        searchquery = request.query_params.get('searchquery')
+
+        queryset = filter_listings(listings_for_read(fields), selection)
+        if searchquery:
+            queryset = search_listings(queryset, searchquery)
+        # Nearest first with near=, else best match first with a searchquery,
+        # else newest first. One page per request, `next` links to the following page.
+        if near:
+            paginator = NearbyListingPagination(*near)
+        elif searchquery:
+            paginator = RankedListingPagination()
         else:
-            searchquery = request.query_params.get('searchquery')
-
-            queryset = CropListing.objects.all().order_by('-date_posted')
-            if searchquery:
-                queryset = queryset.filter(
-                    Q(crop_name__icontains=searchquery) |
-                    Q(location__icontains=searchquery) |
-                    Q(description__icontains=searchquery)
-                )
-
-            # 🔧 FIXED: Pass request context
-            serializer = CropListingReadSerializer(queryset, many=True, context={'request': request})
-            return Response(serializer.data)
+            paginator = ListingCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        # Same output as CropListingReadSerializer, built without DRF's per-field overhead.
+        return paginator.get_paginated_response(listing_rows(page, request, fields))
 
     def post(self, request):
         if not request.user.is_authenticated:
@@ -71,11 +152,178 @@ class CropListingView(APIView):
         return Response({"detail": "Listing deleted."}, status=status.HTTP_204_NO_CONTENT)
 
 
+class ListingFacetsView(APIView):
+    """
+    Counts per category, district and rate band for the filter sidebar. Takes
+    the same filter parameters as the listing list; without a searchquery the
+    counts come from cache.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            selection = parse_filters(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = None
+        searchquery = request.query_params.get('searchquery')
+        if searchquery:
+            matching = search_listings(CropListing.objects.all(), searchquery)
+            rows = grouped_counts(CropListing.objects.filter(id__in=matching.values('id')))
+        return Response(facet_counts(selection, rows))
+
+
+class PriceStatsView(APIView):
+    """
+    Weekly price ranges of a crop, newest week first, e.g.
+    ?crop=tomato&district=Chitwan&category=Vegetables&weeks=8 (district and
+    category take comma lists). Reads precomputed PriceStat rows, never the
+    listings themselves, and is served from the response cache.
+    """
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    default_weeks = 8
+    max_weeks = 52
+
+    def get(self, request):
+        return cached_response(request, prices_cache_key(request), lambda: self.stats(request))
+
+    def stats(self, request):
+        crop = crop_key(request.query_params.get('crop'))
+        if not crop:
+            return Response({"error": "crop is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            selection = parse_filters(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            weeks = int(request.query_params.get('weeks') or self.default_weeks)
+        except ValueError:
+            return Response({"error": "weeks must be a whole number"}, status=status.HTTP_400_BAD_REQUEST)
+        weeks = max(1, min(weeks, self.max_weeks))
+
+        first_week = week_of(timezone.now()) - timedelta(weeks=weeks - 1)
+        rows = PriceStat.objects.filter(crop=crop, week__gte=first_week).select_related('category')
+        if 'district' in selection:
+            rows = rows.filter(district__in=selection['district'])
+        if 'category' in selection:
+            rows = rows.filter(category__name__in=selection['category'])
+
+        return Response({
+            "crop": crop,
+            "results": [
+                {
+                    "week": row.week.isoformat(),
+                    "category": row.category.name if row.category else None,
+                    "district": row.district,
+                    "count": row.count,
+                    "p25": str(row.p25),
+                    "median": str(row.median),
+                    "p75": str(row.p75),
+                }
+                for row in rows.order_by('-week', 'district', 'category__name')
+            ],
+        })
+
+
+def upload_status(upload):
+    return {
+        "id": str(upload.id),
+        "listing": upload.listing_id,
+        "size": upload.size,
+        "offset": upload.offset,
+        "status": upload.status,
+        "error": upload.error,
+        "chunk_size": settings.MARKETPLACE_VIDEO_CHUNK_SIZE,
+    }
+
+
+class VideoUploadStartView(APIView):
+    """
+    Start a resumable video upload for a listing: POST {filename, size,
+    sha256 (optional, of the whole file)}. Then PUT each chunk of at most
+    chunk_size bytes to /video-uploads/<id>/ as the raw request body, with
+    an Upload-Offset header and optionally "Upload-Checksum: sha256 <hex>".
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        listing = get_object_or_404(CropListing, pk=pk)
+        if listing.farmer != request.user:
+            raise PermissionDenied("You can only upload videos to your own listings.")
+
+        filename = str(request.data.get('filename') or '').strip()
+        sha256 = str(request.data.get('sha256') or '').strip().lower()
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+        if not filename or size <= 0:
+            return Response({"error": "filename and a positive size are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if size > settings.MARKETPLACE_VIDEO_MAX_SIZE:
+            return Response({
+                "error": f"Videos may be at most {settings.MARKETPLACE_VIDEO_MAX_SIZE} bytes"
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+            return Response({"error": "sha256 must be a hex SHA-256 digest"}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = start_upload(listing, filename[:255], size, sha256)
+        return Response(upload_status(upload), status=status.HTTP_201_CREATED)
+
+
+class VideoUploadView(APIView):
+    """
+    GET the upload's progress (to learn where to resume), PUT the next
+    chunk, or DELETE to abandon it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_upload(self, request, upload_id):
+        return get_object_or_404(VideoUpload, pk=upload_id, listing__farmer=request.user)
+
+    def get(self, request, upload_id):
+        return Response(upload_status(self.get_upload(request, upload_id)))
+
+    def put(self, request, upload_id):
+        upload = self.get_upload(request, upload_id)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset and Content-Length headers are required"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        checksum = None
+        if request.headers.get('Upload-Checksum'):
+            algorithm, _, checksum = request.headers['Upload-Checksum'].partition(' ')
+            if algorithm.lower() != 'sha256' or not checksum:
+                return Response({"error": "Upload-Checksum must be 'sha256 <hex digest>'"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Read from the raw request stream; the body is never loaded whole.
+            write_chunk(upload, offset, request.stream, length, checksum.strip() if checksum else None)
+        except ChunkRejected as e:
+            response = Response({"error": str(e), **upload_status(upload)}, status=e.status)
+        else:
+            response = Response(upload_status(upload))
+        response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    def delete(self, request, upload_id):
+        upload = self.get_upload(request, upload_id)
+        if upload.status == VideoUpload.PROCESSING:
+            return Response({"error": "Upload is already being stored"}, status=status.HTTP_409_CONFLICT)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class MyListingsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        listings = CropListing.objects.filter(farmer=request.user).order_by('-date_posted')
+        listings = listings_for_read().filter(farmer=request.user).order_by('-date_posted')
         # 🔧 FIXED: Pass request context
         serializer = CropListingReadSerializer(listings, many=True, context={'request': request})
         return Response(serializer.data)
@@ -86,7 +334,6 @@ class MyListingsView(APIView):
 
 
 ###News
-import requests
 from django.http import JsonResponse
 from django.views import View
 from django.utils.decorators import method_decorator
@@ -94,6 +341,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import json
 from datetime import datetime, timedelta
+from core import upstream
 
 @method_decorator(csrf_exempt, name='dispatch')
 class NepalNewsAPIView(View):
@@ -144,31 +392,37 @@ class NepalNewsAPIView(View):
         Handle GET requests to fetch Nepal news
         """
         try:
-            all_articles = self.fetch_all_articles()
-            
-            if not all_articles:
-                return JsonResponse({
-                    "status": "error",
-                    "message": "No Nepal news found. Please try again later.",
-                    "articles": []
-                })
-            
-            # Process and filter articles
-            filtered_news = self.process_articles(all_articles)
-            
-            return JsonResponse({
-                "status": "success",
-                "articles": filtered_news,
-                "total": len(filtered_news),
-                "message": f"Found {len(filtered_news)} Nepal news articles"
-            })
-            
+            return self.news_response(self.fetch_all_articles())
         except Exception as e:
+            return self.failure_response(e)
+
+    def news_response(self, all_articles):
+        """
+        Build the JSON response from the raw fetched articles
+        """
+        if not all_articles:
             return JsonResponse({
                 "status": "error",
-                "message": f"Failed to fetch news: {str(e)}",
+                "message": "No Nepal news found. Please try again later.",
                 "articles": []
             })
+        
+        # Process and filter articles
+        filtered_news = self.process_articles(all_articles)
+        
+        return JsonResponse({
+            "status": "success",
+            "articles": filtered_news,
+            "total": len(filtered_news),
+            "message": f"Found {len(filtered_news)} Nepal news articles"
+        })
+
+    def failure_response(self, error):
+        return JsonResponse({
+            "status": "error",
+            "message": f"Failed to fetch news: {str(error)}",
+            "articles": []
+        })
 
     def fetch_all_articles(self):
         """
@@ -193,37 +447,52 @@ class NepalNewsAPIView(View):
         Fetch headlines specifically for Nepal country
         """
         try:
-            country_url = f"https://newsapi.org/v2/top-headlines?country=np&pageSize=20&apiKey={self.API_KEY}"
-            country_response = requests.get(country_url, timeout=10)
-            country_data = country_response.json()
-            
-            if country_data.get("status") == "ok" and country_data.get("articles"):
-                return country_data["articles"]
+            country_response = upstream.get('newsapi', '/v2/top-headlines', params=self.headlines_params())
+            return self.headlines_from(country_response.json())
         except Exception as e:
             print(f"Failed to fetch Nepal country headlines: {e}")
         
         return []
 
+    def headlines_params(self):
+        return {
+            'country': 'np',
+            'pageSize': 20,
+            'apiKey': self.API_KEY,
+        }
+
+    def headlines_from(self, country_data):
+        if country_data.get("status") == "ok" and country_data.get("articles"):
+            return country_data["articles"]
+        return []
+
     def fetch_query_articles(self, query, from_date):
         """
         Fetch articles for a specific search query
         """
         try:
-            url = f"https://newsapi.org/v2/everything?q={query}&sortBy=publishedAt&pageSize=10&from={from_date}&apiKey={self.API_KEY}"
-            response = requests.get(url, timeout=10)
-            query_data = response.json()
-            
-            if query_data.get("status") == "error":
-                print(f"API error for query {query}: {query_data.get('message')}")
-                return []
-            
-            if query_data.get("articles"):
-                return query_data["articles"]
+            response = upstream.get('newsapi', '/v2/everything', params=self.query_params(query, from_date))
+            return self.query_articles_from(query, response.json())
         except Exception as e:
             print(f"Failed to fetch for query: {query} - {e}")
         
         return []
 
+    def query_params(self, query, from_date):
+        return {
+            'q': query.replace('+', ' '),
+            'sortBy': 'publishedAt',
+            'pageSize': 10,
+            'from': from_date,
+            'apiKey': self.API_KEY,
+        }
+
+    def query_articles_from(self, query, query_data):
+        if query_data.get("status") == "error":
+            print(f"API error for query {query}: {query_data.get('message')}")
+            return []
+        return query_data.get("articles") or []
+
     def process_articles(self, all_articles):
         """
         Remove duplicates and filter for Nepal-related content
@@ -47,6 +47,10 @@ class User(AbstractUser):
     district = models.CharField(max_length=50, blank=True, null=True)
     municipality = models.CharField(max_length=100, blank=True, null=True)
     ward_number = models.PositiveSmallIntegerField(blank=True, null=True)
+    # Filled in the background from the address fields above (see weather.signals).
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    resolved_location = models.CharField(max_length=255, blank=True, null=True)
 
     profile_photo = models.ImageField(upload_to='profiles/', null=True, blank=True)
     preferred_language = models.CharField(
@@ -81,4 +85,24 @@ class OTPrequest(models.Model):
             return True
         else:
             return False
-        
\ No newline at end of file
+
+
+class Tombstone(models.Model):
+    """
+    A deleted listing or detection record, kept so the sync endpoint can tell
+    clients to drop their copy. The owner is a plain id rather than a foreign
+    key: tombstones are written while a user's rows are being cascade-deleted.
+    """
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.BigIntegerField()
+    owner_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'model', 'deleted_at'], name='tombstone_owner_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
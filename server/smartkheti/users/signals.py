@@ -0,0 +1,26 @@
+"""
+Tombstones for deleted rows that clients mirror through the sync endpoint
+(see sync.py). Queryset deletes send post_delete per row too, so bulk
+deletions are recorded as well.
+"""
+from django.db.models.signals import post_delete
+
+from disease_detection.models import DetectionRecord
+from marketplace.models import CropListing
+from .models import Tombstone
+
+# Synced model -> attribute holding the owning user's id.
+OWNERS = {
+    CropListing: 'farmer_id',
+    DetectionRecord: 'user_id',
+}
+
+
+def record_deletion(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model=sender._meta.label_lower, object_id=instance.pk, owner_id=getattr(instance, OWNERS[sender]),
+    )
+
+
+for model in OWNERS:
+    post_delete.connect(record_deletion, sender=model, dispatch_uid=f'tombstone_{model._meta.label_lower}')
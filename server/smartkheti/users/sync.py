@@ -0,0 +1,90 @@
+"""
+Delta sync of a user's own records: their marketplace listings and disease
+detection history.
+
+A sync token is an opaque server timestamp. With one, only rows saved since
+then (by `updated_at`) and the ids of rows deleted since then (tombstones)
+are returned, so a client that keeps its lists locally downloads just what
+changed. Each sync re-sends SYNC_OVERLAP worth of earlier changes so rows
+whose transaction committed after a token was issued are not missed;
+clients apply changes as idempotent upserts. Without a token, or with one
+older than the tombstones are kept, everything is sent and `full` is true.
+"""
+import base64
+import binascii
+from dataclasses import dataclass
+from typing import Callable
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from disease_detection.models import DetectionRecord
+from disease_detection.serializers import DetectionRecordSerializer
+from marketplace.models import CropListing
+from marketplace.serializers import listing_rows
+from marketplace.views import listings_for_read
+from .models import Tombstone
+
+
+@dataclass(frozen=True)
+class Collection:
+    model: type
+    owner_field: str
+    queryset: Callable
+    ordering: tuple
+    serialize: Callable  # (rows, request) -> list of dicts
+
+
+COLLECTIONS = {
+    # Same representation as /marketplace/listings/my/.
+    'listings': Collection(
+        CropListing, 'farmer', listings_for_read, ('-date_posted', '-id'),
+        lambda rows, request: listing_rows(rows, request),
+    ),
+    # Same representation as /disease_detection/detection-history/.
+    'detections': Collection(
+        DetectionRecord, 'user', DetectionRecord.objects.all, ('-detected_at', '-id'),
+        lambda rows, request: DetectionRecordSerializer(rows, many=True, context={'request': request}).data,
+    ),
+}
+
+
+def encode_token(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode('ascii')).decode('ascii')
+
+
+def decode_token(token):
+    """The moment a token was issued; raises ValueError for malformed tokens."""
+    try:
+        moment = parse_datetime(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+    except (binascii.Error, UnicodeError, ValueError):
+        moment = None
+    if moment is None or timezone.is_naive(moment):
+        raise ValueError("Invalid sync token")
+    return moment
+
+
+def changes(user, request, since=None, names=COLLECTIONS):
+    """Rows of each named collection changed or deleted since the `since` datetime (None for all)."""
+    now = timezone.now()
+    full = since is None or since < now - settings.SYNC_TOMBSTONE_RETENTION
+    after = None if full else since - settings.SYNC_OVERLAP
+
+    result = {'token': encode_token(now), 'full': full}
+    for name in names:
+        collection = COLLECTIONS[name]
+        rows = collection.queryset().filter(**{collection.owner_field: user})
+        deleted = []
+        if after is not None:
+            rows = rows.filter(updated_at__gte=after)
+            deleted = sorted(set(
+                Tombstone.objects.filter(
+                    owner_id=user.pk, model=collection.model._meta.label_lower, deleted_at__gte=after,
+                ).values_list('object_id', flat=True)
+            ))
+        result[name] = {
+            'changed': collection.serialize(rows.order_by(*collection.ordering), request),
+            'deleted': deleted,
+        }
+    return result
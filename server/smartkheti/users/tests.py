@@ -1,3 +1,96 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from disease_detection.models import DetectionRecord
+from marketplace.models import CropImage, CropListing
+from .models import Tombstone, User
+from .sync import encode_token
+
+
+@override_settings(SYNC_OVERLAP=timedelta(0))
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user(phone='+9779841000020', password='x', first_name='Hari')
+        cls.other = User.objects.create_user(phone='+9779841000021', password='x', first_name='Sita')
+        cls.listings = [
+            CropListing.objects.create(
+                farmer=farmer, crop_name=crop, quantity='5 kg', rate='30.00',
+                location='Chitwan', contact_number='+9779841000020',
+            )
+            for farmer, crop in [(cls.farmer, 'Okra'), (cls.farmer, 'Bitter gourd'), (cls.other, 'Okra')]
+        ]
+        cls.detection = DetectionRecord.objects.create(
+            user=cls.farmer, image='detections/leaf.jpg', detected_disease='Tomato Early blight',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+
+    def sync(self, **params):
+        response = self.client.get('/api/users/sync/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, result, collection):
+        return [row['id'] for row in result[collection]['changed']], result[collection]['deleted']
+
+    def test_first_sync_returns_everything_owned(self):
+        result = self.sync()
+        self.assertTrue(result['full'])
+        self.assertEqual(self.ids(result, 'listings'), ([self.listings[1].id, self.listings[0].id], []))
+        self.assertEqual(self.ids(result, 'detections'), ([self.detection.id], []))
+        self.assertEqual(result['listings']['changed'], self.client.get('/api/marketplace/listings/my/').json())
+
+    def test_later_syncs_return_only_changes(self):
+        token = self.sync()['token']
+        self.assertEqual(self.ids(self.sync(since=token), 'listings'), ([], []))
+
+        okra, gourd, others = self.listings
+        okra.rate = '35.00'
+        okra.save()
+        CropImage.objects.create(listing=gourd, image='marketplace/crop_images/gourd.jpg')
+        others.delete()  # not this user's
+        detection_id = self.detection.id
+        self.detection.delete()
+        new = DetectionRecord.objects.create(user=self.farmer, image='detections/b.jpg', detected_disease='Healthy')
+
+        result = self.sync(since=token)
+        self.assertFalse(result['full'])
+        self.assertEqual(self.ids(result, 'listings'), ([gourd.id, okra.id], []))
+        self.assertEqual(self.ids(result, 'detections'), ([new.id], [detection_id]))
+
+        token, okra_id = result['token'], okra.id
+        okra.delete()
+        result = self.sync(since=token, collections='listings')
+        self.assertEqual(self.ids(result, 'listings'), ([], [okra_id]))
+        self.assertNotIn('detections', result)
+
+    def test_video_and_partial_saves_bump_updated_at(self):
+        listing = self.listings[0]
+        before = listing.updated_at
+        listing.video = 'marketplace/crop_videos/okra.mp4'
+        listing.save(update_fields=['video'])
+        listing.refresh_from_db()
+        self.assertGreater(listing.updated_at, before)
+
+    def test_expired_token_gets_full_resync(self):
+        old = encode_token(timezone.now() - timedelta(days=365))
+        result = self.sync(since=old)
+        self.assertTrue(result['full'])
+        self.assertEqual(len(result['listings']['changed']), 2)
+
+    def test_tombstones_survive_owner_deletion(self):
+        owner_id, listing_id = self.other.pk, self.listings[2].id
+        self.other.delete()
+        self.assertTrue(Tombstone.objects.filter(owner_id=owner_id, object_id=listing_id).exists())
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/users/sync/', {'since': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/users/sync/', {'collections': 'orders'}).status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/users/sync/').status_code, 401)
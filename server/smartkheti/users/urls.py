@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterUserView, UserProfileView,RequestOTPView,VeriifyOTPAndChangePasswordView
+from .views import RegisterUserView, UserProfileView,RequestOTPView,VeriifyOTPAndChangePasswordView, SyncView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -7,6 +7,7 @@ urlpatterns = [
     path('login/', TokenObtainPairView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('sync/', SyncView.as_view(), name='sync'),
 
     path('request-otp/',RequestOTPView.as_view(), name='request_otp'),
 
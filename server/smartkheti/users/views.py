@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.exceptions import NotAuthenticated, ValidationError
 from .models import User,OTPrequest
 from .serializers import UserSerializer
+from . import sync
 from django.http import HttpResponse
 
 
@@ -26,6 +27,30 @@ class RegisterUserView(generics.CreateAPIView):
         return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
         print(serializer.errors) 
 
+# Delta sync of the user's listings and detection history
+class SyncView(APIView):
+    """
+    GET ?since=<token>&collections=listings,detections returns
+    {"token", "full", <collection>: {"changed": [...], "deleted": [ids]}}.
+    Send the returned token as `since` next time to get only what changed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        names = [name.strip() for name in request.query_params.get('collections', '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in sync.COLLECTIONS]
+        if unknown:
+            return Response({"error": f"Unknown collections: {', '.join(unknown)}. "
+                                      f"Choose from: {', '.join(sync.COLLECTIONS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = sync.decode_token(request.query_params['since']) if request.query_params.get('since') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(sync.changes(request.user, request, since, names or sync.COLLECTIONS))
+
+
 #Profile View
 class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
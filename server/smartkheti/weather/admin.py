@@ -1,3 +1,16 @@
 from django.contrib import admin
+from .models import SavedLocation, GeocodeCache
 
-# Register your models here.
+
+@admin.register(SavedLocation)
+class SavedLocationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'municipality', 'district', 'ward_number', 'created_at')
+    search_fields = ('name', 'user__phone', 'municipality', 'district')
+
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'strategy', 'latitude', 'longitude', 'resolved_at', 'expires_at')
+    list_filter = ('strategy', 'province')
+    search_fields = ('key', 'municipality', 'district')
+    readonly_fields = ('resolved_at',)
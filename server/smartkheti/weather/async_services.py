@@ -0,0 +1,177 @@
+"""
+Async counterparts of the upstream-bound functions in services.py, used by
+the async views in ASGI mode. The decisions (gazetteer answers, cache
+freshness, fallbacks) are the helpers in services.py; only the I/O differs:
+Nominatim and Open-Meteo are awaited, and the database, the shared cache and
+the rate limiter are reached through worker threads, never on the event loop.
+"""
+import asyncio
+import logging
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+
+from core import metrics, upstream
+from .cache import MISSING, AsyncSingleFlight
+from .services import (
+    GeocodingRateLimited, GeocodingUnavailable, _cached_forecast, _cached_geocode, _cached_resolution,
+    _coalesce_waits, _coalesced_forecast, _forecast_cache, _forecast_or_fallback, _forecast_params,
+    _format_reverse_geocode, _geocode_params, _known_location_name, _lookup_resolution, _no_strategy_matched,
+    _offline_resolution, _outage_resolution, _parse_geocode_results, _remember_location_name,
+    _reverse_geocode_params, _reverse_geocode_wait, _store_forecast, _store_geocode_result, _strategy_attempts,
+    forecast_cell, geocode_cache_key, nominatim_limiter,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upstream failures as raised by upstream.aget() and httpx's raise_for_status().
+UPSTREAM_ERRORS = (requests.exceptions.RequestException, httpx.HTTPStatusError)
+
+_forecast_flight = AsyncSingleFlight('weather.forecast')
+
+
+def _in_thread(fn):
+    """Run a cache-bound helper in a worker thread; unlike the ORM it needs no particular one."""
+    return sync_to_async(fn, thread_sensitive=False)
+
+
+async def aget_coordinates_from_address(province, district, municipality, ward_number, deadline=None):
+    lat, lon, _strategy = await aresolve_address(province, district, municipality, ward_number, deadline)
+    return lat, lon
+
+
+async def aresolve_address(province, district, municipality, ward_number, deadline=None):
+    """Async resolve_address(); returns (lat, lon, strategy)."""
+    place, result = _offline_resolution(province, district, municipality)
+    if result is not None:
+        return result
+
+    key = geocode_cache_key(province, district, municipality, ward_number)
+    entry = await sync_to_async(_cached_geocode)(key)
+    if entry is not None:
+        return _cached_resolution(entry, place)
+
+    try:
+        lat, lon, strategy = await _ageocode_with_strategies(province, district, municipality, ward_number, deadline)
+    except GeocodingUnavailable:
+        return _outage_resolution(place, district, province)
+
+    await sync_to_async(_store_geocode_result)(
+        key, province, district, municipality, ward_number, lat, lon, strategy
+    )
+    return _lookup_resolution(place, lat, lon, strategy, district, province)
+
+
+async def _ageocode_with_strategies(province, district, municipality, ward_number, deadline=None):
+    unavailable = False
+    for strategy, address, max_wait in _strategy_attempts(province, district, municipality, ward_number, deadline):
+        try:
+            lat, lon = await _atry_geocode(address, max_wait=max_wait, deadline=deadline)
+        except GeocodingRateLimited:
+            raise
+        except GeocodingUnavailable:
+            unavailable = True
+            continue
+        if lat and lon:
+            return lat, lon, strategy
+    return _no_strategy_matched(unavailable, district, province)
+
+
+async def _atry_geocode(address, max_wait=None, deadline=None):
+    """Async _try_geocode(..., raise_on_error=True)."""
+    cleaned_address = " ".join(address.split())
+    logger.info(f"Trying to geocode: {cleaned_address}")
+
+    if not await nominatim_limiter.aacquire(max_wait):
+        logger.warning(f"Nominatim rate limit reached; not geocoding {cleaned_address}")
+        raise GeocodingRateLimited(cleaned_address)
+
+    try:
+        response = await upstream.aget(
+            'nominatim', '/search', params=_geocode_params(cleaned_address), deadline=deadline,
+        )
+        response.raise_for_status()
+        return _parse_geocode_results(response.json(), cleaned_address)
+    except UPSTREAM_ERRORS as e:
+        logger.error(f"Request error while geocoding {cleaned_address}: {e}")
+        raise GeocodingUnavailable(cleaned_address) from e
+    except (ValueError, KeyError) as e:
+        logger.error(f"Data parsing error while geocoding {cleaned_address}: {e}")
+        return None, None
+
+
+async def areverse_geocode_improved(lat, lon, deadline=None):
+    """Async reverse_geocode_improved()."""
+    name, (cell_lat, cell_lon, cache_key) = await _in_thread(_known_location_name)(lat, lon)
+    if name is not MISSING:
+        return name
+    name = await _anominatim_reverse(cell_lat, cell_lon, deadline)
+    return await _in_thread(_remember_location_name)(lat, lon, cache_key, name)
+
+
+async def _anominatim_reverse(lat, lon, deadline=None):
+    if not await nominatim_limiter.aacquire(_reverse_geocode_wait(deadline)):
+        logger.warning(f"Nominatim rate limit reached; not reverse geocoding {lat}, {lon}")
+        return None
+
+    try:
+        metrics.incr('weather.reverse_geocode.upstream_calls')
+        response = await upstream.aget(
+            'nominatim', '/reverse', params=_reverse_geocode_params(lat, lon), deadline=deadline,
+        )
+        response.raise_for_status()
+        return _format_reverse_geocode(response.json(), lat, lon)
+    except UPSTREAM_ERRORS as e:
+        logger.error(f"Request error in reverse geocoding: {e}")
+    except Exception as e:
+        logger.error(f"Error in reverse geocoding: {e}")
+    return None
+
+
+async def afetch_forecast(lat, lon):
+    """Async fetch_forecast()."""
+    cell_lat, cell_lon, cache_key = forecast_cell(lat, lon)
+
+    entry, data = await _in_thread(_cached_forecast)(cell_lat, cell_lon, cache_key)
+    if data is not None:
+        return data
+
+    data = await _forecast_flight.do(cache_key, lambda: _arefresh_forecast(cell_lat, cell_lon, cache_key))
+    return _forecast_or_fallback(entry, data)
+
+
+async def _arefresh_forecast(lat, lon, cache_key):
+    locked = await _in_thread(_forecast_cache.acquire_lock)(cache_key, timeout=30)
+    if not locked:
+        for delay in _coalesce_waits():
+            await asyncio.sleep(delay)
+            data = await _in_thread(_coalesced_forecast)(cache_key)
+            if data is not None:
+                return data
+
+    try:
+        data = await _afetch_forecast_upstream(lat, lon)
+        if data is not None:
+            await _in_thread(_store_forecast)(cache_key, data)
+        return data
+    finally:
+        if locked:
+            await _in_thread(_forecast_cache.release_lock)(cache_key)
+
+
+async def _afetch_forecast_upstream(lat, lon):
+    try:
+        metrics.incr('weather.forecast.upstream_calls')
+        response = await upstream.aget('open_meteo', '/v1/forecast', params=_forecast_params(lat, lon))
+        response.raise_for_status()
+        data = response.json()
+        logger.info(f"Successfully fetched forecast for lat={lat}, lon={lon}")
+        return data
+    except UPSTREAM_ERRORS as e:
+        logger.error(f"Request error fetching forecast for lat={lat}, lon={lon}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error fetching forecast for lat={lat}, lon={lon}: {e}")
+
+    metrics.incr('weather.forecast.upstream_errors')
+    return None
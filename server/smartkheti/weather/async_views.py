@@ -0,0 +1,127 @@
+"""
+Async versions of the upstream-bound weather views, routed instead of the
+ones in views.py when settings.ASYNC_VIEWS is on (ASGI deployments). While a
+request waits on Nominatim or Open-Meteo it holds no thread, so one worker
+process can keep many more of them in flight. Parsing, fallbacks and
+response bodies are shared with views.py.
+"""
+import logging
+import time
+
+from django.conf import settings
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.views import AsyncAPIView
+from .async_services import afetch_forecast, aget_coordinates_from_address, areverse_geocode_improved
+from .concurrency import gather_concurrently
+from .models import SavedLocation
+from .views import (
+    forecast_failed_response, forecast_response, geocoding_deadline, location_test_response,
+    merge_forecast_results, missing_address_response, missing_fields_response, parse_coordinates,
+    stored_coordinates, user_address,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def aforecast_with_location(lat, lon, deadline, location=None):
+    """Async forecast_with_location(); returns (forecast, location, partial)."""
+    calls = {'forecast': afetch_forecast(lat, lon)}
+    if not location:
+        calls['location'] = areverse_geocode_improved(lat, lon)
+    results, errors = await gather_concurrently(calls, timeout=deadline - time.monotonic())
+    return merge_forecast_results(lat, lon, location, results, errors)
+
+
+class ForecastView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
+        try:
+            lat = request.query_params.get('lat')
+            lon = request.query_params.get('lon')
+
+            if lat and lon:
+                lat, lon, error = parse_coordinates(lat, lon)
+                if error:
+                    return error
+
+                forecast, location, partial = await aforecast_with_location(lat, lon, deadline)
+                logger.info(f"Map-based forecast requested for {lat}, {lon}")
+                return forecast_response(location, lat, lon, forecast, partial, source="coordinates")
+
+            user = request.user
+            missing = missing_address_response(user)
+            if missing:
+                return missing
+
+            logger.info(f"Fetching forecast for user {user.id} at {user.district}, {user.province}")
+
+            stored = stored_coordinates(user)
+            if stored:
+                lat, lon, location = stored
+            else:
+                lat, lon = await aget_coordinates_from_address(
+                    user.province, user.district, user.municipality, getattr(user, 'ward_number', None),
+                    deadline=geocoding_deadline(deadline),
+                )
+                location = None
+
+            forecast, location, partial = await aforecast_with_location(lat, lon, deadline, location)
+            return forecast_response(
+                location, lat, lon, forecast, partial, user_address=user_address(user), source="user_profile",
+            )
+
+        except Exception as e:
+            return forecast_failed_response('ForecastView', e)
+
+
+class LocationTestView(AsyncAPIView):
+    """
+    Test endpoint to debug geocoding issues
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
+        user = request.user
+        missing = missing_fields_response(user)
+        if missing:
+            return missing
+
+        async def lookup(ward_number):
+            lat, lon = await aget_coordinates_from_address(
+                user.province, user.district, user.municipality, ward_number, deadline=geocoding_deadline(deadline)
+            )
+            return lat, lon, await areverse_geocode_improved(lat, lon, deadline)
+
+        with_ward = await lookup(user.ward_number) if getattr(user, 'ward_number', None) else None
+        return location_test_response(user, with_ward, await lookup(None))
+
+
+class WeatherFromSavedLocationView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
+        location_id = request.query_params.get('location_id')
+
+        try:
+            location = await SavedLocation.objects.aget(id=location_id, user=request.user)
+        except SavedLocation.DoesNotExist:
+            return Response({"error": "Saved location not found."}, status=404)
+
+        stored = stored_coordinates(location)
+        if stored:
+            lat, lon, location_name = stored
+        else:
+            lat, lon = await aget_coordinates_from_address(
+                location.province, location.district, location.municipality, location.ward_number,
+                deadline=geocoding_deadline(deadline),
+            )
+            location_name = None
+
+        forecast, location_name, partial = await aforecast_with_location(lat, lon, deadline, location_name)
+        return forecast_response(location_name, lat, lon, forecast, partial)
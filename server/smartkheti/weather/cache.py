@@ -0,0 +1,248 @@
+"""
+Caching helpers for the weather services: coordinate snapping to a grid and a
+two-level cache (per-process LRU in front of the shared Django cache).
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache as shared_cache
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def snap_to_grid(lat, lon, step):
+    """
+    Snap a coordinate to the centre of its grid cell so that nearby points
+    share one cache entry, e.g. step=0.01 gives ~1 km cells.
+    """
+    lat = round(round(float(lat) / step) * step, 6)
+    lon = round(round(float(lon) / step) * step, 6)
+    return lat, lon
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU with a per-entry TTL.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoLevelCache:
+    """
+    Per-process LRU backed by the shared Django cache. Lookups record
+    `<name>.lru_hit`, `<name>.shared_hit` and `<name>.miss` counters and a
+    `<name>.hit_ratio` in the metrics registry.
+
+    delete() reaches the other workers through a generation counter in the
+    shared cache: each process re-reads it at most every `generation_check`
+    seconds and drops its whole LRU when it has moved, so a deleted entry can
+    be served locally elsewhere for up to that long. set() is not propagated;
+    other workers keep their local copy until it expires.
+    """
+
+    def __init__(self, name, maxsize, ttl, generation_check=1.0):
+        self.name = name
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.generation_check = generation_check
+        self._generation = None
+        self._generation_checked_at = float('-inf')
+        metrics.register_ratio(
+            f'{name}.hit_ratio',
+            hits=[f'{name}.lru_hit', f'{name}.shared_hit'],
+            misses=[f'{name}.miss'],
+        )
+
+    def _shared_key(self, key):
+        return f'{self.name}:{key}'
+
+    def _sync_generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = shared_cache.get(self._shared_key('generation'))
+        except Exception as e:
+            logger.warning(f"Shared cache read failed for {self.name}: {e}")
+            return
+        if generation != self._generation:
+            self.local.clear()
+            self._generation = generation
+
+    def get(self, key, record=True):
+        self._sync_generation()
+        value = self.local.get(key)
+        if value is not MISSING:
+            if record:
+                metrics.incr(f'{self.name}.lru_hit')
+            return value
+
+        try:
+            value = shared_cache.get(self._shared_key(key), MISSING)
+        except Exception as e:
+            # A shared cache outage should degrade to a miss, not an error.
+            logger.warning(f"Shared cache read failed for {self.name}: {e}")
+            value = MISSING
+        if value is not MISSING:
+            if record:
+                metrics.incr(f'{self.name}.shared_hit')
+            self.local.set(key, value)
+            return value
+
+        if record:
+            metrics.incr(f'{self.name}.miss')
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl)
+        try:
+            shared_cache.set(self._shared_key(key), value, ttl)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed for {self.name}: {e}")
+
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            shared_cache.delete(self._shared_key(key))
+            self._bump_generation()
+        except Exception as e:
+            logger.warning(f"Shared cache delete failed for {self.name}: {e}")
+
+    def _bump_generation(self):
+        key = self._shared_key('generation')
+        try:
+            shared_cache.incr(key)
+        except ValueError:
+            shared_cache.set(key, time.time_ns(), None)
+
+    def acquire_lock(self, key, timeout):
+        """
+        Cross-process lock on `key` via an atomic add in the shared cache.
+        Returns False if another worker holds it.
+        """
+        try:
+            return shared_cache.add(self._shared_key(f'lock:{key}'), 1, timeout)
+        except Exception as e:
+            logger.warning(f"Shared cache lock failed for {self.name}: {e}")
+            return True
+
+    def release_lock(self, key):
+        try:
+            shared_cache.delete(self._shared_key(f'lock:{key}'))
+        except Exception as e:
+            logger.warning(f"Shared cache unlock failed for {self.name}: {e}")
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key within this process: the first
+    caller runs the function, the rest wait for and share its result.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f'{self.name}.coalesced')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop: concurrent awaits for the
+    same key share a single task. The task is shielded, so a caller that is
+    cancelled (e.g. past its deadline) does not cancel it for the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        loop_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(loop_key)
+        if task is not None:
+            metrics.incr(f'{self.name}.coalesced')
+        else:
+            task = self._tasks[loop_key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _task: self._tasks.pop(loop_key, None))
+        return await asyncio.shield(task)
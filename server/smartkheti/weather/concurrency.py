@@ -0,0 +1,70 @@
+"""
+Bounded thread pool for running independent upstream calls (geocoding,
+forecast) side by side within a single request, and the equivalent for
+coroutines in the async views.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.WEATHER_UPSTREAM_MAX_WORKERS,
+    thread_name_prefix='weather-upstream',
+)
+
+
+def run_concurrently(calls, timeout):
+    """
+    Run each (fn, args) in `calls` (a dict keyed by name) on the shared pool
+    and wait at most `timeout` seconds for all of them.
+
+    Returns (results, errors): results maps names to return values for calls
+    that finished; errors maps the remaining names to a short reason.
+    """
+    futures = {name: _executor.submit(fn, *args) for name, (fn, args) in calls.items()}
+    wait(futures.values(), timeout=max(timeout, 0))
+
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            # The call keeps running in the pool, bounded by its own HTTP timeout.
+            metrics.incr(f'weather.concurrent.{name}.deadline_exceeded')
+            errors[name] = 'timeout'
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.error(f"Upstream call {name} failed: {e}")
+            metrics.incr(f'weather.concurrent.{name}.errors')
+            errors[name] = 'error'
+    return results, errors
+
+
+async def gather_concurrently(calls, timeout):
+    """
+    Async run_concurrently(): `calls` maps names to coroutines. Calls still
+    running at the deadline are cancelled. Returns (results, errors).
+    """
+    tasks = {name: asyncio.ensure_future(coro) for name, coro in calls.items()}
+    await asyncio.wait(tasks.values(), timeout=max(timeout, 0))
+
+    results, errors = {}, {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            metrics.incr(f'weather.concurrent.{name}.deadline_exceeded')
+            errors[name] = 'timeout'
+            continue
+        try:
+            results[name] = task.result()
+        except Exception as e:
+            logger.error(f"Upstream call {name} failed: {e}")
+            metrics.incr(f'weather.concurrent.{name}.errors')
+            errors[name] = 'error'
+    return results, errors
@@ -0,0 +1,219 @@
+"""
+Offline gazetteer of Nepal's administrative divisions.
+
+Provinces, districts and municipalities are a fixed set, so forward and
+reverse lookups against them are served from an in-memory index built once
+per process from the bundled dataset. Nominatim is only needed for places
+the dataset does not cover (e.g. individual wards or smaller municipalities).
+"""
+import difflib
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LEVEL_MUNICIPALITY = 'municipality'
+LEVEL_DISTRICT = 'district'
+LEVEL_PROVINCE = 'province'
+
+# Administrative suffixes (English and Nepali transliterations) that users
+# type inconsistently; stripped before matching.
+_SUFFIXES = [
+    'sub metropolitan city', 'sub metropolitan', 'submetropolitan city', 'submetropolitan',
+    'metropolitan city', 'metropolitan', 'rural municipality', 'municipality',
+    'upamahanagarpalika', 'mahanagarpalika', 'nagarpalika', 'gaunpalika', 'gaupalika',
+    'province', 'pradesh', 'district', 'jilla', 'city', 'nepal',
+]
+_SUFFIX_RE = re.compile(r'\b(?:' + '|'.join(re.escape(s) for s in _SUFFIXES) + r')\b')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+FUZZY_CUTOFF = 0.8
+GRID_CELL_DEGREES = 0.25
+EARTH_RADIUS_KM = 6371.0
+
+
+def normalize_name(name):
+    """
+    Reduce a place name to a bare lowercase token string, e.g.
+    "Pokhara Metropolitan City" -> "pokhara", "Sudurpaschim Province" -> "sudurpaschim".
+    """
+    cleaned = _NON_ALNUM_RE.sub(' ', str(name or '').lower().replace('-', ' '))
+    cleaned = _SUFFIX_RE.sub(' ', cleaned)
+    return ' '.join(cleaned.split())
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    level: str
+    lat: float
+    lon: float
+    province: str
+    district: str = ''
+    type: str = ''
+
+    @property
+    def full_name(self):
+        """Official name including its type, e.g. "Pokhara Metropolitan City"."""
+        return f"{self.name} {self.type}".strip()
+
+    @property
+    def label(self):
+        """Display name in the same shape as reverse_geocode_improved's output."""
+        parts = []
+        if self.level == LEVEL_MUNICIPALITY:
+            parts.append(self.name)
+        if self.district:
+            parts.append(self.district)
+        parts.extend([f"{self.province} Province", "Nepal"])
+        return ', '.join(parts)
+
+
+class Gazetteer:
+    """
+    In-memory index over the gazetteer dataset: normalized-name dictionaries
+    for forward lookups and a coarse lat/lon grid for nearest-place queries.
+    """
+
+    def __init__(self, data):
+        self.provinces = {}
+        self.districts = {}
+        self.municipalities = {}
+        self.municipalities_by_district = {}
+        self.grid = {}
+
+        for row in data.get('provinces', []):
+            place = Place(row['name'], LEVEL_PROVINCE, row['lat'], row['lon'], province=row['name'])
+            for name in [row['name']] + row.get('aliases', []):
+                self.provinces[normalize_name(name)] = place
+
+        for row in data.get('districts', []):
+            place = Place(row['name'], LEVEL_DISTRICT, row['lat'], row['lon'],
+                          province=row['province'], district=row['name'])
+            for name in [row['name']] + row.get('aliases', []):
+                self.districts[normalize_name(name)] = place
+            self._add_to_grid(place)
+
+        for row in data.get('municipalities', []):
+            place = Place(row['name'], LEVEL_MUNICIPALITY, row['lat'], row['lon'],
+                          province=row['province'], district=row['district'], type=row.get('type', ''))
+            key = normalize_name(row['name'])
+            self.municipalities.setdefault(key, place)
+            self.municipalities_by_district.setdefault(normalize_name(row['district']), {})[key] = place
+            self._add_to_grid(place)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _cell(lat, lon):
+        return int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lon / GRID_CELL_DEGREES))
+
+    def _add_to_grid(self, place):
+        self.grid.setdefault(self._cell(place.lat, place.lon), []).append(place)
+
+    @staticmethod
+    def _match(name, index):
+        """Exact normalized match, falling back to the closest fuzzy match."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in index:
+            return index[key]
+        close = difflib.get_close_matches(key, index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        return index[close[0]] if close else None
+
+    def match_province(self, name):
+        return self._match(name, self.provinces)
+
+    def match_district(self, name):
+        return self._match(name, self.districts)
+
+    def match_municipality(self, name, district=None):
+        """
+        Match within the given district when it is recognised, so that common
+        names resolve to the right place; otherwise match nationwide.
+        """
+        district_place = self.match_district(district) if district else None
+        if district_place:
+            candidates = self.municipalities_by_district.get(normalize_name(district_place.name), {})
+            return self._match(name, candidates)
+        return self._match(name, self.municipalities)
+
+    def lookup(self, province=None, district=None, municipality=None):
+        """
+        Return the most specific Place matching the address components, or None.
+        """
+        if municipality:
+            place = self.match_municipality(municipality, district)
+            if place:
+                return place
+        if district:
+            place = self.match_district(district)
+            if place:
+                return place
+        if province:
+            return self.match_province(province)
+        return None
+
+    def nearest(self, lat, lon, level=None, max_km=None):
+        """
+        Nearest indexed place to (lat, lon), searching outward ring by ring
+        through the grid. Returns (place, distance_km) or (None, None).
+        """
+        row, col = self._cell(lat, lon)
+        best, best_km = None, None
+        # ~27 km per cell at Nepal's latitude; cover the whole country at most.
+        for radius in range(0, 40):
+            for r in range(row - radius, row + radius + 1):
+                for c in range(col - radius, col + radius + 1):
+                    if max(abs(r - row), abs(c - col)) != radius:
+                        continue
+                    for place in self.grid.get((r, c), ()):
+                        if level and place.level != level:
+                            continue
+                        km = haversine_km(lat, lon, place.lat, place.lon)
+                        if best_km is None or km < best_km:
+                            best, best_km = place, km
+            # Anything in a further ring is at least this far away.
+            ring_km = radius * GRID_CELL_DEGREES * 111.0 * math.cos(math.radians(lat))
+            if best is not None and best_km <= ring_km:
+                break
+            if max_km is not None and ring_km > max_km:
+                break
+
+        if best is None or (max_km is not None and best_km > max_km):
+            return None, None
+        return best, best_km
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer():
+    """Process-wide gazetteer, loaded on first use."""
+    path = settings.WEATHER_GAZETTEER_PATH
+    try:
+        gazetteer = Gazetteer.from_file(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not load gazetteer from {path}: {e}")
+        gazetteer = Gazetteer({})
+    logger.info(
+        f"Loaded gazetteer: {len(gazetteer.districts)} district names, "
+        f"{len(gazetteer.municipalities)} municipalities"
+    )
+    return gazetteer
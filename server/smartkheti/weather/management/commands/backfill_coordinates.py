@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from weather.models import SavedLocation
+from weather.services import nominatim_limiter
+from weather.tasks import BACKGROUND_MAX_WAIT, resolve_coordinates
+
+
+class Command(BaseCommand):
+    help = "Resolve and store coordinates for users and saved locations that have an address but no coordinates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Re-resolve rows that already have coordinates.",
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Resolve at most this many rows per model.",
+        )
+
+    def handle(self, *args, **options):
+        for model in (get_user_model(), SavedLocation):
+            queryset = (
+                model.objects.exclude(province__isnull=True).exclude(province='')
+                .exclude(district__isnull=True).exclude(district='')
+                .exclude(municipality__isnull=True).exclude(municipality='')
+            )
+            if not options['force']:
+                queryset = queryset.filter(latitude__isnull=True)
+
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:options['limit']])
+            with nominatim_limiter.patience(BACKGROUND_MAX_WAIT):
+                updated = sum(1 for pk in pks if resolve_coordinates(model, pk))
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: resolved {updated} of {len(pks)}"
+            ))
@@ -0,0 +1,325 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from weather.models import SavedLocation
+
+# Roughly Nepal's bounding box, for --spread.
+LAT_RANGE = (26.4, 30.4)
+LON_RANGE = (80.1, 88.2)
+
+CACHES = ['weather.forecast', 'weather.reverse_geocode']
+UPSTREAMS = ['nominatim', 'open_meteo']
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server. The default ramp scenario requests one endpoint at increasing "
+        "concurrency and reports throughput and latency percentiles; run it once against a WSGI "
+        "deployment (gunicorn) and once against ASGI (uvicorn core.asgi:application) with the same "
+        "--workers to compare how many concurrent connections each worker process sustains. "
+        "--scenario weather drives ForecastView and WeatherFromSavedLocationView at a target request "
+        "rate and reports latency per endpoint, cache hit rates and upstream call counts; run the "
+        "server with UPSTREAM_STUB_URL pointing at manage.py upstream_stub. Its cache and upstream "
+        "figures come from /api/metrics/, which is per worker process, so run the server with a "
+        "single worker for exact numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='/api/weather/forecast/',
+            help="Endpoint for the ramp scenario (default: /api/weather/forecast/).",
+        )
+        parser.add_argument(
+            '--scenario', choices=['ramp', 'weather'], default='ramp',
+            help="ramp: one endpoint at increasing concurrency; weather: forecast and saved-location "
+                 "requests at --rps (default: ramp).",
+        )
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help="Server under test (default: http://127.0.0.1:8000).",
+        )
+        parser.add_argument(
+            '--user', default=None,
+            help="Phone number of the user to authenticate as; a JWT access token is minted locally. "
+                 "The weather scenario uses their saved locations.",
+        )
+        parser.add_argument('--token', default=None, help="JWT access token to send instead of --user (ramp only).")
+        parser.add_argument(
+            '--duration', type=float, default=None,
+            help="Seconds to run each concurrency level (ramp, default: 10) or the whole scenario "
+                 "(weather, default: 30).",
+        )
+        parser.add_argument(
+            '--spread', action='store_true',
+            help="Send random lat/lon within Nepal so requests spread over many forecast cells.",
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help="Client timeout per request in seconds (default: 30).",
+        )
+
+        ramp = parser.add_argument_group('ramp scenario')
+        ramp.add_argument(
+            '--concurrency', default='1,10,50,100',
+            help="Comma-separated concurrent connection counts to run (default: 1,10,50,100).",
+        )
+        ramp.add_argument(
+            '--workers', type=int, default=1,
+            help="Worker processes the server runs, for per-process figures (default: 1).",
+        )
+        ramp.add_argument(
+            '--max-p99', type=float, default=2000,
+            help="p99 latency in ms a level must stay under to count as sustained (default: 2000).",
+        )
+
+        weather = parser.add_argument_group('weather scenario')
+        weather.add_argument(
+            '--admin', default=None,
+            help="Phone number of a staff user for reading /api/metrics/ (default: --user).",
+        )
+        weather.add_argument('--rps', type=float, default=20, help="Target requests per second (default: 20).")
+        weather.add_argument(
+            '--saved-ratio', type=float, default=0.5,
+            help="Fraction of requests that go to the saved-location endpoint (default: 0.5).",
+        )
+        weather.add_argument(
+            '--stub-url', default=settings.UPSTREAM_STUB_URL,
+            help="Upstream stub to read call counts from (default: UPSTREAM_STUB_URL).",
+        )
+
+    def handle(self, *args, **options):
+        if options['scenario'] == 'weather':
+            self.weather_scenario(options)
+        else:
+            self.ramp_scenario(options)
+
+    # Ramp scenario: closed-loop connections at increasing concurrency.
+
+    def ramp_scenario(self, options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+        duration = options['duration'] or 10
+
+        headers = {}
+        token = options['token'] or (access_token(options['user']) if options['user'] else None)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        self.stdout.write(
+            f"{options['base_url']}{options['path']}, {duration:.0f}s per level, "
+            f"{options['workers']} server worker(s)"
+        )
+        self.stdout.write(
+            f"{'conc':>6} {'requests':>9} {'rps':>8} {'rps/proc':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+
+        sustained = 0
+        for concurrency in levels:
+            result = asyncio.run(self.run_level(concurrency, duration, headers, options))
+            self.stdout.write(
+                f"{concurrency:>6} {result['requests']:>9} {result['rps']:>8.1f} "
+                f"{result['rps'] / options['workers']:>9.1f} {result['p50']:>8.0f} {result['p95']:>8.0f} "
+                f"{result['p99']:>8.0f} {result['errors']:>7}"
+            )
+            if result['p99'] <= options['max_p99'] and not result['errors']:
+                sustained = max(sustained, concurrency)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sustained {sustained / options['workers']:.0f} concurrent connections per worker process "
+            f"with p99 under {options['max_p99']:.0f} ms and no errors"
+        ))
+
+    async def run_level(self, concurrency, duration, headers, options):
+        latencies = []
+        errors = 0
+        url = options['base_url'].rstrip('/') + options['path']
+        deadline = time.monotonic() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(headers=headers, limits=limits, timeout=options['timeout']) as client:
+            async def worker():
+                nonlocal errors
+                while time.monotonic() < deadline:
+                    params = random_point() if options['spread'] else None
+                    start = time.perf_counter()
+                    try:
+                        response = await client.get(url, params=params)
+                        ok = response.status_code < 400
+                    except httpx.HTTPError:
+                        ok = False
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if not ok:
+                        errors += 1
+
+            started = time.monotonic()
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+            elapsed = time.monotonic() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'errors': errors,
+        }
+
+    # Weather scenario: open-loop arrivals over the forecast endpoints.
+
+    def weather_scenario(self, options):
+        if not options['user']:
+            raise CommandError("The weather scenario needs --user")
+        token = access_token(options['user'])
+        admin_token = access_token(options['admin']) if options['admin'] else token
+        location_ids = list(
+            SavedLocation.objects.filter(user__phone=options['user']).values_list('id', flat=True)
+        )
+        if options['saved_ratio'] > 0 and not location_ids:
+            raise CommandError(f"User {options['user']} has no saved locations; add some or pass --saved-ratio 0")
+
+        report = asyncio.run(self.run_weather(token, admin_token, location_ids, options))
+        self.print_weather_report(report, options)
+
+    async def run_weather(self, token, admin_token, location_ids, options):
+        base_url = options['base_url'].rstrip('/')
+        duration = options['duration'] or 30
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+        results = defaultdict(list)  # endpoint -> [(latency_ms, ok)]
+        lag = []
+
+        async with httpx.AsyncClient(timeout=options['timeout'], limits=limits) as client:
+            before = await self.metrics(client, base_url, admin_token)
+            await self.stub_call(client, options['stub_url'], '/__reset')
+
+            async def one_request(endpoint, url, params):
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url, params=params, headers={'Authorization': f'Bearer {token}'})
+                    ok = response.status_code < 400 and not response.json().get('partial')
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                results[endpoint].append(((time.perf_counter() - start) * 1000, ok))
+
+            # Open-loop arrivals: requests start on schedule whether or not earlier ones finished.
+            tasks = []
+            interval = 1 / options['rps']
+            started = time.monotonic()
+            for n in range(int(duration * options['rps'])):
+                due = started + n * interval
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lag.append(max(-delay, 0) * 1000)
+
+                if random.random() < options['saved_ratio']:
+                    endpoint = 'saved_location'
+                    url = f'{base_url}/api/weather/weather/saved/'
+                    params = {'location_id': random.choice(location_ids)}
+                else:
+                    endpoint = 'forecast'
+                    url = f'{base_url}/api/weather/forecast/'
+                    params = random_point() if options['spread'] else None
+                tasks.append(asyncio.ensure_future(one_request(endpoint, url, params)))
+            await asyncio.gather(*tasks)
+            elapsed = time.monotonic() - started
+
+            after = await self.metrics(client, base_url, admin_token)
+            stub_stats = await self.stub_call(client, options['stub_url'], '/__stats')
+
+        return {
+            'results': results, 'elapsed': elapsed, 'lag': sorted(lag),
+            'before': before, 'after': after, 'stub': stub_stats,
+        }
+
+    async def metrics(self, client, base_url, token):
+        try:
+            response = await client.get(f'{base_url}/api/metrics/', headers={'Authorization': f'Bearer {token}'})
+            if response.status_code == 200:
+                return response.json().get('counters', {})
+        except (httpx.HTTPError, ValueError):
+            pass
+        return None
+
+    async def stub_call(self, client, stub_url, path):
+        if not stub_url:
+            return None
+        try:
+            return (await client.get(stub_url.rstrip('/') + path)).json()
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    def print_weather_report(self, report, options):
+        write = self.stdout.write
+        total = sum(len(samples) for samples in report['results'].values())
+        write(
+            f"{total} requests in {report['elapsed']:.1f}s ({total / report['elapsed']:.1f} rps, "
+            f"target {options['rps']:.1f}); arrival lag p99 {percentile(report['lag'], 99):.0f} ms"
+        )
+        write(f"{'endpoint':<16} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7}")
+        for endpoint, samples in sorted(report['results'].items()):
+            latencies = sorted(latency for latency, _ok in samples)
+            failed = sum(1 for _latency, ok in samples if not ok)
+            write(
+                f"{endpoint:<16} {len(samples):>9} {percentile(latencies, 50):>8.0f} "
+                f"{percentile(latencies, 95):>8.0f} {percentile(latencies, 99):>8.0f} "
+                f"{latencies[-1] if latencies else 0:>8.0f} {failed:>7}"
+            )
+        write("(failed = HTTP errors or partial responses)")
+
+        before, after = report['before'], report['after']
+        if before is None or after is None:
+            write(self.style.WARNING("Could not read /api/metrics/ (needs a staff user); no cache figures."))
+        else:
+            def delta(name):
+                return after.get(name, 0) - before.get(name, 0)
+
+            for cache in CACHES:
+                hits = delta(f'{cache}.lru_hit') + delta(f'{cache}.shared_hit')
+                lookups = hits + delta(f'{cache}.miss')
+                ratio = f"{hits / lookups:.1%}" if lookups else "n/a"
+                write(f"{cache} hit rate: {ratio} ({hits}/{lookups})")
+            for name in UPSTREAMS:
+                write(
+                    f"upstream {name}: {delta(f'upstream.{name}.requests')} requests, "
+                    f"{delta(f'upstream.{name}.errors')} errors, "
+                    f"{delta(f'upstream.{name}.short_circuited')} short-circuited"
+                )
+
+        if report['stub'] is not None:
+            for path, counts in sorted(report['stub'].items()):
+                write(f"stub {path}: " + ", ".join(f"{key} {value}" for key, value in sorted(counts.items())))
+
+
+def random_point():
+    return {
+        'lat': round(random.uniform(*LAT_RANGE), 4),
+        'lon': round(random.uniform(*LON_RANGE), 4),
+    }
+
+
+def access_token(phone):
+    """JWT access token for the user with this phone number, minted locally."""
+    try:
+        user = get_user_model().objects.get(phone=phone)
+    except get_user_model().DoesNotExist:
+        raise CommandError(f"No user with phone {phone}")
+    return str(AccessToken.for_user(user))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,107 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from weather.models import SavedLocation
+from weather.services import (
+    FORECAST_BATCH_SIZE, cached_forecast_fresh_until, forecast_cell, refresh_forecasts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh cached forecasts for every grid cell used by users and saved locations, "
+        "busiest cells first. Run once (e.g. from cron before the morning peak) or with --loop "
+        "as a long-lived worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, doing a pass every --interval seconds.",
+        )
+        parser.add_argument(
+            '--interval', type=int, default=300,
+            help="Seconds between passes in --loop mode (default: 300).",
+        )
+        parser.add_argument(
+            '--horizon', type=int, default=0,
+            help=(
+                "Also refresh cells that go stale within this many seconds. Refreshing before the "
+                "model-run boundary re-fetches the same run, so keep this small (default: 0)."
+            ),
+        )
+        parser.add_argument(
+            '--rate', type=float, default=1.0,
+            help="Maximum upstream requests per second (default: 1).",
+        )
+        parser.add_argument(
+            '--max-cells', type=int, default=None,
+            help="Only consider the N busiest cells per pass.",
+        )
+
+    def handle(self, *args, **options):
+        if 'locmem' in settings.CACHES['default']['BACKEND']:
+            self.stderr.write(self.style.WARNING(
+                "The default cache is process-local; set REDIS_URL so web workers can see prefetched forecasts."
+            ))
+
+        while True:
+            self.run_pass(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def run_pass(self, options):
+        started = time.monotonic()
+        cells = self.hot_cells()[:options['max_cells']]
+
+        due_before = time.time() + options['horizon']
+        due = []
+        for cell_lat, cell_lon, cache_key, _users in cells:
+            fresh_until = cached_forecast_fresh_until(cache_key)
+            if fresh_until is None or fresh_until <= due_before:
+                due.append((cell_lat, cell_lon, cache_key))
+
+        refreshed = requests_made = 0
+        for start in range(0, len(due), FORECAST_BATCH_SIZE):
+            if requests_made:
+                time.sleep(1 / options['rate'])
+            refreshed += refresh_forecasts(due[start:start + FORECAST_BATCH_SIZE])
+            requests_made += 1
+
+        self.stdout.write(
+            f"{len(cells)} cells in use, {len(due)} due, {refreshed} refreshed with "
+            f"{requests_made} upstream requests in {time.monotonic() - started:.1f}s"
+        )
+
+    def hot_cells(self):
+        """
+        Grid cells with stored coordinates, as (cell_lat, cell_lon, cache_key, user_count)
+        sorted by the number of distinct users in each cell.
+        """
+        users_by_cell = defaultdict(set)
+        cell_coordinates = {}
+
+        rows = get_user_model().objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).values_list('id', 'latitude', 'longitude')
+        saved = SavedLocation.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).values_list('user_id', 'latitude', 'longitude')
+
+        for queryset in (rows, saved):
+            for user_id, lat, lon in queryset.iterator():
+                cell_lat, cell_lon, cache_key = forecast_cell(lat, lon)
+                users_by_cell[cache_key].add(user_id)
+                cell_coordinates[cache_key] = (cell_lat, cell_lon)
+
+        cells = [
+            (*cell_coordinates[key], key, len(user_ids))
+            for key, user_ids in users_by_cell.items()
+        ]
+        cells.sort(key=lambda cell: cell[3], reverse=True)
+        return cells
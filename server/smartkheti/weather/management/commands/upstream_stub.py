@@ -0,0 +1,221 @@
+import copy
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+FIXTURES_DIR = os.path.join(settings.BASE_DIR, 'weather', 'data', 'upstream_fixtures')
+
+# route path -> (fixture file, upstream to record from)
+ROUTES = {
+    '/search': ('nominatim_search.json', 'https://nominatim.openstreetmap.org'),
+    '/reverse': ('nominatim_reverse.json', 'https://nominatim.openstreetmap.org'),
+    '/v1/forecast': ('open_meteo_forecast.json', 'https://api.open-meteo.com'),
+}
+NOMINATIM_RECORD_INTERVAL = 1.0  # Nominatim usage policy: one request per second
+
+
+def fixture_key(path, params):
+    """Key a request is recorded under: the address for searches, rounded coordinates otherwise."""
+    if path == '/search':
+        return " ".join(params.get('q', '').split()).lower()
+    if path == '/reverse':
+        return f"{float(params['lat']):.3f},{float(params['lon']):.3f}"
+    return f"{float(params['latitude']):.2f},{float(params['longitude']):.2f}"
+
+
+class Stub:
+    """Recorded responses, injection settings and per-route counters shared by the handler threads."""
+
+    def __init__(self, options):
+        self.options = options
+        self.fixtures = {}
+        for path, (filename, _upstream) in ROUTES.items():
+            with open(os.path.join(options['fixtures'], filename), encoding='utf-8') as f:
+                self.fixtures[path] = json.load(f)
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.last_nominatim_call = 0.0
+
+    def count(self, path, outcome):
+        with self.lock:
+            route = self.stats.setdefault(path, {})
+            route[outcome] = route.get(outcome, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def respond(self, path, params):
+        """Body for one (single-location) request, recording it first in --record mode."""
+        fixture = self.fixtures[path]
+        key = fixture_key(path, params)
+        if key in fixture['responses']:
+            self.count(path, 'replayed')
+            return self.refresh_dates(copy.deepcopy(fixture['responses'][key]))
+
+        if self.options['record']:
+            body = self.record(path, params, key)
+            if body is not None:
+                self.count(path, 'recorded')
+                return body
+
+        self.count(path, 'default')
+        body = copy.deepcopy(fixture['default'])
+        if path == '/reverse':
+            body['lat'], body['lon'] = str(params['lat']), str(params['lon'])
+        elif path == '/v1/forecast':
+            body['latitude'], body['longitude'] = float(params['latitude']), float(params['longitude'])
+        return self.refresh_dates(body)
+
+    def refresh_dates(self, body):
+        """Recorded forecasts start on the day they were recorded; shift them to today."""
+        daily = body.get('daily') if isinstance(body, dict) else None
+        if daily and daily.get('time'):
+            today = date.today()
+            daily['time'] = [(today + timedelta(days=i)).isoformat() for i in range(len(daily['time']))]
+        return body
+
+    def record(self, path, params, key):
+        _filename, upstream_url = ROUTES[path]
+        if path != '/v1/forecast':
+            with self.lock:
+                wait = self.last_nominatim_call + NOMINATIM_RECORD_INTERVAL - time.monotonic()
+                self.last_nominatim_call = time.monotonic() + max(wait, 0)
+            if wait > 0:
+                time.sleep(wait)
+        try:
+            response = requests.get(
+                upstream_url + path, params=params, timeout=10,
+                headers={'User-Agent': 'SmartKhetiApp/1.0 (upstream-stub recorder)'},
+            )
+            response.raise_for_status()
+            body = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+        with self.lock:
+            fixture = self.fixtures[path]
+            fixture['responses'][key] = body
+            filename = os.path.join(self.options['fixtures'], ROUTES[path][0])
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(fixture, f, indent=2, ensure_ascii=False)
+        return copy.deepcopy(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.stub.options['verbosity'] > 1:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if url.path == '/__stats':
+            with stub.lock:
+                return self.send_json(200, stub.stats)
+        if url.path == '/__reset':
+            stub.reset()
+            return self.send_json(200, {'reset': True})
+        if url.path not in ROUTES:
+            return self.send_json(404, {'error': f'No stub for {url.path}'})
+
+        options = stub.options
+        stub.count(url.path, 'requests')
+        time.sleep(max(options['latency'] + random.uniform(-1, 1) * options['jitter'], 0) / 1000)
+
+        roll = random.random()
+        if roll < options['timeout_rate']:
+            stub.count(url.path, 'timeouts_injected')
+            time.sleep(options['hang'])
+            return self.send_json(504, {'error': 'Injected timeout'})
+        if roll < options['timeout_rate'] + options['error_rate']:
+            stub.count(url.path, 'errors_injected')
+            return self.send_json(options['error_status'], {'error': 'Injected error'})
+
+        try:
+            if url.path == '/v1/forecast' and ',' in params.get('latitude', ''):
+                # Multi-coordinate request: one forecast per location, as a list.
+                body = [
+                    stub.respond(url.path, {**params, 'latitude': lat, 'longitude': lon})
+                    for lat, lon in zip(params['latitude'].split(','), params['longitude'].split(','))
+                ]
+            else:
+                body = stub.respond(url.path, params)
+        except (KeyError, ValueError):
+            return self.send_json(400, {'error': 'Missing or invalid parameters'})
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve recorded Nominatim (/search, /reverse) and Open-Meteo (/v1/forecast) responses for "
+        "load tests, with injected latency, errors and timeouts. Point the app at it with "
+        "UPSTREAM_STUB_URL=http://127.0.0.1:8900. GET /__stats returns per-route call counts and "
+        "/__reset clears them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument(
+            '--fixtures', default=FIXTURES_DIR,
+            help="Directory with the recorded responses (default: weather/data/upstream_fixtures).",
+        )
+        parser.add_argument(
+            '--record', action='store_true',
+            help="Fetch requests that have no recording from the real upstream and save them.",
+        )
+        parser.add_argument('--latency', type=float, default=0, help="Added latency per request in ms.")
+        parser.add_argument('--jitter', type=float, default=0, help="Uniform +/- jitter on the latency in ms.")
+        parser.add_argument(
+            '--error-rate', type=float, default=0,
+            help="Fraction of requests answered with --error-status (default: 0).",
+        )
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument(
+            '--timeout-rate', type=float, default=0,
+            help="Fraction of requests that hang for --hang seconds, past the client timeouts.",
+        )
+        parser.add_argument('--hang', type=float, default=30)
+
+    def handle(self, *args, **options):
+        server = StubServer((options['host'], options['port']), Handler)
+        server.stub = Stub(options)
+
+        self.stdout.write(
+            f"Upstream stub on http://{options['host']}:{options['port']} "
+            f"(latency {options['latency']:.0f}±{options['jitter']:.0f} ms, "
+            f"errors {options['error_rate']:.0%}, timeouts {options['timeout_rate']:.0%})"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
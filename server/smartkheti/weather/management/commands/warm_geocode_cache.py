@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from weather.models import SavedLocation, GeocodeCache
+from weather.services import STRATEGY_FALLBACK, geocode_cache_key, nominatim_limiter, resolve_address
+from weather.tasks import BACKGROUND_MAX_WAIT
+
+
+class Command(BaseCommand):
+    help = "Pre-warm the geocode cache for every address used by users and saved locations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Re-geocode addresses even if they already have a fresh cache entry.",
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Resolve at most this many addresses (useful to stay under Nominatim quotas).",
+        )
+
+    def handle(self, *args, **options):
+        addresses = self.collect_addresses()
+        self.stdout.write(f"Found {len(addresses)} distinct addresses")
+
+        fresh_keys = set()
+        if not options['force']:
+            fresh_keys = set(
+                GeocodeCache.objects.filter(expires_at__gt=timezone.now()).values_list('key', flat=True)
+            )
+
+        resolved = skipped = misses = 0
+        for key, address in addresses.items():
+            if key in fresh_keys:
+                skipped += 1
+                continue
+            if options['limit'] is not None and resolved >= options['limit']:
+                break
+
+            with nominatim_limiter.patience(BACKGROUND_MAX_WAIT):
+                lat, lon, strategy = resolve_address(*address, use_cache=False)
+            resolved += 1
+            if strategy == STRATEGY_FALLBACK:
+                misses += 1
+            self.stdout.write(f"  {key} -> {strategy} ({lat}, {lon})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Resolved {resolved} addresses ({misses} not resolved), {skipped} already cached"
+        ))
+
+    def collect_addresses(self):
+        """
+        Distinct (province, district, municipality, ward_number) tuples keyed
+        by their normalized cache key.
+        """
+        User = get_user_model()
+        rows = list(
+            User.objects.exclude(province__isnull=True).exclude(province='')
+            .exclude(district__isnull=True).exclude(district='')
+            .exclude(municipality__isnull=True).exclude(municipality='')
+            .values_list('province', 'district', 'municipality', 'ward_number')
+            .distinct()
+        )
+        rows += list(
+            SavedLocation.objects
+            .values_list('province', 'district', 'municipality', 'ward_number')
+            .distinct()
+        )
+
+        addresses = {}
+        for row in rows:
+            addresses.setdefault(geocode_cache_key(*row), row)
+        return addresses
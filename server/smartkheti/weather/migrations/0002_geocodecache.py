@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=320, unique=True)),
+                ('province', models.CharField(max_length=50)),
+                ('district', models.CharField(max_length=50)),
+                ('municipality', models.CharField(max_length=100)),
+                ('ward_number', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('strategy', models.CharField(choices=[('ward', 'Ward, municipality, district, province'), ('municipality', 'Municipality, district, province'), ('district', 'District, province'), ('province', 'Province only'), ('none', 'Not found')], max_length=20)),
+                ('resolved_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['province', 'district', 'municipality', 'ward_number'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geocodecache',
+            name='strategy',
+            field=models.CharField(choices=[('ward', 'Ward, municipality, district, province'), ('municipality', 'Municipality, district, province'), ('district', 'District, province'), ('province', 'Province only'), ('gazetteer', 'Offline gazetteer'), ('none', 'Not found')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_alter_geocodecache_strategy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedlocation',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='savedlocation',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='savedlocation',
+            name='resolved_location',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -10,6 +10,10 @@ class SavedLocation(models.Model):
     district = models.CharField(max_length=50)
     municipality = models.CharField(max_length=100)
     ward_number = models.PositiveSmallIntegerField()
+    # Filled in the background from the address fields above (see weather.signals).
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    resolved_location = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -18,3 +22,46 @@ class SavedLocation(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.user.phone})"
+
+
+class GeocodeCache(models.Model):
+    """
+    Persisted result of geocoding an address tuple, so repeat forecast
+    requests for the same municipality/ward skip Nominatim entirely.
+    A row with no coordinates is a cached miss (negative cache).
+    """
+    STRATEGY_WARD = 'ward'
+    STRATEGY_MUNICIPALITY = 'municipality'
+    STRATEGY_DISTRICT = 'district'
+    STRATEGY_PROVINCE = 'province'
+    STRATEGY_GAZETTEER = 'gazetteer'
+    STRATEGY_NONE = 'none'
+    STRATEGY_CHOICES = [
+        (STRATEGY_WARD, 'Ward, municipality, district, province'),
+        (STRATEGY_MUNICIPALITY, 'Municipality, district, province'),
+        (STRATEGY_DISTRICT, 'District, province'),
+        (STRATEGY_PROVINCE, 'Province only'),
+        (STRATEGY_GAZETTEER, 'Offline gazetteer'),
+        (STRATEGY_NONE, 'Not found'),
+    ]
+
+    key = models.CharField(max_length=320, unique=True)
+    province = models.CharField(max_length=50)
+    district = models.CharField(max_length=50)
+    municipality = models.CharField(max_length=100)
+    ward_number = models.PositiveSmallIntegerField(blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    strategy = models.CharField(max_length=20, choices=STRATEGY_CHOICES)
+    resolved_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['province', 'district', 'municipality', 'ward_number']
+
+    def __str__(self):
+        return f"{self.key} -> {self.strategy}"
+
+    @property
+    def is_miss(self):
+        return self.latitude is None or self.longitude is None
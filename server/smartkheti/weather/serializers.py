@@ -11,4 +11,4 @@ class SavedLocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = SavedLocation
         fields = '__all__'
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user', 'latitude', 'longitude', 'resolved_location']
\ No newline at end of file
@@ -1,91 +1,326 @@
 import requests
 import logging
+import threading
 import time
 
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from core import metrics, upstream
+from core.ratelimit import TokenBucket
+from .cache import MISSING, SingleFlight, TwoLevelCache, snap_to_grid
+from .gazetteer import LEVEL_DISTRICT, LEVEL_MUNICIPALITY, get_gazetteer
+from .models import GeocodeCache
+
 logger = logging.getLogger(__name__)
 
-def get_coordinates_from_address(province, district, municipality, ward_number):
+DEFAULT_COORDINATES = (27.7172, 85.3240)  # Kathmandu
+FORECAST_DAILY_VARIABLES = "rain_sum,wind_speed_10m_max,temperature_2m_max,temperature_2m_min,weather_code"
+FORECAST_BATCH_SIZE = 50  # coordinates per multi-location Open-Meteo request
+# Strategy reported when an address could not be resolved (not found, or
+# Nominatim unavailable) and an approximation is returned instead.
+STRATEGY_FALLBACK = 'fallback'
+
+_reverse_geocode_cache = TwoLevelCache(
+    'weather.reverse_geocode',
+    maxsize=settings.WEATHER_REVERSE_GEOCODE_CACHE_SIZE,
+    ttl=settings.WEATHER_REVERSE_GEOCODE_CACHE_TTL,
+)
+_forecast_cache = TwoLevelCache(
+    'weather.forecast',
+    maxsize=settings.WEATHER_FORECAST_CACHE_SIZE,
+    ttl=settings.WEATHER_FORECAST_STALE_TTL + settings.WEATHER_FORECAST_LAST_GOOD_TTL,
+)
+_forecast_flight = SingleFlight('weather.forecast')
+
+# Nominatim allows one request per second per application, across all workers.
+nominatim_limiter = TokenBucket('nominatim', **settings.NOMINATIM_RATE_LIMIT)
+
+
+class GeocodingUnavailable(Exception):
+    """Raised when Nominatim could not be reached, as opposed to finding nothing."""
+
+
+class GeocodingRateLimited(GeocodingUnavailable):
+    """Raised when no Nominatim token was available within the lookup's wait budget."""
+
+
+def normalize_address(province, district, municipality, ward_number):
+    """
+    Normalize address components into the tuple used as the geocode cache key.
+    """
+    def _norm(value):
+        return " ".join(str(value or "").split()).lower()
+
+    ward = int(ward_number) if ward_number else None
+    return _norm(province), _norm(district), _norm(municipality), ward
+
+
+def geocode_cache_key(province, district, municipality, ward_number):
+    province, district, municipality, ward = normalize_address(
+        province, district, municipality, ward_number
+    )
+    return "|".join([province, district, municipality, str(ward or "")])
+
+
+def get_coordinates_from_address(province, district, municipality, ward_number, deadline=None):
     """
     Get latitude and longitude from address components using multiple strategies.
+    Addresses seen before are answered from the persisted geocode cache.
     Falls back to default coordinates (Kathmandu) on failure.
     """
+    lat, lon, _strategy = resolve_address(province, district, municipality, ward_number, deadline=deadline)
+    return lat, lon
+
+
+def resolve_address(province, district, municipality, ward_number, use_cache=True, deadline=None):
+    """
+    Resolve an address to (lat, lon, strategy).
+    Municipalities known to the offline gazetteer are answered in memory;
+    otherwise the geocode cache is consulted before falling back to Nominatim,
+    and the outcome of any live lookup is recorded. If none of them locates
+    the address, the strategy is STRATEGY_FALLBACK and the coordinates are
+    only an approximation (see _fallback_coordinates) that must not be stored.
+    A `deadline` (time.monotonic() based) bounds the Nominatim lookup; if it
+    passes first, the fallback is returned as for an outage.
+    """
+    place, result = _offline_resolution(province, district, municipality)
+    if result is not None:
+        return result
+
+    key = geocode_cache_key(province, district, municipality, ward_number)
+
+    if use_cache:
+        entry = _cached_geocode(key)
+        if entry is not None:
+            return _cached_resolution(entry, place)
+
+    try:
+        lat, lon, strategy = _geocode_with_strategies(province, district, municipality, ward_number, deadline)
+    except GeocodingUnavailable:
+        return _outage_resolution(place, district, province)
+
+    _store_geocode_result(key, province, district, municipality, ward_number, lat, lon, strategy)
+    return _lookup_resolution(place, lat, lon, strategy, district, province)
+
+
+def resolve_addresses(addresses, deadline=None):
+    """
+    Resolve many (province, district, municipality, ward_number) tuples at
+    once: gazetteer matches first, then a single geocode-cache query for the
+    rest, and Nominatim only for addresses not seen before, within `deadline`.
+    Returns (lat, lon, strategy) tuples in input order.
+    """
+    results = [None] * len(addresses)
+    places = {}
+    pending = {}
+
+    for index, (province, district, municipality, ward_number) in enumerate(addresses):
+        place, result = _offline_resolution(province, district, municipality)
+        if result is not None:
+            results[index] = result
+            continue
+        key = geocode_cache_key(province, district, municipality, ward_number)
+        places[key] = place
+        pending.setdefault(key, []).append(index)
+
+    if pending:
+        entries = GeocodeCache.objects.filter(key__in=list(pending), expires_at__gt=timezone.now())
+        for entry in entries:
+            result = _cached_resolution(entry, places[entry.key])
+            for index in pending.pop(entry.key):
+                results[index] = result
+
+    for key, indexes in pending.items():
+        result = resolve_address(*addresses[indexes[0]], use_cache=False, deadline=deadline)
+        for index in indexes:
+            results[index] = result
+
+    return results
+
+
+def _offline_resolution(province, district, municipality):
+    """
+    (place, result): the gazetteer's closest match for an address, and the
+    resolution if that settles it (a listed municipality), else None.
+    """
+    place = get_gazetteer().lookup(province, district, municipality)
+    if place is not None and place.level == LEVEL_MUNICIPALITY:
+        return place, (place.lat, place.lon, GeocodeCache.STRATEGY_GAZETTEER)
+    return place, None
+
+
+def _cached_geocode(key):
+    """The unexpired geocode cache entry for `key`, or None."""
+    return GeocodeCache.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+
+
+def _cached_resolution(entry, place):
+    """Resolution recorded in a geocode cache entry; a cached miss gets the fallback."""
+    if entry.is_miss:
+        return _fallback_coordinates(place)
+    return entry.latitude, entry.longitude, entry.strategy
+
+
+def _outage_resolution(place, district, province):
+    # Don't negative-cache an outage; serve the best offline answer this time.
+    logger.warning(f"Geocoding unavailable for {district}, {province}; using gazetteer fallback")
+    return _fallback_coordinates(place)
+
+
+def _lookup_resolution(place, lat, lon, strategy, district, province):
+    """Resolution from a finished Nominatim lookup; a miss gets the fallback."""
+    if lat is None or lon is None:
+        logger.warning(f"Could not geocode any address variation for {district}, {province}")
+        return _fallback_coordinates(place)
+    return lat, lon, strategy
+
+
+def _fallback_coordinates(place):
+    """
+    District or province centroid from the gazetteer if the address matched
+    one, otherwise the default (Kathmandu).
+    """
+    if place is not None:
+        return place.lat, place.lon, STRATEGY_FALLBACK
+    return DEFAULT_COORDINATES + (STRATEGY_FALLBACK,)
+
+
+def _geocode_with_strategies(province, district, municipality, ward_number, deadline=None):
+    """
+    Try progressively coarser address strings until Nominatim finds one.
+    Raises GeocodingUnavailable if nothing was found and any attempt failed
+    for network reasons or ran out of time, so the miss is not cached.
+    All attempts share one rate-limit wait budget, cut short by `deadline`;
+    once it is spent the lookup stops with GeocodingRateLimited instead of
+    waiting again.
+    """
+    unavailable = False
+    for strategy, address, max_wait in _strategy_attempts(province, district, municipality, ward_number, deadline):
+        try:
+            lat, lon = _try_geocode(address, raise_on_error=True, max_wait=max_wait, deadline=deadline)
+        except GeocodingRateLimited:
+            raise
+        except GeocodingUnavailable:
+            unavailable = True
+            continue
+        if lat and lon:
+            return lat, lon, strategy
+    return _no_strategy_matched(unavailable, district, province)
+
+
+def _strategy_attempts(province, district, municipality, ward_number, deadline=None):
+    """
+    (strategy, address, max_wait) for each attempt, most specific first. The
+    rate-limit wait budget is shared and cut short by `deadline`; once that
+    has passed, GeocodingUnavailable is raised instead of another attempt.
+    """
+    wait_until = time.monotonic() + nominatim_limiter.default_wait()
+    if deadline is not None:
+        wait_until = min(wait_until, deadline)
+    for strategy, address in _geocode_strategies(province, district, municipality, ward_number):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise GeocodingUnavailable(f"Deadline passed geocoding {district}, {province}")
+        yield strategy, address, max(wait_until - time.monotonic(), 0)
+
+
+def _no_strategy_matched(unavailable, district, province):
+    """A confirmed miss, or GeocodingUnavailable if any attempt could not reach Nominatim."""
+    if unavailable:
+        raise GeocodingUnavailable(f"{district}, {province}")
+    return None, None, GeocodeCache.STRATEGY_NONE
+
+
+def _geocode_strategies(province, district, municipality, ward_number):
+    """(strategy, address string) pairs to try, most specific first."""
+    province, district = _canonical_names(province, district)
+
+    strategies = []
     # Strategy 1: Try with ward number
-    address_with_ward = f"Ward {ward_number}, {municipality}, {district}, {province} Province, Nepal"
-    lat, lon = _try_geocode(address_with_ward)
-    if lat and lon:
-        return lat, lon
-    
+    if ward_number:
+        strategies.append((
+            GeocodeCache.STRATEGY_WARD,
+            f"Ward {ward_number}, {municipality}, {district}, {province} Province, Nepal",
+        ))
     # Strategy 2: Try without ward number but with municipality
-    address_without_ward = f"{municipality}, {district}, {province} Province, Nepal"
-    lat, lon = _try_geocode(address_without_ward)
-    if lat and lon:
-        return lat, lon
-    
+    strategies.append((
+        GeocodeCache.STRATEGY_MUNICIPALITY,
+        f"{municipality}, {district}, {province} Province, Nepal",
+    ))
     # Strategy 3: Try with just district and province
-    address_district = f"{district}, {province} Province, Nepal"
-    lat, lon = _try_geocode(address_district)
-    if lat and lon:
-        return lat, lon
-    
+    strategies.append((GeocodeCache.STRATEGY_DISTRICT, f"{district}, {province} Province, Nepal"))
     # Strategy 4: Try with just province
-    address_province = f"{province} Province, Nepal"
-    lat, lon = _try_geocode(address_province)
-    if lat and lon:
-        return lat, lon
-    
-    logger.warning(f"Could not geocode any address variation for {district}, {province}")
-    # Fallback default: Kathmandu
-    return 27.7172, 85.3240
+    strategies.append((GeocodeCache.STRATEGY_PROVINCE, f"{province} Province, Nepal"))
+    return strategies
 
 
-def _try_geocode(address):
+def _canonical_names(province, district):
+    """
+    Swap user-typed province/district names for their gazetteer spelling
+    (e.g. "sudurpaschim" -> "Sudurpashchim") so Nominatim sees official names.
+    """
+    gazetteer = get_gazetteer()
+    province_place = gazetteer.match_province(province)
+    district_place = gazetteer.match_district(district)
+    return (
+        province_place.name if province_place else province,
+        district_place.name if district_place else district,
+    )
+
+
+def _store_geocode_result(key, province, district, municipality, ward_number, lat, lon, strategy):
+    if lat is None or lon is None:
+        ttl = settings.WEATHER_GEOCODE_NEGATIVE_TTL
+    else:
+        ttl = settings.WEATHER_GEOCODE_CACHE_TTL
+
+    try:
+        GeocodeCache.objects.update_or_create(
+            key=key,
+            defaults={
+                'province': province or '',
+                'district': district or '',
+                'municipality': municipality or '',
+                'ward_number': ward_number or None,
+                'latitude': lat,
+                'longitude': lon,
+                'strategy': strategy,
+                'expires_at': timezone.now() + ttl,
+            },
+        )
+    except DatabaseError as e:
+        logger.error(f"Could not store geocode cache entry for {key}: {e}")
+
+
+def _try_geocode(address, raise_on_error=False, max_wait=None, deadline=None):
     """
     Helper function to try geocoding a single address string.
+    With raise_on_error, network failures raise GeocodingUnavailable (and no
+    rate-limit token within max_wait seconds GeocodingRateLimited) instead of
+    looking like an empty result. The request itself is bounded by `deadline`.
     """
-    # Clean and format the address
-    cleaned_address = _clean_address(address)
-    
+    cleaned_address = " ".join(address.split())
+
     logger.info(f"Trying to geocode: {cleaned_address}")
 
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        'q': cleaned_address,
-        'format': 'json',
-        'limit': 3,  # Get more results to pick the best one
-        'countrycodes': 'np',  
-        'addressdetails': 1,
-    }
-    
-    headers = {
-        "User-Agent": "SmartKhetiApp/1.0 (weather-service)"
-    }
-    
+    params = _geocode_params(cleaned_address)
+
+    if not nominatim_limiter.acquire(max_wait):
+        logger.warning(f"Nominatim rate limit reached; not geocoding {cleaned_address}")
+        if raise_on_error:
+            raise GeocodingRateLimited(cleaned_address)
+        return None, None
+
     try:
-        # Add a small delay to respect rate limits
-        time.sleep(0.1)
-        
-        response = requests.get(url, params=params, timeout=10, headers=headers)
+        response = upstream.get('nominatim', '/search', params=params, deadline=deadline)
         response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            # Pick the best result (highest importance score if available)
-            best_result = data[0]
-            for result in data:
-                if result.get('importance', 0) > best_result.get('importance', 0):
-                    best_result = result
-            
-            lat = float(best_result['lat'])
-            lon = float(best_result['lon'])
-            
-            logger.info(f"Successfully geocoded '{cleaned_address}' to {lat}, {lon}")
-            return lat, lon
-        else:
-            logger.warning(f"No results found for address: {cleaned_address}")
-            return None, None
-            
+        return _parse_geocode_results(response.json(), cleaned_address)
+
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error while geocoding {cleaned_address}: {e}")
+        if raise_on_error:
+            raise GeocodingUnavailable(cleaned_address) from e
         return None, None
     except (ValueError, KeyError) as e:
         logger.error(f"Data parsing error while geocoding {cleaned_address}: {e}")
@@ -95,116 +330,445 @@ def _try_geocode(address):
         return None, None
 
 
-def _clean_address(address):
-    """
-    Clean and standardize address format for better geocoding results.
-    """
-    # Standardize common terms
-    replacements = {
-        "sub-metropolitan": "Sub-Metropolitan City",
-        "sub metropolitan": "Sub-Metropolitan City", 
-        "metropolitan": "Metropolitan City",
-        "municipality": "Municipality",
-        "gaupalika": "Rural Municipality",
-        "gaunpalika": "Rural Municipality",
-        "sudurpaschim": "Sudurpashchim",
-        "gandaki": "Gandaki",
-        "bagmati": "Bagmati",
-        "madhesh": "Madhesh",
-        "lumbini": "Lumbini",
-        "karnali": "Karnali",
-        "province": "Province"
+def _geocode_params(address):
+    return {
+        'q': address,
+        'format': 'json',
+        'limit': 3,  # Get more results to pick the best one
+        'countrycodes': 'np',
+        'addressdetails': 1,
     }
-    
-    cleaned = address.strip()
-    for old, new in replacements.items():
-        cleaned = cleaned.replace(old.lower(), new)
-        cleaned = cleaned.replace(old.title(), new)
-        cleaned = cleaned.replace(old.upper(), new)
-    
-    return cleaned
 
 
-def reverse_geocode_improved(lat, lon):
+def _parse_geocode_results(data, address):
+    """(lat, lon) of the most important Nominatim search result, or (None, None)."""
+    if not data:
+        logger.warning(f"No results found for address: {address}")
+        return None, None
+
+    # Pick the best result (highest importance score if available)
+    best_result = data[0]
+    for result in data:
+        if result.get('importance', 0) > best_result.get('importance', 0):
+            best_result = result
+
+    lat = float(best_result['lat'])
+    lon = float(best_result['lon'])
+
+    logger.info(f"Successfully geocoded '{address}' to {lat}, {lon}")
+    return lat, lon
+
+
+def reverse_geocode_improved(lat, lon, deadline=None):
     """
     Improved reverse geocoding with better error handling and formatting.
+    Gazetteer centroids and points close to a municipality are named
+    offline; other points are snapped to a grid cell and looked up in the
+    reverse-geocode cache before Nominatim is asked (within `deadline`, if
+    given), with the nearest district as the answer if that fails.
     """
-    url = 'https://nominatim.openstreetmap.org/reverse'
-    params = {
-        'lat': lat,
-        'lon': lon,
-        'format': 'json',
-        'addressdetails': 1,
-        'accept-language': 'en',
-    }
-    
-    headers = {
-        "User-Agent": "SmartKhetiApp/1.0 (weather-service)"
-    }
-    
+    name, (cell_lat, cell_lon, cache_key) = _known_location_name(lat, lon)
+    if name is not MISSING:
+        return name
+    return _remember_location_name(lat, lon, cache_key, _nominatim_reverse(cell_lat, cell_lon, deadline))
+
+
+def _known_location_name(lat, lon):
+    """
+    (name, cell): the point's offline or cached place name, or MISSING if
+    Nominatim has to be asked about its (cell_lat, cell_lon, cache_key) cell.
+    """
+    cell = _reverse_geocode_cell(lat, lon)
+    name = _offline_location_name(lat, lon)
+    if name is not None:
+        return name, cell
+    return _reverse_geocode_cache.get(cell[2]), cell
+
+
+def _remember_location_name(lat, lon, cache_key, name):
+    """Cache a name Nominatim returned; if the lookup failed, name the nearest district instead."""
+    if name is None:
+        return approximate_location_name(lat, lon)
+    _reverse_geocode_cache.set(cache_key, name)
+    return name
+
+
+def _offline_location_name(lat, lon):
+    """
+    Label for coordinates the gazetteer can name, or None.
+    A point on a gazetteer centroid gets that place's label: a district
+    centroid (a fallback for an address the gazetteer did not match) the
+    district's, a municipality centroid the municipality's. A point within
+    a few km of a municipality centroid is most likely in it, but may be in
+    a neighbouring local body, so it is labelled "Near <municipality>".
+    Anything further out is left to the reverse-geocode cache and Nominatim.
+    """
+    gazetteer = get_gazetteer()
+    radius = settings.WEATHER_GAZETTEER_REVERSE_RADIUS_KM
+    for level in (LEVEL_DISTRICT, LEVEL_MUNICIPALITY):
+        place, _distance = gazetteer.nearest(lat, lon, level=level, max_km=radius)
+        if place is not None:
+            return place.label
+    place, _distance = gazetteer.nearest(
+        lat, lon, level=LEVEL_MUNICIPALITY, max_km=settings.WEATHER_GAZETTEER_APPROXIMATE_RADIUS_KM,
+    )
+    if place is not None:
+        return f"Near {place.label}"
+    return None
+
+
+def _reverse_geocode_cell(lat, lon):
+    cell_lat, cell_lon = snap_to_grid(lat, lon, settings.WEATHER_REVERSE_GEOCODE_GRID)
+    return cell_lat, cell_lon, f"{cell_lat:.6f},{cell_lon:.6f}"
+
+
+def _nominatim_reverse(lat, lon, deadline=None):
+    """
+    Ask Nominatim for a display name; None if the request failed or no
+    rate-limit token was available in time.
+    """
+    params = _reverse_geocode_params(lat, lon)
+
+    if not nominatim_limiter.acquire(_reverse_geocode_wait(deadline)):
+        logger.warning(f"Nominatim rate limit reached; not reverse geocoding {lat}, {lon}")
+        return None
+
     try:
-        time.sleep(0.1)  # Rate limiting
-        response = requests.get(url, params=params, timeout=10, headers=headers)
+        metrics.incr('weather.reverse_geocode.upstream_calls')
+        response = upstream.get('nominatim', '/reverse', params=params, deadline=deadline)
         response.raise_for_status()
-        data = response.json()
-        
-        if 'address' in data:
-            address = data['address']
-            # Build a nice address string from components
-            parts = []
-            
-            if address.get('village') or address.get('town') or address.get('city'):
-                parts.append(address.get('village') or address.get('town') or address.get('city'))
-            
-            if address.get('county') or address.get('state_district'):
-                parts.append(address.get('county') or address.get('state_district'))
-                
-            if address.get('state'):
-                parts.append(address.get('state'))
-                
-            if address.get('country'):
-                parts.append(address.get('country'))
-            
-            if parts:
-                return ', '.join(parts)
-        
-        # Fallback to display_name
-        return data.get('display_name', f'Location at {lat:.4f}, {lon:.4f}')
-        
+        return _format_reverse_geocode(response.json(), lat, lon)
+
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error in reverse geocoding: {e}")
-        return f'Location at {lat:.4f}, {lon:.4f}'
+        return None
     except Exception as e:
         logger.error(f"Error in reverse geocoding: {e}")
-        return f'Location at {lat:.4f}, {lon:.4f}'
+        return None
+
+
+def _reverse_geocode_wait(deadline):
+    """Rate-limit wait for a reverse lookup: the limiter's default, cut short by `deadline`."""
+    if deadline is None:
+        return None
+    return max(min(nominatim_limiter.default_wait(), deadline - time.monotonic()), 0)
+
+
+def _reverse_geocode_params(lat, lon):
+    return {
+        'lat': lat,
+        'lon': lon,
+        'format': 'json',
+        'addressdetails': 1,
+        'accept-language': 'en',
+    }
+
+
+def _format_reverse_geocode(data, lat, lon):
+    """Short "place, district, province, country" name from a Nominatim reverse result."""
+    if 'address' in data:
+        address = data['address']
+        # Build a nice address string from components
+        parts = []
+
+        if address.get('village') or address.get('town') or address.get('city'):
+            parts.append(address.get('village') or address.get('town') or address.get('city'))
+
+        if address.get('county') or address.get('state_district'):
+            parts.append(address.get('county') or address.get('state_district'))
+
+        if address.get('state'):
+            parts.append(address.get('state'))
+
+        if address.get('country'):
+            parts.append(address.get('country'))
+
+        if parts:
+            return ', '.join(parts)
+
+    # Fallback to display_name
+    return data.get('display_name', f'Location at {lat:.4f}, {lon:.4f}')
+
+
+def approximate_location_name(lat, lon):
+    """
+    Offline stand-in when Nominatim is unreachable: the nearest district from
+    the gazetteer, or the raw coordinates if none is close.
+    """
+    place, _distance = get_gazetteer().nearest(lat, lon, level=LEVEL_DISTRICT, max_km=60)
+    if place is not None:
+        return place.label
+    return f'Location at {lat:.4f}, {lon:.4f}'
 
 
 def fetch_forecast(lat, lon):
     """
     Fetch weather forecast from Open-Meteo based on given latitude and longitude.
+    Forecasts are shared per grid cell: fresh entries are served from cache,
+    stale ones are served while a background refresh runs, and concurrent
+    misses for a cell share a single upstream call. If the upstream is down,
+    the last known good forecast is served marked as stale.
+    """
+    cell_lat, cell_lon, cache_key = forecast_cell(lat, lon)
+
+    entry, data = _cached_forecast(cell_lat, cell_lon, cache_key)
+    if data is not None:
+        return data
+
+    data = _forecast_flight.do(cache_key, lambda: _refresh_forecast(cell_lat, cell_lon, cache_key))
+    return _forecast_or_fallback(entry, data)
+
+
+def fetch_forecasts(points):
+    """
+    Forecasts for many (lat, lon) points with at most one upstream request:
+    cached cells are served from cache (refreshing stale ones in the
+    background) and the rest are fetched together with Open-Meteo's
+    multi-coordinate query. Returns forecasts in input order.
+    """
+    cells = {}
+    for lat, lon in points:
+        cell_lat, cell_lon, cache_key = forecast_cell(lat, lon)
+        cells.setdefault(cache_key, (cell_lat, cell_lon))
+
+    forecasts = {}
+    missing = []
+    last_good = {}
+    for cache_key, (cell_lat, cell_lon) in cells.items():
+        entry = _forecast_cache.get(cache_key)
+        if entry is MISSING or time.time() >= _stale_until(entry):
+            missing.append(cache_key)
+            if entry is not MISSING:
+                last_good[cache_key] = entry
+            continue
+        if entry['fresh_until'] <= time.time():
+            metrics.incr('weather.forecast.stale_served')
+            _revalidate_forecast(cell_lat, cell_lon, cache_key)
+        forecasts[cache_key] = entry['data']
+
+    for start in range(0, len(missing), FORECAST_BATCH_SIZE):
+        batch = missing[start:start + FORECAST_BATCH_SIZE]
+        results = _fetch_forecasts_upstream([cells[key] for key in batch])
+        for cache_key, data in zip(batch, results):
+            if data is not None:
+                _store_forecast(cache_key, data)
+                forecasts[cache_key] = data
+            elif cache_key in last_good:
+                forecasts[cache_key] = _last_known_good(last_good[cache_key])
+
+    return [
+        forecasts.get(forecast_cell(lat, lon)[2], {"error": "Could not fetch forecast"})
+        for lat, lon in points
+    ]
+
+
+def cached_forecast_fresh_until(cache_key):
+    """When a cell's cached forecast goes stale, or None if it is not cached."""
+    entry = _forecast_cache.get(cache_key, record=False)
+    return None if entry is MISSING else entry['fresh_until']
+
+
+def refresh_forecasts(cells):
+    """
+    Fetch and cache forecasts for (cell_lat, cell_lon, cache_key) cells in a
+    single upstream request. Returns how many cells were refreshed.
+    """
+    results = _fetch_forecasts_upstream([(cell_lat, cell_lon) for cell_lat, cell_lon, _key in cells])
+    refreshed = 0
+    for (_lat, _lon, cache_key), data in zip(cells, results):
+        if data is not None:
+            _store_forecast(cache_key, data)
+            refreshed += 1
+    return refreshed
+
+
+def forecast_cell(lat, lon):
+    """Grid cell centre and cache key that a point's forecast is shared under."""
+    cell_lat, cell_lon = snap_to_grid(lat, lon, settings.WEATHER_FORECAST_GRID)
+    return cell_lat, cell_lon, f"{cell_lat:.4f},{cell_lon:.4f}"
+
+
+def forecast_fresh_until(now):
+    """
+    End of the current freshness window: the next Open-Meteo model update
+    boundary (every WEATHER_FORECAST_REFRESH_INTERVAL seconds, UTC) plus the
+    delay before the new run shows up in the API.
     """
-    url = (
-        f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={lat}&longitude={lon}&"
-        f"daily=rain_sum,wind_speed_10m_max,temperature_2m_max,temperature_2m_min,weather_code&"
-        f"timezone=auto&"
-        f"forecast_days=7"
+    interval = settings.WEATHER_FORECAST_REFRESH_INTERVAL
+    delay = settings.WEATHER_FORECAST_REFRESH_DELAY
+    return (now - delay) // interval * interval + interval + delay
+
+
+def _refresh_forecast(lat, lon, cache_key):
+    """
+    Fetch a cell's forecast upstream and cache it. If another worker is
+    already fetching this cell, wait briefly for its result instead.
+    """
+    locked = _forecast_cache.acquire_lock(cache_key, timeout=30)
+    if not locked:
+        for delay in _coalesce_waits():
+            time.sleep(delay)
+            data = _coalesced_forecast(cache_key)
+            if data is not None:
+                return data
+        # The other worker is taking too long; fetch it ourselves.
+
+    try:
+        data = _fetch_forecast_upstream(lat, lon)
+        if data is not None:
+            _store_forecast(cache_key, data)
+        return data
+    finally:
+        if locked:
+            _forecast_cache.release_lock(cache_key)
+
+
+def _coalesce_waits():
+    """Poll intervals while another worker fetches the same cell, up to WEATHER_FORECAST_COALESCE_WAIT."""
+    deadline = time.monotonic() + settings.WEATHER_FORECAST_COALESCE_WAIT
+    while time.monotonic() < deadline:
+        yield 0.05
+
+
+def _coalesced_forecast(cache_key):
+    """The cell's forecast if another worker has just stored a fresh one, else None."""
+    entry = _forecast_cache.get(cache_key, record=False)
+    if entry is not MISSING and entry['fresh_until'] > time.time():
+        metrics.incr('weather.forecast.coalesced')
+        return entry['data']
+    return None
+
+
+def _forecast_or_fallback(entry, data):
+    """A freshly fetched forecast, else the last known good one, else an error."""
+    if data is not None:
+        return data
+    if entry is not MISSING:
+        return _last_known_good(entry)
+    return {"error": "Could not fetch forecast"}
+
+
+def _store_forecast(cache_key, data):
+    now = time.time()
+    fresh_until = forecast_fresh_until(now)
+    # Kept past the stale window so it can stand in during upstream outages.
+    _forecast_cache.set(
+        cache_key,
+        {'data': data, 'fetched_at': now, 'fresh_until': fresh_until},
+        ttl=(int(fresh_until - now) + settings.WEATHER_FORECAST_STALE_TTL
+             + settings.WEATHER_FORECAST_LAST_GOOD_TTL),
     )
-    
+
+
+def _cached_forecast(cell_lat, cell_lon, cache_key):
+    """
+    (entry, data) for a cell. data is None unless the entry is fresh or still
+    within the stale window, in which case a background refresh is started.
+    """
+    entry = _forecast_cache.get(cache_key)
+    if entry is MISSING or time.time() >= _stale_until(entry):
+        return entry, None
+    if entry['fresh_until'] <= time.time():
+        metrics.incr('weather.forecast.stale_served')
+        _revalidate_forecast(cell_lat, cell_lon, cache_key)
+    return entry, entry['data']
+
+
+def _stale_until(entry):
+    """Until when a cached forecast may be served while refreshing in the background."""
+    return entry['fresh_until'] + settings.WEATHER_FORECAST_STALE_TTL
+
+
+def _last_known_good(entry):
+    """An expired forecast served because the upstream could not be reached."""
+    metrics.incr('weather.forecast.last_good_served')
+    return {**entry['data'], 'stale': True, 'fetched_at': entry['fetched_at']}
+
+
+def _revalidate_forecast(lat, lon, cache_key):
+    """Refresh a stale cell in the background unless a refresh is already running."""
+    if _forecast_flight.in_flight(cache_key):
+        return
+    threading.Thread(
+        target=_forecast_flight.do,
+        args=(cache_key, lambda: _refresh_forecast(lat, lon, cache_key)),
+        daemon=True,
+    ).start()
+
+
+def _forecast_params(lat, lon):
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'daily': FORECAST_DAILY_VARIABLES,
+        'timezone': 'auto',
+        'forecast_days': 7,
+    }
+
+
+def _fetch_forecast_upstream(lat, lon):
+    """
+    Single Open-Meteo request; returns the parsed JSON or None on failure.
+    """
+    params = _forecast_params(lat, lon)
+
     try:
-        response = requests.get(url, timeout=10)
+        metrics.incr('weather.forecast.upstream_calls')
+        response = upstream.get('open_meteo', '/v1/forecast', params=params)
         response.raise_for_status()
-        
+
         if response.status_code == 200:
             data = response.json()
             logger.info(f"Successfully fetched forecast for lat={lat}, lon={lon}")
             return data
         else:
             logger.warning(f"Weather API returned {response.status_code} for lat={lat}, lon={lon}")
-            
+
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error fetching forecast for lat={lat}, lon={lon}: {e}")
     except Exception as e:
         logger.error(f"Unexpected error fetching forecast for lat={lat}, lon={lon}: {e}")
 
-    return {"error": "Could not fetch forecast"}
\ No newline at end of file
+    metrics.incr('weather.forecast.upstream_errors')
+    return None
+
+
+def _fetch_forecasts_upstream(cells):
+    """
+    One Open-Meteo request for several (lat, lon) cells. Returns a list of
+    forecasts aligned with `cells`, with None for every cell on failure.
+    """
+    if len(cells) == 1:
+        return [_fetch_forecast_upstream(*cells[0])]
+
+    params = _forecast_params(
+        ",".join(str(lat) for lat, _lon in cells),
+        ",".join(str(lon) for _lat, lon in cells),
+    )
+
+    try:
+        metrics.incr('weather.forecast.upstream_calls')
+        metrics.incr('weather.forecast.batched_cells', len(cells))
+        response = upstream.get('open_meteo', '/v1/forecast', params=params)
+        response.raise_for_status()
+        data = response.json()
+        # Multi-coordinate queries return a list in request order.
+        if isinstance(data, list) and len(data) == len(cells):
+            logger.info(f"Successfully fetched forecasts for {len(cells)} locations")
+            return data
+        logger.warning(f"Unexpected batch forecast response for {len(cells)} locations")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request error fetching forecasts for {len(cells)} locations: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error fetching forecasts for {len(cells)} locations: {e}")
+
+    metrics.incr('weather.forecast.upstream_errors')
+    return [None] * len(cells)
+
+
+def reverse_geocode_many(points):
+    """
+    Place names for several points, in order. Most are answered offline or
+    from the reverse-geocode cache, so they are simply looked up in turn.
+    """
+    return [reverse_geocode_improved(lat, lon) for lat, lon in points]
@@ -0,0 +1,49 @@
+"""
+Keep stored coordinates in step with address fields: clear them when the
+address changes and queue a background resolve once the change commits.
+"""
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+
+from .models import SavedLocation
+from .tasks import ADDRESS_FIELDS, has_address, schedule_coordinate_resolution
+
+User = get_user_model()
+
+
+def _changes_address(sender, instance, update_fields):
+    fields = [field for field in ADDRESS_FIELDS if update_fields is None or field in update_fields]
+    if not fields:
+        return False
+    if instance._state.adding:
+        return True
+    # Compare with the stored row only when an address may be written, so
+    # loading instances costs nothing and other saves skip the query.
+    stored = sender._default_manager.filter(pk=instance.pk).values_list(*fields).first()
+    return stored is None or stored != tuple(getattr(instance, field) for field in fields)
+
+
+def clear_stale_coordinates(sender, instance, update_fields=None, **kwargs):
+    if not _changes_address(sender, instance, update_fields):
+        return
+
+    instance.latitude = None
+    instance.longitude = None
+    instance.resolved_location = None
+    instance._address_changed = True
+
+
+def queue_coordinate_resolution(sender, instance, **kwargs):
+    if not getattr(instance, '_address_changed', False):
+        return
+    instance._address_changed = False
+    if has_address(instance):
+        transaction.on_commit(partial(schedule_coordinate_resolution, sender, instance.pk))
+
+
+for model in (User, SavedLocation):
+    pre_save.connect(clear_stale_coordinates, sender=model, dispatch_uid=f'clear_coordinates_{model.__name__}')
+    post_save.connect(queue_coordinate_resolution, sender=model, dispatch_uid=f'resolve_coordinates_{model.__name__}')
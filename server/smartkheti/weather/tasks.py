@@ -0,0 +1,76 @@
+"""
+Background resolution of stored coordinates for users and saved locations.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .services import STRATEGY_FALLBACK, nominatim_limiter, resolve_address, reverse_geocode_improved
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_FIELDS = ('province', 'district', 'municipality', 'ward_number')
+# Background jobs can queue for a Nominatim token instead of falling back.
+BACKGROUND_MAX_WAIT = 30
+
+# A single worker keeps background geocoding within Nominatim's usage policy.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='coordinate-resolver')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def has_address(instance):
+    return all(getattr(instance, field, None) for field in ('province', 'district', 'municipality'))
+
+
+def schedule_coordinate_resolution(model, pk):
+    """Queue a background resolve for one row, ignoring duplicates already queued."""
+    key = (model._meta.label, pk)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    _executor.submit(_run, model, pk, key)
+
+
+def _run(model, pk, key):
+    close_old_connections()
+    try:
+        with nominatim_limiter.patience(BACKGROUND_MAX_WAIT):
+            resolve_coordinates(model, pk)
+    except Exception as e:
+        logger.error(f"Could not resolve coordinates for {key}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def resolve_coordinates(model, pk):
+    """
+    Geocode a row's address and store latitude, longitude and place name.
+    The update is conditional on the address being unchanged, so a newer
+    edit is never overwritten with coordinates for the old address.
+    Fallback coordinates are not stored: the row keeps no coordinates so a
+    later request or backfill retries it.
+    Returns True if the row was updated.
+    """
+    instance = model.objects.filter(pk=pk).only('pk', *ADDRESS_FIELDS).first()
+    if instance is None or not has_address(instance):
+        return False
+
+    address = {field: getattr(instance, field) for field in ADDRESS_FIELDS}
+    lat, lon, strategy = resolve_address(
+        address['province'], address['district'], address['municipality'], address['ward_number']
+    )
+    if strategy == STRATEGY_FALLBACK:
+        logger.info(f"Address of {model._meta.label} {pk} not resolved; leaving coordinates unset")
+        return False
+    place_name = reverse_geocode_improved(lat, lon)
+
+    updated = model.objects.filter(pk=pk, **address).update(
+        latitude=lat, longitude=lon, resolved_location=place_name[:255],
+    )
+    return bool(updated)
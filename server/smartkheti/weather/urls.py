@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from .views import ForecastView,LocationTestView,WeatherFromSavedLocationView,SavedLocationListCreateView
+from . import async_views, views
+
+# Upstream-bound views run as native async views in ASGI mode.
+upstream_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('forecast/', ForecastView.as_view(), name='weather-forecast'),
-    path('test-location/', LocationTestView.as_view(), name='test-location'),   ##test test only...
-    path('saved-locations/', SavedLocationListCreateView.as_view(), name='saved-locations'),
-    path('weather/saved/', WeatherFromSavedLocationView.as_view(), name='weather-from-saved'),
+    path('forecast/', upstream_views.ForecastView.as_view(), name='weather-forecast'),
+    path('test-location/', upstream_views.LocationTestView.as_view(), name='test-location'),   ##test test only...
+    path('saved-locations/', views.SavedLocationListCreateView.as_view(), name='saved-locations'),
+    path('weather/saved/', upstream_views.WeatherFromSavedLocationView.as_view(), name='weather-from-saved'),
+    path('weather/saved/all/', views.SavedLocationsForecastView.as_view(), name='weather-from-saved-all'),
 ]
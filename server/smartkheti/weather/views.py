@@ -2,106 +2,236 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from .services import fetch_forecast, get_coordinates_from_address, reverse_geocode_improved
+from django.conf import settings
+from .services import (
+    approximate_location_name, fetch_forecast, fetch_forecasts, get_coordinates_from_address,
+    resolve_addresses, reverse_geocode_improved, reverse_geocode_many,
+)
+from .concurrency import run_concurrently
 import logging
+import time
 from .models import SavedLocation
+from .tasks import has_address, schedule_coordinate_resolution
 from .serializers import SavedLocationSerializer
 
 logger = logging.getLogger(__name__)
 
 
+def stored_coordinates(instance):
+    """
+    (lat, lon, place name) stored on a User or SavedLocation, or None if they
+    have not been resolved yet, in which case a background resolve is queued.
+    """
+    if instance.latitude is not None and instance.longitude is not None:
+        return instance.latitude, instance.longitude, instance.resolved_location
+    if has_address(instance):
+        schedule_coordinate_resolution(type(instance), instance.pk)
+    return None
+
+
+def in_nepal(lat, lon):
+    """Whether coordinates are reasonable for Nepal."""
+    return 26.0 <= lat <= 31.0 and 80.0 <= lon <= 89.0
+
+
+def missing_address_response(user):
+    """400 response listing the user's missing address fields, or None."""
+    required_fields = ['province', 'district', 'municipality']
+    missing_fields = [field for field in required_fields if not getattr(user, field, None)]
+    if not missing_fields:
+        return None
+    return Response({
+        "error": f"Missing address information: {', '.join(missing_fields)}",
+        "required_fields": required_fields,
+        "current_values": {
+            "province": getattr(user, 'province', None),
+            "district": getattr(user, 'district', None),
+            "municipality": getattr(user, 'municipality', None),
+            "ward_number": getattr(user, 'ward_number', None),
+        }
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def parse_coordinates(lat, lon):
+    """
+    (lat, lon, error) for map-based lat/lon query parameters: floats, or a
+    400 response if they are malformed or outside Nepal.
+    """
+    try:
+        lat, lon = float(lat), float(lon)
+    except ValueError:
+        return None, None, Response({
+            "error": "Invalid latitude or longitude format"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not in_nepal(lat, lon):
+        return None, None, Response({
+            "error": "Coordinates outside Nepal bounds"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return lat, lon, None
+
+
+def forecast_response(location, lat, lon, forecast, partial, **fields):
+    """Single-point forecast response; `fields` (e.g. source) go before "partial"."""
+    return Response({
+        "location": location,
+        "latitude": lat,
+        "longitude": lon,
+        "forecast": forecast,
+        **fields,
+        "partial": partial,
+    })
+
+
+def forecast_failed_response(view, e):
+    logger.error(f"Unexpected error in {view}: {e}")
+    return Response({
+        "error": "Internal server error occurred while fetching forecast"
+    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def missing_fields_response(user):
+    """LocationTestView's answer for a user without a full address, or None."""
+    if all([user.province, user.district, user.municipality]):
+        return None
+    return Response({
+        "error": "Missing required address fields",
+        "user_data": {
+            "province": getattr(user, 'province', None),
+            "district": getattr(user, 'district', None),
+            "municipality": getattr(user, 'municipality', None),
+            "ward_number": getattr(user, 'ward_number', None),
+        }
+    })
+
+
+def location_test_response(user, with_ward, without_ward):
+    """
+    LocationTestView's report; each lookup is (lat, lon, reverse geocoded
+    name), with_ward None if the user has no ward number.
+    """
+    test_results = {}
+    if with_ward:
+        lat, lon, name = with_ward
+        test_results["with_ward"] = {
+            "address": f"Ward {user.ward_number}, {user.municipality}, {user.district}, {user.province} Province, Nepal",
+            "coordinates": [lat, lon],
+            "reverse_geocoded": name,
+        }
+    lat, lon, name = without_ward
+    test_results["without_ward"] = {
+        "address": f"{user.municipality}, {user.district}, {user.province} Province, Nepal",
+        "coordinates": [lat, lon],
+        "reverse_geocoded": name,
+    }
+    return Response({
+        "user_profile": {
+            "province": user.province,
+            "district": user.district,
+            "municipality": user.municipality,
+            "ward_number": getattr(user, 'ward_number', None),
+        },
+        "geocoding_tests": test_results
+    })
+
+
+def user_address(user):
+    """The user's address as a display string, for reference in responses."""
+    user_address_parts = []
+    if hasattr(user, 'ward_number') and user.ward_number:
+        user_address_parts.append(f"Ward {user.ward_number}")
+    user_address_parts.extend([user.municipality, user.district, user.province])
+    return ", ".join(user_address_parts)
+
+
+def geocoding_deadline(deadline):
+    """
+    Deadline for resolving an address on the request path: half of the time
+    left, so that the forecast still has the rest.
+    """
+    now = time.monotonic()
+    return now + max(deadline - now, 0) / 2
+
+
+def forecast_with_location(lat, lon, deadline, location=None):
+    """
+    Fetch the forecast and reverse-geocode the point concurrently, keeping
+    whatever finished before the deadline (time.monotonic() based). A known
+    location name skips the reverse lookup.
+    Returns (forecast, location, partial).
+    """
+    calls = {'forecast': (fetch_forecast, (lat, lon))}
+    if not location:
+        calls['location'] = (reverse_geocode_improved, (lat, lon))
+    results, errors = run_concurrently(calls, timeout=deadline - time.monotonic())
+    return merge_forecast_results(lat, lon, location, results, errors)
+
+
+def merge_forecast_results(lat, lon, location, results, errors):
+    """
+    (forecast, location, partial) from the concurrent forecast and reverse
+    geocode calls, with fallbacks for whatever failed or ran out of time.
+    """
+    forecast = results.get('forecast') or {"error": "Could not fetch forecast"}
+    if 'error' in forecast:
+        errors.setdefault('forecast', 'error')
+    location = location or results.get('location') or approximate_location_name(lat, lon)
+
+    if errors:
+        logger.warning(f"Partial weather response for {lat}, {lon}: {errors}")
+    return forecast, location, bool(errors)
+
+
 class ForecastView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
         try:
             lat = request.query_params.get('lat')
             lon = request.query_params.get('lon')
 
             # If lat/lon are passed (map-based search)
             if lat and lon:
-                try:
-                    lat_float = float(lat)
-                    lon_float = float(lon)
-                    
-                    # Validate coordinates are reasonable for Nepal
-                    if not (26.0 <= lat_float <= 31.0 and 80.0 <= lon_float <= 89.0):
-                        return Response({
-                            "error": "Coordinates outside Nepal bounds"
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    forecast = fetch_forecast(lat_float, lon_float)
-                    location = reverse_geocode_improved(lat_float, lon_float)
-                    
-                    logger.info(f"Map-based forecast requested for {lat_float}, {lon_float}")
-                    
-                    return Response({
-                        "location": location,
-                        "latitude": lat_float,
-                        "longitude": lon_float,
-                        "forecast": forecast,
-                        "source": "coordinates"
-                    })
-                    
-                except ValueError:
-                    return Response({
-                        "error": "Invalid latitude or longitude format"
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                lat, lon, error = parse_coordinates(lat, lon)
+                if error:
+                    return error
+
+                forecast, location, partial = forecast_with_location(lat, lon, deadline)
+                logger.info(f"Map-based forecast requested for {lat}, {lon}")
+                return forecast_response(location, lat, lon, forecast, partial, source="coordinates")
 
             # Use user profile location
             user = request.user
             
             # Check if user has required address fields
-            required_fields = ['province', 'district', 'municipality']
-            missing_fields = [field for field in required_fields if not getattr(user, field, None)]
-            
-            if missing_fields:
-                return Response({
-                    "error": f"Missing address information: {', '.join(missing_fields)}",
-                    "required_fields": required_fields,
-                    "current_values": {
-                        "province": getattr(user, 'province', None),
-                        "district": getattr(user, 'district', None),
-                        "municipality": getattr(user, 'municipality', None),
-                        "ward_number": getattr(user, 'ward_number', None),
-                    }
-                }, status=status.HTTP_400_BAD_REQUEST)
+            missing = missing_address_response(user)
+            if missing:
+                return missing
 
             # Get coordinates from user address
             logger.info(f"Fetching forecast for user {user.id} at {user.district}, {user.province}")
             
-            lat, lon = get_coordinates_from_address(
-                province=user.province,
-                district=user.district,
-                municipality=user.municipality,
-                ward_number=getattr(user, 'ward_number', None)
-            )
+            stored = stored_coordinates(user)
+            if stored:
+                lat, lon, location = stored
+            else:
+                lat, lon = get_coordinates_from_address(
+                    province=user.province,
+                    district=user.district,
+                    municipality=user.municipality,
+                    ward_number=getattr(user, 'ward_number', None),
+                    deadline=geocoding_deadline(deadline),
+                )
+                location = None
             
             # Fetch forecast and location info
-            forecast = fetch_forecast(lat, lon)
-            location = reverse_geocode_improved(lat, lon)
-            
-            # Build user address string for reference
-            user_address_parts = []
-            if hasattr(user, 'ward_number') and user.ward_number:
-                user_address_parts.append(f"Ward {user.ward_number}")
-            user_address_parts.extend([user.municipality, user.district, user.province])
-            user_address = ", ".join(user_address_parts)
-
-            return Response({
-                "location": location,
-                "user_address": user_address,
-                "latitude": lat,
-                "longitude": lon,
-                "forecast": forecast,
-                "source": "user_profile"
-            })
+            forecast, location, partial = forecast_with_location(lat, lon, deadline, location)
+            return forecast_response(
+                location, lat, lon, forecast, partial, user_address=user_address(user), source="user_profile",
+            )
             
         except Exception as e:
-            logger.error(f"Unexpected error in ForecastView: {e}")
-            return Response({
-                "error": "Internal server error occurred while fetching forecast"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return forecast_failed_response('ForecastView', e)
 
 
 class LocationTestView(APIView):
@@ -111,58 +241,21 @@ class LocationTestView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
         user = request.user
-        
-        if not all([user.province, user.district, user.municipality]):
-            return Response({
-                "error": "Missing required address fields",
-                "user_data": {
-                    "province": getattr(user, 'province', None),
-                    "district": getattr(user, 'district', None),
-                    "municipality": getattr(user, 'municipality', None),
-                    "ward_number": getattr(user, 'ward_number', None),
-                }
-            })
-        
-        # Test different address formats
-        test_results = {}
-        
-        # Test with ward
-        if hasattr(user, 'ward_number') and user.ward_number:
-            address_with_ward = f"Ward {user.ward_number}, {user.municipality}, {user.district}, {user.province} Province, Nepal"
-            lat1, lon1 = get_coordinates_from_address(user.province, user.district, user.municipality, user.ward_number)
-            test_results["with_ward"] = {
-                "address": address_with_ward,
-                "coordinates": [lat1, lon1],
-                "reverse_geocoded": reverse_geocode_improved(lat1, lon1)
-            }
-        
-        # Test without ward
-        address_without_ward = f"{user.municipality}, {user.district}, {user.province} Province, Nepal"
-        lat2, lon2 = get_coordinates_from_address(user.province, user.district, user.municipality, None)
-        test_results["without_ward"] = {
-            "address": address_without_ward,
-            "coordinates": [lat2, lon2],
-            "reverse_geocoded": reverse_geocode_improved(lat2, lon2)
-        }
-        
-        return Response({
-            "user_profile": {
-                "province": user.province,
-                "district": user.district,
-                "municipality": user.municipality,
-                "ward_number": getattr(user, 'ward_number', None),
-            },
-            "geocoding_tests": test_results
-        })
-    
-
-
-
-
-
+        missing = missing_fields_response(user)
+        if missing:
+            return missing
 
+        def lookup(ward_number):
+            lat, lon = get_coordinates_from_address(
+                user.province, user.district, user.municipality, ward_number, deadline=geocoding_deadline(deadline)
+            )
+            return lat, lon, reverse_geocode_improved(lat, lon, deadline)
 
+        # Test with and without the ward
+        with_ward = lookup(user.ward_number) if getattr(user, 'ward_number', None) else None
+        return location_test_response(user, with_ward, lookup(None))
 
 
 class SavedLocationListCreateView(APIView):
@@ -185,6 +278,7 @@ class WeatherFromSavedLocationView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
         location_id = request.query_params.get('location_id')
 
         try:
@@ -192,19 +286,69 @@ class WeatherFromSavedLocationView(APIView):
         except SavedLocation.DoesNotExist:
             return Response({"error": "Saved location not found."}, status=404)
 
-        lat, lon = get_coordinates_from_address(
-            location.province,
-            location.district,
-            location.municipality,
-            location.ward_number
-        )
+        stored = stored_coordinates(location)
+        if stored:
+            lat, lon, location_name = stored
+        else:
+            lat, lon = get_coordinates_from_address(
+                location.province,
+                location.district,
+                location.municipality,
+                location.ward_number,
+                deadline=geocoding_deadline(deadline),
+            )
+            location_name = None
+
+        forecast, location_name, partial = forecast_with_location(lat, lon, deadline, location_name)
+        return forecast_response(location_name, lat, lon, forecast, partial)
 
-        location_name = reverse_geocode_improved(lat, lon)
-        forecast = fetch_forecast(lat, lon)
+
+class SavedLocationsForecastView(APIView):
+    """
+    Forecasts for all of the user's saved locations in one response, using
+    bulk coordinate resolution and a single multi-location upstream request.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        deadline = time.monotonic() + settings.WEATHER_REQUEST_DEADLINE
+        locations = list(SavedLocation.objects.filter(user=request.user))
+        if not locations:
+            return Response({"locations": [], "partial": False})
+
+        stored = [stored_coordinates(location) for location in locations]
+        unresolved = [index for index, value in enumerate(stored) if value is None]
+        if unresolved:
+            resolved = resolve_addresses([
+                (locations[i].province, locations[i].district, locations[i].municipality, locations[i].ward_number)
+                for i in unresolved
+            ], deadline=geocoding_deadline(deadline))
+            for index, (lat, lon, _strategy) in zip(unresolved, resolved):
+                stored[index] = (lat, lon, None)
+        points = [(lat, lon) for lat, lon, _name in stored]
+        unnamed = [point for point, (_lat, _lon, name) in zip(points, stored) if not name]
+
+        calls = {'forecasts': (fetch_forecasts, (points,))}
+        if unnamed:
+            calls['locations'] = (reverse_geocode_many, (unnamed,))
+        results, errors = run_concurrently(calls, timeout=deadline - time.monotonic())
+
+        forecasts = results.get('forecasts') or [{"error": "Could not fetch forecast"}] * len(points)
+        looked_up = iter(results.get('locations') or [approximate_location_name(lat, lon) for lat, lon in unnamed])
+        names = [name or next(looked_up) for _lat, _lon, name in stored]
+        partial = bool(errors) or any('error' in forecast for forecast in forecasts)
 
         return Response({
-            "location": location_name,
-            "latitude": lat,
-            "longitude": lon,
-            "forecast": forecast
+            "locations": [
+                {
+                    "id": location.id,
+                    "name": location.name,
+                    "location": name,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "forecast": forecast,
+                }
+                for location, (lat, lon), name, forecast in zip(locations, points, names, forecasts)
+            ],
+            "partial": partial,
         })